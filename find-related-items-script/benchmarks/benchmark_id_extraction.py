@@ -0,0 +1,144 @@
+"""
+Benchmark of the extraction of possible item IDs from item data.
+
+Compares the extraction used by find_related_ids, walking the parsed JSON data with
+find_possible_ids_in_data, to the previous approach of running a regex over the Python
+representation of the data (str(item_data)). Both are timed on synthetic StoryMap drafts
+of growing size, and the peak memory allocated by each is measured with tracemalloc.
+
+Run from the find-related-items-script folder, with the ArcGIS API for Python installed:
+    $ python benchmarks/benchmark_id_extraction.py
+    $ python benchmarks/benchmark_id_extraction.py --nodes 1000 10000 100000 --repeat 5
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from find_related_AGO_items import find_related_ids  # noqa: E402
+
+# Text of the paragraphs and root of the image URLs of the synthetic drafts
+LOREM = "Lorem ipsum dolor sit amet, <strong>consectetur</strong> "
+ITEMS_URL = "https://www.arcgis.com/sharing/rest/content/items"
+
+
+def find_related_ids_from_repr(item_data: tuple) -> set:
+    """
+    The previous extraction: a regex over the Python representation of each part of the
+    item data.
+    """
+    related_ids = set()
+    for data in item_data:
+        related_ids.update(re.findall(r"[\"\'\/]([a-zA-Z0-9]{32})[\"\'\/]", str(data)))
+    return related_ids
+
+
+def make_storymap_draft(node_count: int, seed: int = 0) -> dict:
+    """
+    Builds a StoryMap draft with the given number of nodes. Nodes hold text, embedded
+    web maps and images, and the kind of IDs that are not items (GUIDs in configs,
+    hashes in expressions).
+
+    Args:
+        node_count (int): The number of nodes of the story.
+        seed (int, optional): Seed of the random generator. Defaults to 0.
+
+    Returns:
+        dict: The draft data.
+    """
+    rnd = random.Random(seed)
+    item_ids = ["%032x" % rnd.getrandbits(128) for _ in range(max(node_count // 20, 1))]
+    nodes = {}
+    resources = {}
+    for index in range(node_count):
+        item_id = rnd.choice(item_ids)
+        kind = index % 4
+        if kind == 0:
+            nodes[f"n-{index}"] = {
+                "type": "text",
+                "data": {
+                    "text": f"<p>{LOREM * 10}</p>",
+                    "type": "paragraph",
+                },
+            }
+        elif kind == 1:
+            nodes[f"n-{index}"] = {
+                "type": "webmap",
+                "data": {
+                    "map": f"r-{index}",
+                    "caption": "A map",
+                    "extent": [1.5, 2.5, 3.5, 4.5],
+                },
+            }
+            resources[f"r-{index}"] = {
+                "type": "webmap",
+                "data": {"itemId": item_id, "itemType": "Web Map", "type": "default"},
+            }
+        elif kind == 2:
+            nodes[f"n-{index}"] = {
+                "type": "image",
+                "data": {
+                    "src": f"{ITEMS_URL}/{item_id}/resources/{index}.jpg",
+                    "alt": "An image",
+                },
+            }
+        else:
+            nodes[f"n-{index}"] = {
+                "type": "embed",
+                "config": {
+                    "guid": "%032X" % rnd.getrandbits(128),
+                    "expression": "hash('%032x')" % rnd.getrandbits(128),
+                },
+            }
+    return {"root": "n-0", "nodes": nodes, "resources": resources}
+
+
+def measure(function, item_data: tuple, repeat: int):
+    """
+    Returns the best time over the given number of runs of the function, and its peak
+    memory allocation.
+    """
+    best_time = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(item_data)
+        best_time = min(best_time, time.perf_counter() - start)
+    tracemalloc.start()
+    function(item_data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, best_time, peak
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--nodes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(
+        f"{'nodes':>8} {'size (MB)':>10} {'repr (s)':>9} {'walk (s)':>9} "
+        f"{'repr peak (MB)':>15} {'walk peak (MB)':>15} {'repr IDs':>9} {'walk IDs':>9}"
+    )
+    for node_count in args.nodes:
+        draft = make_storymap_draft(node_count)
+        # Published data and draft data, as returned by get_item_data for a StoryMap
+        item_data = (draft, make_storymap_draft(node_count, seed=1))
+        size = sum(len(str(data)) for data in item_data) / 1e6
+        repr_ids, repr_time, repr_peak = measure(
+            find_related_ids_from_repr, item_data, args.repeat
+        )
+        walk_ids, walk_time, walk_peak = measure(
+            find_related_ids, item_data, args.repeat
+        )
+        print(
+            f"{node_count:>8} {size:>10.1f} {repr_time:>9.3f} {walk_time:>9.3f} "
+            f"{repr_peak / 1e6:>15.1f} {walk_peak / 1e6:>15.1f} "
+            f"{len(repr_ids):>9} {len(walk_ids):>9}"
+        )
@@ -0,0 +1,285 @@
+"""
+Benchmark of the phases of find_related_AGO_items against a synthetic organization.
+
+Each organization size is generated by SyntheticOrg (see synthetic_portal.py) and run
+through the phases of the script, without network access: the search of the org items,
+the crawl with the chosen backend, the recording of relationships with
+get_related_items_for_id, the expansion of paused items with
+write_expanded_related_items, the dependency index and the graph build. The time of each
+phase is taken from the script's RunStats, along with the number of requests the
+synthetic portal answered. Requests can be given a latency to compare backends and
+worker counts, and the portal a max rate past which it throttles requests, to tune the
+request scheduler. The crawl can be scoped like with the SCOPE_ settings of the script,
+to measure the work saved by pruning.
+
+Run from the find-related-items-script folder, with the ArcGIS API for Python installed
+(the asyncio backend also requires aiohttp):
+    $ python benchmarks/benchmark_pipeline.py
+    $ python benchmarks/benchmark_pipeline.py --items 1000 10000 100000 --latency 0.05
+    $ python benchmarks/benchmark_pipeline.py --items 10000 --backend asyncio
+    $ python benchmarks/benchmark_pipeline.py --items 10000 --output results.json
+    $ python benchmarks/benchmark_pipeline.py --items 10000 --max-depth 2 --no-external
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Union
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import find_related_AGO_items as far  # noqa: E402
+from synthetic_portal import (  # noqa: E402
+    ORG_ID,
+    SyntheticOrg,
+    serve,
+    use_synthetic_portal,
+)
+
+# Phases reported, in the order they run
+PHASES = ["generate", "enumerate", "crawl", "relationships", "expand", "index", "graph"]
+
+
+def run_pipeline(
+    org: SyntheticOrg,
+    folder: str,
+    backend: str = "threads",
+    max_workers: int = far.MAX_WORKERS,
+    create_graph: bool = True,
+    postprocess_workers: Union[int, None] = far.POSTPROCESS_WORKERS,
+    rate_limit: Union[float, None] = far.REQUEST_RATE_LIMIT,
+    scope: Union[far.TraversalScope, None] = None,
+) -> dict:
+    """
+    Runs the phases of the script against a synthetic organization, writing the reports
+    to a folder.
+
+    Args:
+        org (SyntheticOrg): The organization to run against.
+        folder (str): The folder of the reports and graph.
+        backend (str, optional): "threads" or "asyncio". Defaults to "threads".
+        max_workers (int, optional): Number of concurrent requests. Defaults to
+            MAX_WORKERS.
+        create_graph (bool, optional): Whether to build the graph. Defaults to True.
+        postprocess_workers (Union[int, None], optional): Number of processes expanding
+            paused items. Defaults to POSTPROCESS_WORKERS.
+        rate_limit (Union[float, None], optional): Max requests per second sent.
+            Defaults to REQUEST_RATE_LIMIT.
+        scope (Union[far.TraversalScope, None], optional): The traversal scope of the
+            crawl. Defaults to None.
+
+    Returns:
+        dict: The RunStats of the run, with the rows recorded and the requests answered
+            by the portal.
+    """
+    gis_con = use_synthetic_portal(far, org)
+    far.run_stats = far.RunStats(None)
+    far.request_scheduler = far.RequestScheduler(
+        rate=rate_limit, max_concurrency=max_workers
+    )
+    output_file = os.path.join(folder, f"related_items.{far.OUTPUT_FORMAT}")
+    item_cache = far.ItemCache(gis_con, far.ITEM_CACHE_SIZE)
+
+    far.run_stats.start_phase("enumerate")
+    all_storymap_items = far.get_all_content_items_in_org(
+        gis_con, max_workers=max_workers, item_cache=item_cache
+    )
+    items_to_process = sorted(all_storymap_items)
+
+    far.run_stats.start_phase("crawl")
+    if backend == "asyncio":
+        with serve(org) as rest_url:
+            item_graph = far.crawl_item_graph_async(
+                rest_url,
+                None,
+                items_to_process,
+                item_cache,
+                max_workers=max_workers,
+                scope=scope,
+            )
+    else:
+        item_graph = far.crawl_item_graph(
+            gis_con, items_to_process, item_cache, max_workers=max_workers, scope=scope
+        )
+
+    far.run_stats.start_phase("relationships")
+    relations_in_process = set()
+    row_index = set()
+    missed_items_rows = far.RowWriter(
+        os.path.join(folder, f"missed_items.{far.OUTPUT_FORMAT}"),
+        far.MISSED_ITEMS_COLUMNS,
+        unique_column="itemId",
+    )
+    related_items_rows = far.RowWriter(output_file, far.RELATED_ITEMS_COLUMNS)
+    for item_id in items_to_process:
+        try:
+            far.get_related_items_for_id(
+                gis_con,
+                item_id,
+                item_graph,
+                related_items_rows,
+                missed_items_rows,
+                all_storymap_items,
+                relations_in_process=relations_in_process,
+                item_cache=item_cache,
+                row_index=row_index,
+                scope=scope,
+            )
+        except Exception as e:
+            missed_items_rows.append([item_id, None, None, str(e)])
+    related_items_rows.close()
+    missed_items_rows.close()
+    far.run_stats.count("related rows", related_items_rows.rows_written)
+    far.run_stats.count("missed rows", missed_items_rows.rows_written)
+
+    far.run_stats.start_phase("expand")
+    expanded_items_rows = far.RowWriter(f"{output_file}.tmp", far.RELATED_ITEMS_COLUMNS)
+    far.write_expanded_related_items(
+        far.read_rows(output_file, path_table=expanded_items_rows.path_table),
+        expanded_items_rows,
+        postprocess_workers,
+    )
+    expanded_items_rows.close()
+    os.replace(expanded_items_rows.path, output_file)
+    far.run_stats.count("expanded rows", expanded_items_rows.rows_written)
+
+    far.run_stats.start_phase("index")
+    related_items = far.read_rows(output_file)
+    far.DependencyIndex.build(
+        os.path.join(folder, "dependency_index.sqlite"), related_items
+    ).close()
+
+    if create_graph:
+        far.run_stats.start_phase("graph")
+        far.export_graph(
+            related_items,
+            os.path.join(folder, f"graph.{far.GRAPH_FORMAT}"),
+        )
+    far.run_stats.start_phase(None)
+    return far.run_stats.summary(
+        portal_requests=dict(org.requests),
+        request_scheduler=far.request_scheduler.report(),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--items", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--backend", choices=["threads", "asyncio"], default="threads")
+    parser.add_argument("--workers", type=int, default=far.MAX_WORKERS)
+    parser.add_argument(
+        "--postprocess-workers",
+        type=int,
+        default=far.POSTPROCESS_WORKERS,
+        help="processes expanding paused items",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds per request"
+    )
+    parser.add_argument(
+        "--portal-max-rate",
+        type=float,
+        help="requests per second past which the synthetic portal throttles requests",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=far.REQUEST_RATE_LIMIT,
+        help="max requests per second sent (REQUEST_RATE_LIMIT)",
+    )
+    parser.add_argument(
+        "--fan-out", type=int, default=4, help="items embedded per story"
+    )
+    parser.add_argument(
+        "--external-items",
+        type=int,
+        default=0,
+        help="web maps and layers of another organization embedded by the stories",
+    )
+    parser.add_argument(
+        "--max-depth",
+        type=int,
+        help="relationships followed from the org items (SCOPE_MAX_DEPTH)",
+    )
+    parser.add_argument(
+        "--exclude-categories",
+        nargs="+",
+        default=[],
+        help="categories neither recorded nor followed (SCOPE_EXCLUDED_CATEGORIES)",
+    )
+    parser.add_argument(
+        "--no-external",
+        action="store_true",
+        help="record the items of other organizations without following them "
+        "(SCOPE_EXPAND_EXTERNAL_ITEMS)",
+    )
+    parser.add_argument(
+        "--graph-max-items",
+        type=int,
+        default=10000,
+        help="largest organization to build the graph for",
+    )
+    parser.add_argument("--output", help="JSON file to write the results to")
+    args = parser.parse_args()
+
+    print(
+        f"{'items':>8} "
+        + " ".join(f"{phase + ' (s)':>14}" for phase in PHASES)
+        + f" {'requests':>9} {'throttled':>9} {'rows':>9}"
+    )
+    results = []
+    for item_count in args.items:
+        with tempfile.TemporaryDirectory() as folder:
+            generate_start = time.perf_counter()
+            org = SyntheticOrg(
+                item_count,
+                fan_out=args.fan_out,
+                external_count=args.external_items,
+                latency=args.latency,
+                max_rate=args.portal_max_rate,
+            )
+            generate_time = time.perf_counter() - generate_start
+            # The script prints its progress, only the results table is printed here
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                summary = run_pipeline(
+                    org,
+                    folder,
+                    args.backend,
+                    args.workers,
+                    create_graph=item_count <= args.graph_max_items,
+                    postprocess_workers=args.postprocess_workers,
+                    rate_limit=args.rate_limit,
+                    scope=far.TraversalScope(
+                        org_id=ORG_ID,
+                        max_depth=args.max_depth,
+                        excluded_categories=args.exclude_categories,
+                        expand_external=not args.no_external,
+                    ),
+                )
+        phases = dict(summary["phases"], generate=round(generate_time, 3))
+        results.append(
+            {
+                "items": len(org.items),
+                "backend": args.backend,
+                "workers": args.workers,
+                "latency": args.latency,
+                **summary,
+                "phases": phases,
+            }
+        )
+        print(
+            f"{len(org.items):>8} "
+            + " ".join(
+                f"{phases[phase]:>14.3f}" if phase in phases else f"{'-':>14}"
+                for phase in PHASES
+            )
+            + f" {summary['requests']:>9} {org.requests.get('throttled', 0):>9}"
+            + f" {summary['counters'].get('expanded rows', 0):>9}"
+        )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
@@ -0,0 +1,533 @@
+"""
+Synthetic ArcGIS portal for running find_related_AGO_items offline.
+
+SyntheticOrg generates an organization of a given size: StoryMaps embedding web maps,
+layers, dashboards and other stories, web maps shared by many stories, layers of another
+organization, dashboards and web maps referencing each other (cycles), IDs that are not
+items (hashes and GUIDs in configurations), StoryMap drafts and, optionally, web maps of
+another organization (such as Living Atlas maps) referencing more of its content. The
+organization can be served two ways:
+    - GIS and Item: stand-ins for the classes of arcgis.gis used by the script, for the
+      "threads" backend. Install them with use_synthetic_portal.
+    - serve: a stub of the sharing REST API on a local port, for the "asyncio" backend
+      (requires aiohttp).
+
+Example:
+    >>> import find_related_AGO_items as far
+    >>> from synthetic_portal import SyntheticOrg, use_synthetic_portal
+    >>> org = SyntheticOrg(item_count=1000)
+    >>> gis_con = use_synthetic_portal(far, org)
+    >>> far.get_all_content_items_in_org(gis_con)
+"""
+
+import asyncio
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Union
+
+# Owner of the org items that the script is pointed at, and IDs of the synthetic
+# organizations
+ORG_OWNER = "synthetic_user"
+ORG_ID = "syntheticorg"
+EXTERNAL_OWNER = "external_user"
+EXTERNAL_ORG_ID = "externalorg"
+# Root of the feature service URLs of the org layers
+SERVICES_URL = f"https://services.arcgis.com/{ORG_ID}/arcgis/rest/services"
+# Created timestamp of the first item, in milliseconds (00:00:00, January 1st, 2020)
+FIRST_CREATED = 1577836800000
+# Error the sharing REST API answers for items that do not exist or are inaccessible
+MISSING_ITEM_ERROR = {"code": 400, "message": "Item does not exist or is inaccessible."}
+
+
+class SyntheticOrg:
+    """
+    A synthetic organization, made of item JSON, item data and StoryMap resources.
+
+    Of the items, about 40% are StoryMaps, 20% web maps, 30% feature services (a tenth
+    of them owned by another organization), 5% dashboards and 5% web mapping
+    applications. Only the items of the organization are returned by searches on
+    ORG_OWNER.
+
+    Attributes:
+        items (Dict[str, dict]): Item JSON keyed by item ID.
+        data (Dict[str, dict]): Item data keyed by item ID.
+        resources (Dict[str, Dict[str, dict]]): StoryMap resources keyed by item ID and
+            resource name.
+        latency (float): Seconds every request waits before being answered.
+        max_rate (Union[float, None]): Requests per second past which requests are
+            throttled.
+        requests (Dict[str, int]): Number of requests answered by endpoint, and of
+            requests "throttled".
+    """
+
+    def __init__(
+        self,
+        item_count: int = 1000,
+        fan_out: int = 4,
+        bogus_ratio: float = 0.33,
+        draft_ratio: float = 0.33,
+        cycle_ratio: float = 0.05,
+        external_count: int = 0,
+        latency: float = 0.0,
+        max_rate: Union[float, None] = None,
+        seed: int = 0,
+    ):
+        """
+        Args:
+            item_count (int, optional): Approximate number of items. Defaults to 1000.
+            fan_out (int, optional): Number of items each StoryMap embeds. Defaults to
+                4.
+            bogus_ratio (float, optional): Share of the IDs found in item data that are
+                not items. Defaults to 0.33.
+            draft_ratio (float, optional): Share of the StoryMaps with a draft. Defaults
+                to 0.33.
+            cycle_ratio (float, optional): Share of the web maps referencing a dashboard
+                that references them back. Defaults to 0.05.
+            external_count (int, optional): Number of web maps and layers of another
+                organization, half of the StoryMaps embedding one of the web maps. Each
+                web map references three layers and another web map. Defaults to 0.
+            latency (float, optional): Seconds every request waits before being
+                answered. Defaults to 0.
+            max_rate (Union[float, None], optional): Requests per second past which
+                requests are throttled, with HTTP 429 and a Retry-After of one second.
+                Defaults to None, never throttling.
+            seed (int, optional): Seed of the random generator. Defaults to 0.
+        """
+        self.items: Dict[str, dict] = {}
+        self.data: Dict[str, dict] = {}
+        self.resources: Dict[str, Dict[str, dict]] = {}
+        self.latency = latency
+        self.max_rate = max_rate
+        self.requests: Dict[str, int] = {}
+        # Times of the requests answered in the last second
+        self._recent_requests = deque()
+        self._lock = threading.Lock()
+        self._rnd = random.Random(seed)
+        self._created = FIRST_CREATED
+
+        rnd = self._rnd
+        layers = [
+            self._add_item(
+                "Feature Service",
+                external=index % 10 == 0,
+                type_keywords=["ArcGIS Server", "Data", "Feature Access", "Service"],
+            )
+            for index in range(max(int(item_count * 0.3), 1))
+        ]
+        web_maps = []
+        for _ in range(max(int(item_count * 0.2), 1)):
+            web_map = self._add_item("Web Map", type_keywords=["ArcGIS Online", "Map"])
+            web_maps.append(web_map)
+            self.data[web_map] = {
+                "operationalLayers": [
+                    {
+                        "itemId": layer,
+                        "url": f"{SERVICES_URL}/{layer}/FeatureServer/0",
+                    }
+                    for layer in rnd.sample(layers, min(3, len(layers)))
+                ],
+                "bookmarks": [
+                    {"name": "Bookmark", "id": self._bogus_id(uppercase=True)}
+                ],
+            }
+        dashboards = []
+        for _ in range(max(int(item_count * 0.05), 1)):
+            dashboard = self._add_item("Dashboard", type_keywords=["Dashboard"])
+            dashboards.append(dashboard)
+            widget_maps = rnd.sample(web_maps, min(2, len(web_maps)))
+            self.data[dashboard] = {
+                "widgets": [
+                    {"type": "mapWidget", "itemId": web_map} for web_map in widget_maps
+                ],
+                "expression": f"Hash('{self._bogus_id()}')",
+            }
+            # Some web maps link back to a dashboard showing them
+            if rnd.random() < cycle_ratio * 4:
+                self.data[widget_maps[0]][
+                    "dashboard"
+                ] = f"/apps/dashboards/{dashboard}/"
+        for _ in range(max(int(item_count * 0.05), 1)):
+            app = self._add_item(
+                "Web Mapping Application", type_keywords=["Web Map", "Map"]
+            )
+            self.data[app] = {"values": {"webmap": rnd.choice(web_maps)}}
+        stories = []
+        for index in range(max(int(item_count * 0.4), 1)):
+            has_draft = rnd.random() < draft_ratio
+            # A tenth of the drafts belong to stories that were never published
+            has_published_data = not has_draft or index % 10 != 0
+            draft_name = f"draft_{index}.json"
+            type_keywords = ["StoryMap", "Story"]
+            if has_draft:
+                type_keywords.append(f"smdraftresourceid:{draft_name}")
+            story = self._add_item("StoryMap", type_keywords=type_keywords)
+            self.data[story] = {}
+            embeds = rnd.sample(web_maps, min(max(fan_out - 2, 1), len(web_maps)))
+            embeds += rnd.sample(layers, 1) + rnd.sample(dashboards, 1)
+            if stories and rnd.random() < cycle_ratio:
+                embeds.append(rnd.choice(stories))
+            self.resources[story] = {}
+            if has_published_data:
+                self.resources[story]["published_data.json"] = self._story_data(
+                    embeds, bogus_ratio
+                )
+            if has_draft:
+                # Drafts carry the published embeds and one in progress
+                self.resources[story][draft_name] = self._story_data(
+                    embeds + [rnd.choice(web_maps)], bogus_ratio
+                )
+            stories.append(story)
+        if external_count:
+            self._add_external_content(external_count, stories)
+
+    def _add_item(
+        self, item_type: str, type_keywords: List[str], external: bool = False
+    ) -> str:
+        item_id = "%032x" % self._rnd.getrandbits(128)
+        self._created += 60000
+        self.items[item_id] = {
+            "id": item_id,
+            "type": item_type,
+            "typeKeywords": type_keywords,
+            "title": f"{item_type} {item_id[:6]}",
+            "access": self._rnd.choice(["public", "org", "private"]),
+            "owner": EXTERNAL_OWNER if external else ORG_OWNER,
+            "orgId": EXTERNAL_ORG_ID if external else ORG_ID,
+            "isOrgItem": not external,
+            "protected": False,
+            "created": self._created,
+            "modified": self._created + 1000,
+        }
+        return item_id
+
+    def _add_external_content(self, count: int, stories: List[str]):
+        rnd = self._rnd
+        layers = [
+            self._add_item(
+                "Feature Service",
+                external=True,
+                type_keywords=["ArcGIS Server", "Data", "Feature Access", "Service"],
+            )
+            for _ in range(max(count * 2 // 3, 1))
+        ]
+        web_maps = [
+            self._add_item(
+                "Web Map", external=True, type_keywords=["ArcGIS Online", "Map"]
+            )
+            for _ in range(max(count // 3, 1))
+        ]
+        for web_map in web_maps:
+            self.data[web_map] = {
+                "operationalLayers": [
+                    {"itemId": layer}
+                    for layer in rnd.sample(layers, min(3, len(layers)))
+                ],
+                "relatedMap": rnd.choice(web_maps),
+            }
+        for story in stories[::2]:
+            web_map = rnd.choice(web_maps)
+            for story_data in self.resources[story].values():
+                story_data["resources"]["r-external"] = {
+                    "type": "webmap",
+                    "data": {"itemId": web_map, "itemType": "Web Map"},
+                }
+
+    def _bogus_id(self, uppercase: bool = False) -> str:
+        return ("%032X" if uppercase else "%032x") % self._rnd.getrandbits(128)
+
+    def _story_data(self, embeds: List[str], bogus_ratio: float) -> dict:
+        nodes = {"n-root": {"type": "story", "children": []}}
+        resources = {}
+        for index, item_id in enumerate(embeds):
+            nodes["n-root"]["children"].append(f"n-{index}")
+            nodes[f"n-{index}"] = {"type": "webmap", "data": {"map": f"r-{index}"}}
+            resources[f"r-{index}"] = {
+                "type": "webmap",
+                "data": {"itemId": item_id, "itemType": self.items[item_id]["type"]},
+            }
+            nodes[f"t-{index}"] = {
+                "type": "text",
+                "data": {
+                    "text": "<p>Lorem ipsum dolor sit amet, "
+                    "<strong>consectetur</strong></p>"
+                },
+            }
+        # IDs that are not items, in the proportion of all the IDs of the story
+        bogus_count = round(len(embeds) * bogus_ratio / max(1 - bogus_ratio, 0.01))
+        for index in range(bogus_count):
+            nodes[f"e-{index}"] = {
+                "type": "embed",
+                "config": {"hash": self._bogus_id()},
+            }
+        return {"root": "n-root", "nodes": nodes, "resources": resources}
+
+    def admit(self, endpoint: str) -> bool:
+        """
+        Counts a request to the given endpoint, unless it goes over max_rate.
+
+        Returns:
+            bool: False if the request is throttled.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self.max_rate is not None:
+                while self._recent_requests and self._recent_requests[0] < now - 1:
+                    self._recent_requests.popleft()
+                if len(self._recent_requests) >= self.max_rate:
+                    self.requests["throttled"] = self.requests.get("throttled", 0) + 1
+                    return False
+                self._recent_requests.append(now)
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            return True
+
+    def answer(self, endpoint: str):
+        """
+        Counts a request to the given endpoint and waits for the latency of the portal.
+
+        Raises:
+            Exception: Like the ArcGIS API for Python, when the request is throttled.
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        if not self.admit(endpoint):
+            raise Exception(
+                "Too many requests. Please try again later. (Error Code: 429)"
+            )
+
+    def search(
+        self,
+        query: str,
+        start: int = 0,
+        num: int = 10,
+        sort_field: Union[str, None] = None,
+        sort_order: str = "asc",
+    ):
+        """
+        Answers the subset of the search syntax used by the script: owner:, orgid:,
+        id:(a OR b ...) and created:/modified: ranges, joined with AND.
+
+        Returns:
+            tuple: The total number of matching items, and the items JSON of the
+                requested page.
+        """
+        ids = re.findall(r"[0-9a-f]{32}", query)
+        matches = (
+            [self.items[item_id] for item_id in ids if item_id in self.items]
+            if ids
+            else list(self.items.values())
+        )
+        owners = re.findall(r"owner:\s*(\w+)", query)
+        if owners:
+            matches = [item for item in matches if item["owner"] in owners]
+        org_id = re.search(r"orgid:\s*(\w+)", query)
+        if org_id:
+            matches = [item for item in matches if item["orgId"] == org_id.group(1)]
+        for field, low, high in re.findall(
+            r"(created|modified):\[(\d+) TO (\d+)\]", query
+        ):
+            matches = [item for item in matches if int(low) <= item[field] <= int(high)]
+        if sort_field:
+            matches.sort(
+                key=lambda item: item[sort_field], reverse=sort_order == "desc"
+            )
+        return len(matches), [dict(item) for item in matches[start : start + num]]
+
+
+class _Resources:
+    def __init__(self, item):
+        self._item = item
+
+    def list(self) -> List[dict]:
+        org = self._item._gis.org
+        org.answer("resources")
+        return [{"resource": name} for name in org.resources.get(self._item.itemid, {})]
+
+    def get(self, file: str, try_json: bool = True):
+        org = self._item._gis.org
+        org.answer("resources")
+        resources = org.resources.get(self._item.itemid, {})
+        if file not in resources:
+            raise Exception(
+                "Resource does not exist or is inaccessible. (Error Code: 404)"
+            )
+        return resources[file]
+
+
+class Item(dict):
+    """
+    Stand-in for arcgis.gis.Item, serving a SyntheticOrg.
+    """
+
+    def __init__(self, gis, itemid: str, itemdict: Union[dict, None] = None):
+        if itemdict is None:
+            gis.org.answer("item")
+            if itemid not in gis.org.items:
+                message, code = (
+                    MISSING_ITEM_ERROR["message"],
+                    MISSING_ITEM_ERROR["code"],
+                )
+                raise Exception(f"{message} (Error Code: {code})")
+            itemdict = gis.org.items[itemid]
+        super().__init__(itemdict)
+        self._gis = gis
+        self.itemid = itemid
+        self.resources = _Resources(self)
+
+    def __getattr__(self, name: str):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def get_data(self, try_json: bool = True):
+        self._gis.org.answer("data")
+        return self._gis.org.data.get(self.itemid, {})
+
+
+class _Content:
+    def __init__(self, gis):
+        self._gis = gis
+
+    def advanced_search(
+        self,
+        query: str,
+        max_items: int = 100,
+        start: int = 0,
+        sort_field: Union[str, None] = None,
+        sort_order: str = "asc",
+        as_dict: bool = False,
+        return_count: bool = False,
+    ):
+        org = self._gis.org
+        org.answer("search")
+        total, results = org.search(
+            query,
+            start,
+            max_items if max_items >= 0 else len(org.items),
+            sort_field,
+            sort_order,
+        )
+        if return_count:
+            return total
+        if not as_dict:
+            results = [Item(self._gis, item["id"], item) for item in results]
+        return {"results": results, "total": total, "start": start, "num": len(results)}
+
+
+class GIS:
+    """
+    Stand-in for arcgis.gis.GIS, logged in as ORG_OWNER to a SyntheticOrg.
+    """
+
+    def __init__(self, org: SyntheticOrg):
+        self.org = org
+        self.content = _Content(self)
+        self.users = type(
+            "Users", (), {"me": type("User", (), {"username": ORG_OWNER})()}
+        )()
+        self.properties = type("Properties", (), {"id": ORG_ID})()
+        self._con = type("Connection", (), {"token": None})()
+
+
+def use_synthetic_portal(module, org: SyntheticOrg) -> GIS:
+    """
+    Points the script module at a synthetic organization, replacing its GIS and Item
+    classes.
+
+    Args:
+        module: The imported find_related_AGO_items module.
+        org (SyntheticOrg): The organization to serve.
+
+    Returns:
+        GIS: A connection to the organization.
+    """
+    module.GIS = GIS
+    module.Item = Item
+    return GIS(org)
+
+
+@contextmanager
+def serve(org: SyntheticOrg, port: int = 0):
+    """
+    Serves a synthetic organization through a stub of the sharing REST API, from a
+    background thread.
+
+    Args:
+        org (SyntheticOrg): The organization to serve.
+        port (int, optional): The local port to listen on, 0 for any free port. Defaults
+            to 0.
+
+    Yields:
+        str: The sharing REST API root of the stub, to use as the rest_url of the
+            asyncio backend.
+    """
+    # aiohttp is only required to serve the asyncio backend
+    from aiohttp import web
+
+    async def answer(endpoint: str):
+        if org.latency:
+            await asyncio.sleep(org.latency)
+        if not org.admit(endpoint):
+            raise web.HTTPTooManyRequests(headers={"Retry-After": "1"})
+
+    async def item(request):
+        await answer("item")
+        item_id = request.match_info["item_id"]
+        if item_id not in org.items:
+            return web.json_response({"error": MISSING_ITEM_ERROR})
+        return web.json_response(org.items[item_id])
+
+    async def data(request):
+        await answer("data")
+        return web.json_response(org.data.get(request.match_info["item_id"], {}))
+
+    async def resources(request):
+        await answer("resources")
+        names = org.resources.get(request.match_info["item_id"], {})
+        return web.json_response({"resources": [{"resource": name} for name in names]})
+
+    async def resource(request):
+        await answer("resources")
+        names = org.resources.get(request.match_info["item_id"], {})
+        if request.match_info["name"] not in names:
+            return web.Response(status=404)
+        return web.json_response(names[request.match_info["name"]])
+
+    async def search(request):
+        await answer("search")
+        total, results = org.search(
+            request.query.get("q", ""),
+            int(request.query.get("start", 1)) - 1,
+            int(request.query.get("num", 10)),
+        )
+        return web.json_response({"total": total, "results": results})
+
+    app = web.Application()
+    app.add_routes(
+        [
+            web.get("/sharing/rest/search", search),
+            web.get("/sharing/rest/content/items/{item_id}", item),
+            web.get("/sharing/rest/content/items/{item_id}/data", data),
+            web.get("/sharing/rest/content/items/{item_id}/resources", resources),
+            web.get("/sharing/rest/content/items/{item_id}/resources/{name}", resource),
+        ]
+    )
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{port}/sharing/rest"
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
@@ -10,8 +10,15 @@ Dependencies:
     - arcgis: ArcGIS API for Python
     - pandas: Data manipulation and storage
     - re: Regular expressions for item ID extraction
+    - sqlite3, zlib, json: For the persistent item data store
+    - concurrent.futures, threading: For fetching items concurrently
+    - asyncio, aiohttp: For the optional asyncio fetch backend (aiohttp is only needed
+      when FETCH_BACKEND is "asyncio")
+    - pyarrow: For Parquet output (only needed when OUTPUT_FORMAT is "parquet")
+    - gzip, argparse: For crawl checkpoints and the --resume option
+    - cProfile, pyinstrument: For the optional profiling of a run (pyinstrument is only
+      needed when PROFILER is "pyinstrument")
     - warnings: To suppress irrelevant warnings
-    - uuid: To generate unique identifiers for rows
     - networkx, pyvis: For graph construction and visualization
     - matplotlib: For graphing (if HTML graph is enabled)
 
@@ -22,18 +29,134 @@ Configuration Parameters:
     - OUTPUT_MISS_FILE (str): File path to save items that could not be processed.
     - GRAPH_FILE (str): File path to save the graph as an HTML file.
     - CREATE_GRAPH_HTML (bool): Option to generate an HTML graph.
+    - GRAPH_FORMAT (str): "html", "graphml", "gexf" or "json", the format of GRAPH_FILE.
+    - GRAPH_CATEGORIES (List[str]): Item categories drawn in the graph, None for all.
+    - GRAPH_HTML_MAX_NODES (int): Most items drawn one by one in the HTML graph before
+      aggregating them by category.
     - QUERY_START_DATE (int): Timestamp in milliseconds to set a starting date for queries.
-    - ACCOUNT (str): Account to analyze (defaults to logged-in user if empty).
+    - ACCOUNT (Union[str, List[str]]): Account(s) to analyze, "*" for the whole
+      organization (defaults to logged-in user if empty).
     - TEST_MAX_PROCESSED_ITEMS, TEST_MAX_FOUND_ITEMS (int): Limits for testing; set to None for production.
+    - ITEM_CACHE_SIZE (int): Max number of item metadata records held in memory during a
+      run.
+    - ITEM_DATA_STORE_FILE (str): SQLite file caching item data between runs; set to
+      None to disable.
+    - MAX_WORKERS (int): Number of threads fetching items concurrently; set to 1 to
+      crawl serially.
+    - FETCH_BACKEND (str): "threads" to crawl with the ArcGIS API for Python, "asyncio"
+      to call the REST API with aiohttp.
+    - OUTPUT_FORMAT (str): "csv" or "parquet" for OUTPUT_FILE and OUTPUT_MISS_FILE.
+    - OUTPUT_BATCH_SIZE (int): Number of rows buffered before being written out; set to
+      None to write once at the end.
+    - POSTPROCESS_WORKERS (int): Number of processes expanding paused items, None for
+      one per CPU.
+    - POSTPROCESS_MIN_ROWS (int): Fewest related items rows expanded by several
+      processes.
+    - CHECKPOINT_FILE (str): File where crawl progress is saved for --resume; set to
+      None to disable.
+    - CHECKPOINT_INTERVAL (int): Seconds between checkpoints.
+    - STATE_FILE (str): File where the crawl of the last completed run is saved for
+      --incremental; set to None to disable.
+    - SCOPE_MAX_DEPTH (int): Most relationships followed from the organization items,
+      None for no limit.
+    - SCOPE_CATEGORIES, SCOPE_EXCLUDED_CATEGORIES (List[str]): Item categories recorded
+      and followed, and left out.
+    - SCOPE_EXPAND_EXTERNAL_ITEMS (bool): Whether to follow the related items of other
+      organizations' items.
+    - SCOPE_UNEXPANDED_ITEM_IDS (Set[str]): Items recorded but not followed, such as
+      well-known public items.
+    - DEPENDENCY_INDEX_FILE (str): SQLite index of the relationships of the last run,
+      for --upstream and --downstream.
+    - RETRY_ATTEMPTS (int): Max number of attempts to fetch an item on retryable errors
+      (timeouts, rate limiting, server errors).
+    - RETRY_BASE_DELAY (float): Upper bound in seconds of the random delay before the
+      first retry, doubled on each retry.
+    - REQUEST_RATE_LIMIT, REQUEST_RATE_BURST (float, int): Max requests per second to
+      the portal and burst size.
+    - ADAPTIVE_CONCURRENCY (bool): Adapts the requests in flight to throttling, errors
+      and latency (AIMD).
+    - REQUEST_LATENCY_TOLERANCE (float): Slowdown factor of an endpoint considered as
+      congestion.
+    - MISSING_ITEM_TTL (int): Seconds during which items found missing or inaccessible
+      are not requested again.
+    - STATS_FILE (str): JSON file where the run statistics are written; set to None to
+      disable.
+    - PROGRESS_INTERVAL (int): Seconds between progress lines; set to None to disable.
+    - PROFILER (str): None, "cprofile" or "pyinstrument" to profile the run into
+      PROFILE_FILE.
+
+Main Classes:
+    - ItemCache: In-process LRU cache of item metadata so each item is fetched once per
+      run.
+    - ItemDataStore: On-disk cache of item data, reused across runs until an item is
+      modified.
+    - ItemGraph: Adjacency list of the crawled items, from each item ID to the IDs found
+      in its data.
+    - AsyncItemFetcher: Fetches item details, data and StoryMap resources from the
+      sharing REST API with aiohttp.
+    - PathTable: Relationship paths stored as a trie of interned item IDs, shared by the
+      rows referencing them.
+    - RowAccumulator: Collects output rows column by column and builds a DataFrame from
+      them once.
+    - RowWriter: RowAccumulator writing its rows to a CSV or Parquet file in batches.
+    - PausedRowsExpander: Expands the paused rows of any range of related items rows.
+    - TraversalScope: Limits the items recorded and followed by depth, category and
+      organization.
+    - CrawlCheckpoint: Saves and restores the progress of a crawl.
+    - DependencyIndex: SQLite index of the items depending on each item and of the items
+      it depends on.
+    - RunStats: Times the phases of a run, the requests sent by endpoint and other
+      operations.
+    - RequestScheduler: Rate limits every request to the portal, honors Retry-After and
+      adapts the requests in flight.
+    - AuthenticationError: Raised when the portal rejects the token, stopping the run.
 
 Main Functions:
     - classify_by_type_typekeywords: Classifies an ArcGIS item based on type and type keywords.
-    - get_all_content_items_in_org: Retrieves all items within an organization.
-    - get_related_items_for_id: Recursively finds related items for a given item ID.
+    - get_all_content_items_in_org: Retrieves all items of some accounts or of the whole
+      organization, querying created date buckets concurrently.
+    - get_item_data: Returns the data of an item, from the item data store when
+      unchanged.
+    - fetch_item_data: Downloads the data of an item, including StoryMap resources.
+    - fetch_item: Fetches an item, retrying timeouts, rate limiting and server errors
+      with exponential backoff.
+    - is_retryable_error: Tells retryable errors from permanent ones, such as missing or
+      inaccessible items.
+    - is_missing_item_error: Tells the errors of missing or inaccessible items, kept in
+      the negative cache.
+    - error_status, retry_after: Read the HTTP status and the Retry-After header of a
+      failed request.
+    - crawl_item_graph: Fetches every item reachable from the given items once, with a
+      thread pool, into an ItemGraph.
+    - crawl_item_graph_async: Same as crawl_item_graph, using AsyncItemFetcher.
+    - crawl_related_item_ids: Lists the items reachable from some items, for scripts and
+      notebooks importing this module.
+    - load_incremental_run: Restores the crawl of the last run, forgetting the items
+      changed since.
+    - get_related_items_for_id: Recursively records the related items of a given item ID
+      from the ItemGraph.
     - process_paused_related_items: Manages items marked as "paused" to avoid cyclic dependencies.
-    - insert_slice_below: Helper function to insert DataFrame slices.
-    - replace_path: Modifies paths for tracking item relationships.
-    - find_all_possible_ids: Extracts potential ArcGIS item IDs from JSON strings.
+    - expand_paused_related_items: Yields the rows of process_paused_related_items one
+      at a time.
+    - write_expanded_related_items: Expands paused items by organization item in a pool
+      of processes and writes the rows in order.
+    - read_rows: Reads back an output file written by RowWriter.
+    - print_dependencies: Prints the items depending on an item, or that it depends on,
+      from the DependencyIndex.
+    - build_relationship_graph: Builds the graph of the relationship paths from the
+      output rows, without requesting items.
+    - layout_relationship_graph: Positions the nodes of a relationship graph in time
+      linear in its size.
+    - aggregate_graph_by_category: Aggregates a relationship graph into one node per
+      item category.
+    - write_graph_html: Writes a relationship graph as an interactive HTML page,
+      aggregated by category when large.
+    - export_graph: Exports the relationship graph as HTML, GraphML, GEXF or a JSON edge
+      list (optional).
+    - find_all_possible_ids: Extracts potential ArcGIS item IDs from a string.
+    - find_possible_ids_in_data: Extracts potential ArcGIS item IDs from the strings of
+      parsed JSON data.
+    - find_related_ids: Collects the potential item IDs found in the data of an item.
 
 Usage:
     - Ensure the ArcGIS API for Python is installed and valid credentials are available.
@@ -42,15 +165,40 @@ Usage:
     - Review the output CSVs to examine processed and missed items.
 
 Example:
-    $ python arcgis_item_analysis.py
+    $ python find_related_AGO_items.py
+    $ python find_related_AGO_items.py --resume  # continue an interrupted run
+    $ python find_related_AGO_items.py --incremental  # only fetch the modified items
+    $ python find_related_AGO_items.py --upstream <item id>  # items using an item
+    $ python find_related_AGO_items.py --downstream <item id>  # items used by an item
 """
 
-
+import argparse
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import random
 import re
+import sqlite3
+import threading
 import time
-import uuid
 import warnings
-from typing import List, Set, Union
+import zlib
+from array import array
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from email.utils import parsedate_to_datetime
+from itertools import chain
+from types import SimpleNamespace
+from typing import Dict, Iterable, Iterator, List, Set, Union
 
 import pandas as pd
 from arcgis.gis import GIS, Item
@@ -71,14 +219,166 @@ OUTPUT_MISS_FILE = "missed_items.csv"
 GRAPH_FILE = "graph.html"
 # Should data be graphed at the end of the process
 CREATE_GRAPH_HTML = True
+# Format of GRAPH_FILE: "html" (interactive page), "graphml", "gexf" (for Gephi or yEd)
+# or "json" (edge list)
+GRAPH_FORMAT = "html"
+# COLOR_MAP categories of the items drawn in the graph, e.g. ["StoryMap", "Web Map"];
+# None draws every item
+GRAPH_CATEGORIES = None
+# Most items drawn one by one in the html graph; larger graphs are drawn as one node per
+# category
+GRAPH_HTML_MAX_NODES = 5000
 # Unix timestamp (in milliseconds) marking the starting point for the search algorithm. Default is 00:00:00, January 1st, 2016
 QUERY_START_DATE = 1451624400000
 # The name of the account to be analyzed. If left blank the script will use the logged in user.
+# Use a list of names to analyze several accounts in one pass, or "*" for the whole
+# organization (requires administrator privileges)
 ACCOUNT = None
 # Max number of items to analyze. FOR dev/testing purposes. Modify this value to an integer if you want to test this script with a shortened run
 TEST_MAX_PROCESSED_ITEMS = None
 # Max number of items to find.. FOR dev/testing purposes.  Modify this value to an integer if you want to test this script with a shortened run
 TEST_MAX_FOUND_ITEMS = None
+# Max number of item metadata records held in memory during a run. Least recently used
+# records are evicted past this size
+ITEM_CACHE_SIZE = 100000
+# Item properties kept by the item cache. Enough to classify an item, fill a row of the
+# related items output, and list the items found by crawl_related_items
+ITEM_CACHE_FIELDS = [
+    "id",
+    "type",
+    "typeKeywords",
+    "title",
+    "access",
+    "owner",
+    "orgId",
+    "isOrgItem",
+    "protected",
+    "created",
+    "modified",
+]
+# SQLite file where item data is kept between runs. Unchanged items are read from it
+# instead of the portal. Set to None to disable
+ITEM_DATA_STORE_FILE = "item_data_store.sqlite"
+# Number of threads fetching item details and data concurrently while crawling. Set to 1
+# to crawl serially
+MAX_WORKERS = 8
+# How items are crawled. "threads" uses the ArcGIS API for Python from a thread pool,
+# "asyncio" calls the portal sharing REST API directly over one connection pool
+# (requires aiohttp)
+FETCH_BACKEND = "threads"
+# Max number of items advanced_search can page through for one query, and the number of
+# items requested per page
+SEARCH_RESULT_LIMIT = 10000
+SEARCH_PAGE_SIZE = 1000
+# Max number of item IDs whose metadata is looked up in a single "id:(a OR b OR ...)"
+# search while crawling
+ITEM_SEARCH_BATCH_SIZE = 100
+# Format of OUTPUT_FILE and OUTPUT_MISS_FILE, "csv" or "parquet". Parquet stores the
+# Relationship Path as a list column instead of a JSON list of item IDs, and requires
+# pyarrow. Remember to change the file extensions accordingly
+OUTPUT_FORMAT = "csv"
+# Number of rows buffered before they are written to the output files, so rows found so
+# far survive an interrupted run. Set to None to write the outputs once at the end of
+# the run
+OUTPUT_BATCH_SIZE = 10000
+# Number of processes expanding the paused items and formatting the output rows once the
+# crawl is done. None uses one process per CPU, 1 expands them in the main process
+POSTPROCESS_WORKERS = None
+# Fewest related items rows worth starting the processes for
+POSTPROCESS_MIN_ROWS = 50000
+# File where the progress of the crawl is saved, so an interrupted run can continue with
+# --resume. Set to None to disable
+CHECKPOINT_FILE = "crawl_checkpoint.json.gz"
+# Seconds between two saves of the crawl progress. Progress is also saved when the run
+# is stopped with Ctrl-C
+CHECKPOINT_INTERVAL = 300
+# File where the crawl of the last completed run is saved, so the next run can only
+# fetch the items modified since with --incremental. Set to None to disable
+STATE_FILE = "crawl_state.json.gz"
+# SQLite file indexing the relationships found by the last completed run, queried with
+# --upstream and --downstream. Set to None to disable
+DEPENDENCY_INDEX_FILE = "dependency_index.sqlite"
+# Max number of relationships followed from the organization items. Items further away
+# from every organization item are recorded, but their data is not searched for related
+# items. Set to None for no limit
+SCOPE_MAX_DEPTH = None
+# classify_by_type_typekeywords categories of the related items recorded and followed,
+# e.g. ["StoryMap", "Web Map"]. None records every category
+SCOPE_CATEGORIES = None
+# Categories of the related items neither recorded nor followed, e.g. ["Feature
+# Service", "Map Service"]
+SCOPE_EXCLUDED_CATEGORIES = []
+# Whether to follow the related items of items from other organizations (Esri basemaps,
+# Living Atlas layers...). When False, these items are recorded but their data is not
+# fetched
+SCOPE_EXPAND_EXTERNAL_ITEMS = True
+# IDs of items recorded but not followed, such as well-known public items:
+# set(open("public_ids.txt").read().split())
+SCOPE_UNEXPANDED_ITEM_IDS = set()
+# Max number of attempts to fetch an item. Only timeouts, rate limiting (429) and server
+# errors (5xx) are retried; items that do not exist or are inaccessible (400, 403, 404)
+# fail on the first attempt
+RETRY_ATTEMPTS = 3
+# Seconds bounding the random delay before the first retry. The bound doubles on every
+# retry (exponential backoff with jitter)
+RETRY_BASE_DELAY = 1
+# HTTP status codes of the errors worth retrying
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+# HTTP status codes of the items that do not exist or are inaccessible, remembered as
+# missing
+MISSING_STATUS_CODES = {400, 403, 404}
+# HTTP status codes of invalid or expired tokens, which stop the run instead of marking
+# every remaining item as missing
+AUTHENTICATION_STATUS_CODES = {401, 498, 499}
+# Seconds during which an item found missing or inaccessible is not requested again, in
+# this run and in the next runs through ITEM_DATA_STORE_FILE. Bogus IDs (GUIDs in
+# configs, hashes in expressions) are common in item data
+MISSING_ITEM_TTL = 7 * 24 * 3600
+# Max requests per second sent to the portal by all workers together. None for no limit
+REQUEST_RATE_LIMIT = None
+# Number of requests that can be sent at once within REQUEST_RATE_LIMIT, after a quiet
+# period
+REQUEST_RATE_BURST = 10
+# Adapt the number of requests in flight, up to MAX_WORKERS, to the portal: halve it
+# when requests are throttled, fail or slow down, and grow it back one request at a time
+# otherwise. Set to False to always send MAX_WORKERS at once
+ADAPTIVE_CONCURRENCY = True
+# How many times slower than its usual responses an endpoint must get to count as
+# slowing down
+REQUEST_LATENCY_TOLERANCE = 4
+# JSON file where the statistics of the run are written: time spent in each phase,
+# requests sent by endpoint with their latencies, retries, cache hits and rows per
+# second. Set to None to disable
+STATS_FILE = "run_stats.json"
+# Seconds between two progress lines while crawling and recording relationships. Set to
+# None to disable
+PROGRESS_INTERVAL = 30
+# Profiler of the run: None, "cprofile" (standard library) or "pyinstrument" (requires
+# pyinstrument). cProfile only sees the main thread, use pyinstrument or set MAX_WORKERS
+# to 1 to profile the crawl
+PROFILER = None
+# Output of the profiler, without extension: ".prof" for cProfile (open with snakeviz or
+# pstats), ".html" for pyinstrument
+PROFILE_FILE = "run_profile"
+
+# Columns of the related items output
+RELATED_ITEMS_COLUMNS = [
+    "Organization Item",
+    "Org item type",
+    "Org item Title",
+    "Org Item Sharing",
+    "Org item owner",
+    "Related Item Id",
+    "Related Item Type",
+    "Related Item Title",
+    "Related Item Sharing",
+    "Related Item Owner",
+    "Related Item Org",
+    "Relationship Path",
+    "Awaiting Processing",
+]
+# Columns of the missed items output
+MISSED_ITEMS_COLUMNS = ["itemId", "item_title", "item_owner", "error_message"]
 
 COLOR_MAP = {
     # Maps - Blue
@@ -209,475 +509,3841 @@ COLOR_MAP = {
 }
 
 
-def classify_by_type_typekeywords(item: Item) -> str:
+class AuthenticationError(Exception):
+    """
+    Raised when the portal rejects the token of a request, as no other request can
+    succeed until the user signs in again.
     """
-    Classifies an ArcGIS item based on its type keywords.
 
-    Args:
-        item (Item): The ArcGIS item to classify.
 
-    Returns:
-        str: The classification of the item.
+class RunStats:
     """
-    typekeywords = item.typeKeywords
-    isTemplate = "storymaptemplate" in typekeywords
-    if "storymapbriefing" in typekeywords and "StoryMap" in typekeywords:
-        return "Briefing"
-    if "storymapcollection" in typekeywords and "StoryMap" in typekeywords:
-        return "Collection"
-    if "storymapframe" in typekeywords and "StoryMap" in typekeywords:
-        return "Frame"
-    if "StoryMap Theme" in typekeywords:
-        return "Theme"
-    if "StoryMap" in typekeywords:
-        return "StoryMap Template" if isTemplate else "StoryMap"
-    # Not a storymap return the type if it is in color map else return other
-    if item.type in COLOR_MAP:
-        return item.type
-    else:
-        return "other"
-
+    Instrumentation of a run: wall time of each phase, timed operations such as requests
+    ("request <endpoint>") and named counters. Safe to share between threads.
 
-def get_all_content_items_in_org(gis_con: GIS, owner: str = None) -> Set[str]:
+    Attributes:
+        progress_interval (Union[int, None]): Min seconds between two progress lines,
+            None for no progress lines.
+        phases (Dict[str, float]): Wall time in seconds of each phase, in the order they
+            started.
+        operations (Dict[str, dict]): Count, errors, total and max seconds of each timed
+            operation.
+        counters (Dict[str, int]): Value of each named counter.
     """
-    Retrieves all StoryMap items within the organization.
 
-    Args:
-        gis_con (GIS): The GIS connection object.
-        owner (str, optional): The owner to filter items, if not passed will default to logged in user.
+    def __init__(self, progress_interval: Union[int, None] = PROGRESS_INTERVAL):
+        self.progress_interval = progress_interval
+        self.phases: Dict[str, float] = {}
+        self.operations: Dict[str, dict] = {}
+        self.counters: Dict[str, int] = {}
+        self._started = time.perf_counter()
+        self._phase = None
+        self._phase_started = None
+        self._last_progress = time.perf_counter()
+        self._lock = threading.Lock()
 
-    Returns:
-        Set[str]: A set of item IDs found.
-    """
-    org_users = gis_con.users.search(query=f"username:{owner}")
-    run_date = int(time.time() * 1000)
-    if owner is None:
-        owner = gis_con.users.me.username
-    found_ids = set()
-    total_items_found = 0
-    for index_user, user in enumerate(org_users):
-        # TODO Owner should never be none at this point, can rework this section
-        if owner is not None and len(owner) > 0 and user.username != owner:
-            continue
-        loop_counter = 0
-        current_results = []
-        modified_date_modifier = None
-        len_result = 1000
-        start = 0
-        while len_result == 1000:
+    def start_phase(self, name: Union[str, None]):
+        """
+        Ends the current phase, if any, and starts timing the given one.
+
+        Args:
+            name (Union[str, None]): The name of the phase, or None to only end the
+                current phase.
+        """
+        now = time.perf_counter()
+        if self._phase is not None:
+            self.phases[self._phase] = (
+                self.phases.get(self._phase, 0) + now - self._phase_started
+            )
+        self._phase = name
+        self._phase_started = now
+
+    @contextmanager
+    def timed(self, name: str):
+        """
+        Context manager timing one run of an operation. Exceptions are counted as errors
+        and re-raised.
+
+        Args:
+            name (str): The name of the operation, "request <endpoint>" for requests to
+                the portal.
+        """
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                operation = self.operations.setdefault(
+                    name, {"count": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0}
+                )
+                operation["count"] += 1
+                operation["errors"] += failed
+                operation["seconds"] += seconds
+                operation["max_seconds"] = max(operation["max_seconds"], seconds)
+
+    def count(self, name: str, amount: int = 1):
+        """
+        Adds to a named counter.
+
+        Args:
+            name (str): The name of the counter.
+            amount (int, optional): The amount to add. Defaults to 1.
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def requests(self) -> int:
+        """
+        Returns the number of requests sent to the portal so far.
+        """
+        with self._lock:
+            return sum(
+                operation["count"]
+                for name, operation in self.operations.items()
+                if name.startswith("request ")
+            )
+
+    def progress(self, message: str):
+        """
+        Prints a progress line with the elapsed time and the requests sent so far,
+        unless the last one was printed less than progress_interval seconds ago.
+
+        Args:
+            message (str): What the run is doing.
+        """
+        now = time.perf_counter()
+        with self._lock:
             if (
-                TEST_MAX_FOUND_ITEMS is not None
-                and total_items_found > TEST_MAX_FOUND_ITEMS
+                self.progress_interval is None
+                or now - self._last_progress < self.progress_interval
             ):
-                break
-            loop_counter += 1
-            if start >= 10000:
-                # add a 1ms reduction to the last modified date of the current results
-                last_created = current_results[-1].created
-                modified_date_modifier = (
-                    last_created + 1
-                )  # Adjust the modified date range
-                start = 0
-            query = f"owner: {user.username}"
-            if modified_date_modifier:
-                query += f" AND created:[{modified_date_modifier} TO {run_date}]"
-            else:
-                query += f" AND created:[{QUERY_START_DATE} TO {run_date}]"
-            print(f"Query: {query}")
-            result = gis_con.content.advanced_search(
-                query=query,
-                max_items=1000,
-                start=start,
-                sort_field="created",
-                sort_order="asc",
-            )
-            len_result = len(result["results"])
-            start += len_result
-            total_items_found += len_result
-            current_results = result["results"]
-            for item in result["results"]:
-                found_ids.add(item.id)
-            if len_result < 1000:
-                break
-            # print progress
-            print(f"Total items found: {len(found_ids)} in {loop_counter} loops")
-        # if index_user <= 1:
-        #     return found_ids
-    return found_ids
+                return
+            self._last_progress = now
+        elapsed = now - self._started
+        requests = self.requests()
+        print(
+            f"[{elapsed:.0f}s] {message}, {requests} requests sent "
+            f"({requests / elapsed:.1f} per second)"
+        )
 
+    def summary(self, **extra) -> dict:
+        """
+        Summarizes the run.
 
-def get_item_data(item: Item):
-    """
-    Fetches data for a given ArcGIS item, handling different resource types.
+        Args:
+            **extra: Other statistics to include, such as cache usage.
 
-    Args:
-        item (Item): The ArcGIS item to fetch data for.
+        Returns:
+            dict: Total and per phase wall time, operations with their mean duration,
+                and counters.
+        """
+        with self._lock:
+            operations = {
+                name: {
+                    **operation,
+                    "mean_seconds": operation["seconds"] / operation["count"],
+                }
+                for name, operation in sorted(self.operations.items())
+            }
+            return {
+                "seconds": time.perf_counter() - self._started,
+                "phases": dict(self.phases),
+                "requests": sum(
+                    operation["count"]
+                    for name, operation in operations.items()
+                    if name.startswith("request ")
+                ),
+                "operations": operations,
+                "counters": dict(self.counters),
+                **extra,
+            }
 
-    Returns:
-        tuple: A tuple containing the item data and any related data.
+
+# Statistics of the current run
+run_stats = RunStats()
+
+
+class RequestScheduler:
     """
-    item_data = item.get_data(try_json=True)
-    if item.type in ["StoryMap", "StoryMap Theme"]:
-        # Should only be relevant to StoryMaps
-        try:
-            resources = [resource["resource"] for resource in item.resources.list()]
-            has_published_data = "published_data.json" in resources
-            draft_id = None
-            for keyword in item.typeKeywords:
-                if keyword.startswith("smdraftresourceid"):
-                    draft_id = keyword.split(":")[1]
-            if has_published_data and not draft_id:
-                return (item.resources.get("published_data.json", try_json=True), None)
-            elif draft_id and not has_published_data:
-                return (item.resources.get(f"{draft_id}", try_json=True), None)
-            elif draft_id and has_published_data:
-                return (
-                    item.resources.get(f"{draft_id}", try_json=True),
-                    item.resources.get("published_data.json", try_json=True),
+    Gate of every request to the portal: a token bucket, the pauses asked by HTTP 429
+    responses and at most `limit` requests in flight. When adaptive, the limit grows by
+    one per round of timely requests and is halved on throttling, errors and slowdowns.
+
+    Attributes:
+        rate (Union[float, None]): Max requests per second, None for no limit.
+        burst (int): Requests that can be sent at once within the rate.
+        max_concurrency (int): Max requests in flight.
+        adaptive (bool): Whether the limit adapts to the portal.
+        latency_tolerance (float): Lower quartile latency, as a multiple of the
+            baseline, considered a slowdown.
+        limit (float): Current max requests in flight.
+        in_flight (int): Requests currently in flight.
+        throttled (int): Requests the portal throttled.
+        decreases (int): Times the limit was decreased.
+    """
+
+    # Lower quartile latencies below this many seconds are never considered a slowdown
+    latency_floor = 0.05
+    # Number of the last responses of an endpoint whose lower quartile latency is
+    # compared to the baseline
+    latency_window = 40
+    # Share of the gap to a higher lower quartile latency the baseline rises by on each
+    # response
+    baseline_rise = 0.001
+
+    def __init__(
+        self,
+        rate: Union[float, None] = REQUEST_RATE_LIMIT,
+        burst: int = REQUEST_RATE_BURST,
+        max_concurrency: int = MAX_WORKERS,
+        adaptive: bool = ADAPTIVE_CONCURRENCY,
+        latency_tolerance: float = REQUEST_LATENCY_TOLERANCE,
+    ):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_concurrency = max(max_concurrency, 1)
+        self.adaptive = adaptive
+        self.latency_tolerance = latency_tolerance
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.throttled = 0
+        self.decreases = 0
+        self._tokens = float(self.burst)
+        self._refilled = time.monotonic()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        # Mean latency, latencies of the last responses and baseline latency of each
+        # endpoint
+        self._latencies: Dict[str, float] = {}
+        self._recent_latencies: Dict[str, deque] = {}
+        self._baselines: Dict[str, float] = {}
+        self._condition = threading.Condition()
+        # (event loop, future) of the coroutines waiting for a request in flight to
+        # finish
+        self._async_waiters = deque()
+
+    def _reserve_token(self) -> float:
+        # Takes a token from the bucket, returning the seconds to wait until it is
+        # available
+        if self.rate is None:
+            return 0.0
+        with self._condition:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._refilled) * self.rate
+            )
+            self._refilled = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    def _try_start(self) -> Union[float, None]:
+        # Called with the condition held. Counts a request in flight and returns 0 if
+        # one can be sent, else the seconds until the pause ends, or None to wait for a
+        # request in flight to finish
+        paused = self._paused_until - time.monotonic()
+        if paused > 0:
+            return paused
+        if self.in_flight >= int(self.limit):
+            return None
+        self.in_flight += 1
+        return 0
+
+    def _finish(self, endpoint: str, seconds: float, error: Union[Exception, None]):
+        status = error_status(error) if error is not None else None
+        now = time.monotonic()
+        with self._condition:
+            self.in_flight -= 1
+            if status == 429:
+                self.throttled += 1
+                pause = retry_after(error)
+                self._paused_until = max(
+                    self._paused_until,
+                    now + (pause if pause is not None else RETRY_BASE_DELAY),
+                )
+            congested = status == 429 or (
+                error is not None and is_retryable_error(error)
+            )
+            if error is None:
+                mean = self._latencies.get(endpoint, seconds)
+                self._latencies[endpoint] = 0.8 * mean + 0.2 * seconds
+                recent = self._recent_latencies.setdefault(
+                    endpoint, deque(maxlen=self.latency_window)
+                )
+                recent.append(seconds)
+                quartile = sorted(recent)[len(recent) // 4]
+                baseline = self._baselines.get(endpoint, quartile)
+                if quartile < baseline:
+                    baseline = quartile
+                else:
+                    baseline += (quartile - baseline) * self.baseline_rise
+                self._baselines[endpoint] = baseline
+                congested = quartile > max(
+                    baseline * self.latency_tolerance, self.latency_floor
                 )
+            if self.adaptive:
+                if not congested:
+                    self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                elif now - self._last_decrease > self._latencies.get(endpoint, seconds):
+                    # Requests sent before the decrease report the same congestion, only
+                    # the first one counts
+                    self.limit = max(1.0, self.limit / 2)
+                    self._last_decrease = now
+                    self.decreases += 1
+            self._condition.notify_all()
+            # Wakes as many waiting coroutines as requests can now be sent
+            slots = int(self.limit) - self.in_flight
+            while slots > 0 and self._async_waiters:
+                loop, waiter = self._async_waiters.popleft()
+                if not waiter.done():
+                    loop.call_soon_threadsafe(self._wake, waiter)
+                    slots -= 1
+
+    @staticmethod
+    def _wake(waiter: asyncio.Future):
+        if not waiter.done():
+            waiter.set_result(None)
+
+    @contextmanager
+    def request(self, endpoint: str):
+        """
+        Context manager around a request sent from a thread, waiting until it can be
+        sent.
+
+        Args:
+            endpoint (str): The endpoint requested: "search", "item", "data" or
+                "resources".
+        """
+        delay = self._reserve_token()
+        if delay:
+            time.sleep(delay)
+        with self._condition:
+            pause = self._try_start()
+            while pause != 0:
+                self._condition.wait(pause)
+                pause = self._try_start()
+        with self._timed(endpoint):
+            yield
+
+    @asynccontextmanager
+    async def request_async(self, endpoint: str):
+        """
+        Same as request, for a request sent from a coroutine.
+
+        Args:
+            endpoint (str): The endpoint requested: "search", "item", "data" or
+                "resources".
+        """
+        delay = self._reserve_token()
+        if delay:
+            await asyncio.sleep(delay)
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                pause = self._try_start()
+                if pause is None:
+                    # Woken by _finish once a request in flight finishes
+                    waiter = loop.create_future()
+                    self._async_waiters.append((loop, waiter))
+            if pause == 0:
+                break
+            if pause is None:
+                await waiter
             else:
-                return (item.resources.get("draft.json", try_json=True), None)
+                await asyncio.sleep(pause)
+        with self._timed(endpoint):
+            yield
+
+    def call(self, endpoint: str, function, *args, **kwargs):
+        """
+        Sends a request from a thread, making up to RETRY_ATTEMPTS attempts. Permanent
+        errors, such as items that do not exist or are inaccessible, are raised on the
+        first attempt.
+
+        Args:
+            endpoint (str): The endpoint requested: "search", "item", "data" or
+                "resources".
+            function: The function sending the request, called with the other arguments.
+
+        Returns:
+            The result of the function.
+
+        Raises:
+            Exception: The permanent error, or the error of the last attempt if all
+                attempts failed.
+        """
+        for tries in range(RETRY_ATTEMPTS):
+            try:
+                with self.request(endpoint):
+                    return function(*args, **kwargs)
+            except Exception as e:
+                if error_status(e) in AUTHENTICATION_STATUS_CODES:
+                    raise AuthenticationError(str(e)) from e
+                if tries == RETRY_ATTEMPTS - 1 or not is_retryable_error(e):
+                    raise
+                run_stats.count("retries")
+                time.sleep(retry_delay(tries))  # Adding delay before retry
+
+    async def call_async(self, endpoint: str, function, *args, **kwargs):
+        """
+        Same as call, for a coroutine function.
+        """
+        for tries in range(RETRY_ATTEMPTS):
+            try:
+                async with self.request_async(endpoint):
+                    return await function(*args, **kwargs)
+            except Exception as e:
+                if error_status(e) in AUTHENTICATION_STATUS_CODES:
+                    raise AuthenticationError(str(e)) from e
+                if tries == RETRY_ATTEMPTS - 1 or not is_retryable_error(e):
+                    raise
+                run_stats.count("retries")
+                await asyncio.sleep(retry_delay(tries))
+
+    @contextmanager
+    def _timed(self, endpoint: str):
+        start = time.perf_counter()
+        error = None
+        try:
+            with run_stats.timed(f"request {endpoint}"):
+                yield
         except Exception as e:
-            return (None, None)
-    return (item_data, None)
+            error = e
+            raise
+        finally:
+            self._finish(endpoint, time.perf_counter() - start, error)
 
+    def report(self) -> dict:
+        """
+        Returns the state of the scheduler, for the run statistics.
+        """
+        with self._condition:
+            return {
+                "concurrency_limit": round(self.limit, 2),
+                "throttled": self.throttled,
+                "concurrency_decreases": self.decreases,
+                "mean_latencies": {
+                    endpoint: round(latency, 4)
+                    for endpoint, latency in sorted(self._latencies.items())
+                },
+            }
 
-def find_all_possible_ids(json_string: str):
+
+# Gate of the requests to the portal of the current run
+request_scheduler = RequestScheduler()
+
+
+def start_profiler(profiler: Union[str, None]):
     """
-    Extracts all possible item IDs from a JSON string using regex.
+    Starts profiling the run.
 
     Args:
-        json_string (str): The JSON string to search for IDs.
+        profiler (Union[str, None]): "cprofile", "pyinstrument", or None not to profile.
 
     Returns:
-        list: A list of found item IDs.
+        The running profiler, to pass to stop_profiler, or None.
     """
-    return re.findall(r"[\"\'\/]([a-zA-Z0-9]{32})[\"\'\/]", json_string)
+    if profiler == "cprofile":
+        import cProfile
 
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+    if profiler == "pyinstrument":
+        # pyinstrument is only required when selected
+        from pyinstrument import Profiler
 
-def get_related_items_for_id(
-    gis_con: GIS,
-    item_id: str,
-    related_items_df: pd.DataFrame,
-    missed_items_df: pd.DataFrame,
-    main_ancestors: Set[str],
-    base_ancestor: Union[Item | None] = None,
-    relation_path: List[str] = [],
-    relations_in_process: List[str] = [],
-):
+        profile = Profiler()
+        profile.start()
+        return profile
+    return None
+
+
+def stop_profiler(profile, path: str):
     """
-    Fetches related items for a given item ID and updates the related items DataFrame.
-    This function attempts to fetch an item by its ID up to three times. If successful, it processes the item to find its related items and updates the provided DataFrames accordingly. It also handles cyclic dependencies and ensures that items are not processed multiple times.
+    Stops a profiler started by start_profiler and writes its output.
+
     Args:
-        gis_con (GIS): The GIS connection object.
-        item_id (str): The ID of the item to fetch and process.
-        related_items_df (pd.DataFrame): DataFrame to store information about related items.
-        missed_items_df (pd.DataFrame): DataFrame to store information about items that could not be fetched.
-        main_ancestors (Set[str]): Set to store the IDs of main ancestor items.
-        base_ancestor (Union[Item, None], optional): The base ancestor item. Defaults to None.
-        relation_path (List[str], optional): List to track the relation path of items. Defaults to an empty list.
-        relations_in_process (List[str], optional): List to track items that are currently being processed. Defaults to an empty list.
-    Returns:
-        None
+        profile: The profiler returned by start_profiler, or None.
+        path (str): Location of the output, without extension.
     """
-
-    valid_item = None
-    # Attempt to fetch the item up to 3 times
-    for tries in range(3):
-        try:
-            valid_item = Item(gis_con, item_id)
-            break  # Exit loop on successful fetch
-        except Exception as e:
-            # print(f"Error fetching item {item_id}: {e}. Retrying ({tries+1}/3)...")
-            time.sleep(1)  # Adding delay before retry
-            if tries == 2:
-                missed_items_df.loc[uuid.uuid4()] = [item_id, None, None, str(e)]
-    # Copy the current relation path for further processing
-    new_relation_path = relation_path.copy()
-    # Check if currently handling the main ancestor
-    currently_handling_main_ancestor = base_ancestor is None
-    # Detect cyclic dependency: if the item is already in the relation path
-    if not currently_handling_main_ancestor and valid_item.itemid in relation_path:
-        print(
-            f"Detected a cyclic dependency! {valid_item.itemid} appears in the relation path {relation_path}."
-        )
+    if profile is None:
         return
-    # If currently handling the main ancestor and valid_item is found, set it as the base ancestor
-    if currently_handling_main_ancestor and valid_item:
-        base_ancestor = valid_item
-        main_ancestors.add(valid_item.itemid)
-    # Only add the valid item's ID to the relation path if not handling the main ancestor
-    if valid_item:
-        new_relation_path.append(valid_item.itemid)
-    # If not handling the main ancestor, proceed to process the valid item and add it to the related items DataFrame
-    if not currently_handling_main_ancestor:
-        # print("processing related item", valid_item.itemid)
-        new_row = [
-            base_ancestor.itemid,
-            classify_by_type_typekeywords(base_ancestor),
-            base_ancestor.title,
-            base_ancestor.access,
-            base_ancestor.owner,
-            valid_item.itemid,
-            classify_by_type_typekeywords(valid_item),
-            valid_item.title,
-            valid_item.access,
-            valid_item.owner,
-            valid_item.get("orgId", None),
-            new_relation_path,
-        ]
-        # if exact row already exists, skip
-        if related_items_df.apply(lambda row: row.tolist() == new_row, axis=1).any():
-            # print("oops!")
-            return
-        ## Check if the related item is already being processed:
-        if valid_item.itemid in relations_in_process:
-            new_row.append("Yes")
-            related_items_df.loc[uuid.uuid4()] = new_row
-            print(f"Item {valid_item.itemid} is already in process")
-            return
-        new_row.append("No")
-        ## Add valid item to the ancestors
-        related_items_df.loc[uuid.uuid4()] = new_row
-    # If valid_item was successfully fetched, and all previous conditions are met, proceed to fetch related items for this item
-    if valid_item:
-        items_related_to_valid_item = set()
-        relations_in_process.append(valid_item.itemid)
-        valid_item_data = get_item_data(valid_item)
-        # If the first part of the fetched data is not empty
-        if valid_item_data[0] is not None or valid_item_data[0] != {}:
-            related_json_string = str(valid_item_data[0])
-            related_ids = find_all_possible_ids(related_json_string)
-            [items_related_to_valid_item.add(related_id) for related_id in related_ids]
-        # If the second part of the fetched data is not empty (only relevant to StoryMaps), and considers draft related items
-        if valid_item_data[1] is not None or valid_item_data[1] != {}:
-            related_json_string = str(valid_item_data[1])
-            related_ids = find_all_possible_ids(related_json_string)
-            [items_related_to_valid_item.add(related_id) for related_id in related_ids]
-        # Iterate over each related ID found
-        for related_id in items_related_to_valid_item:
-            # Recursively call the function to find related items for each related ID
-            get_related_items_for_id(
-                gis_con,
-                related_id,
-                related_items_df,
-                missed_items_df,
-                main_ancestors,
-                base_ancestor,
-                new_relation_path,
-            )
+    if hasattr(profile, "dump_stats"):
+        profile.disable()
+        profile.dump_stats(f"{path}.prof")
+        print(f"Profile written to {path}.prof")
+    else:
+        profile.stop()
+        with open(f"{path}.html", "w", encoding="utf-8") as profile_file:
+            profile_file.write(profile.output_html())
+        print(f"Profile written to {path}.html")
 
 
-def insert_slice_below(df, index, new_slice: pd.DataFrame):
+class ItemCache:
     """
-    Inserts a slice of a DataFrame below a specified index.
+    In-process LRU cache of item metadata (ITEM_CACHE_FIELDS) keyed by item ID, looked
+    up in batches with prefetch. Items that failed with a permanent error fail again
+    without calling the portal. Safe to share between threads.
 
-    Args:
-        df (pd.DataFrame): The DataFrame to insert the slice into.
-        index (int): The index to insert the slice below.
-        new_slice (pd.DataFrame): The slice to insert.
+    Attributes:
+        gis_con (GIS): The GIS connection object used to fetch items on a miss.
+        max_size (int): Max number of records held before the least recently used is
+            evicted.
+        hits (int): Number of lookups served from the cache.
+        misses (int): Number of lookups that fetched the item from the portal.
+        missing (Dict[str, str]): Error message keyed by the ID of each item known to be
+            missing or inaccessible.
+        missing_hits (int): Number of lookups failed from the missing items.
+        prefetched (int): Number of items added from search results.
+        searches (int): Number of search results added.
     """
-    # split original dataframe into two parts
-    top = df.iloc[: index + 1]
-    ## only slice bottom if index is not the last row
-    if index == len(df) - 1:
-        print("index is last row")
-        bottom = df.iloc[index + 1 :]
-        return pd.concat([top, new_slice])
-    bottom = df.iloc[index + 1 :]
-    # concatenate the two parts with the new slice in between
-    return pd.concat([top, new_slice, bottom])
 
+    def __init__(self, gis_con: GIS, max_size: int = ITEM_CACHE_SIZE):
+        self.gis_con = gis_con
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.missing: Dict[str, str] = {}
+        self.missing_hits = 0
+        self.prefetched = 0
+        self.searches = 0
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
 
-def replace_path(processed_path: list, original_path: list, paused_item_id: str):
-    """
-    Takes the original path and appends the processed path from the paused item.
+    def __len__(self) -> int:
+        return len(self._records)
 
-    Args:
-        processed_path (list): The processed path from the paused item.
-        original_path (list): The original path.
-        paused_item_id (str): The ID of the paused item.
-    """
-    # takes the origianl path and appends the processed path from the paused item
-    # find the index of the paused item in the original path
-    paused_item_index = processed_path.index(paused_item_id)
-    # append the processed path from the paused item
-    if paused_item_index == len(processed_path) - 1:
-        return original_path
-    return original_path + processed_path[paused_item_index + 1 :]
-
-
-def process_paused_related_items(related_df: pd.DataFrame):
-    """
-    Processes paused related items in the given DataFrame.
-    This function identifies rows in the DataFrame where the 'Awaiting Processing' column is marked as "Yes".
-    For each paused item, it finds the corresponding processed item where the 'Related Item Id' matches and
-    'Awaiting Processing' is marked as "No". It then counts the number of related rows following the processed item
-    that include the paused item's ID in their 'Relationship Path'. An empty DataFrame of the same size is created and
-    inserted below the paused item. A slice of the DataFrame from the processed item index to the related row count is
-    created, modified, and inserted below the paused item. Finally, duplicates are removed from the DataFrame.
-    Args:
-        related_df (pd.DataFrame): The DataFrame containing related items with columns including 'Awaiting Processing',
-                                    'Relationship Path', 'Related Item Id', 'Organization Item', 'Org item type',
-                                    'Org item Title', 'Org Item Sharing', and 'Org item owner'.
-    Returns:
-        None: The DataFrame is modified in place.
-    """
-    paused_items = related_df[related_df["Awaiting Processing"] == "Yes"]
-    paused_items_indexes = paused_items.index.tolist()
-    for index in paused_items_indexes:
-        # get the paused item
-        paused_item = related_df.loc[index]
-        # get integer index of the paused item
-        paused_item_index = related_df.index.get_loc(index)
-        # get the path of the paused item
-        paused_item_path = paused_item["Relationship Path"]
-        # get the paused item id
-        paused_item_id = paused_item["Related Item Id"]
-        # get processed item where related item id is the paused item id and Await Processing is No
-        processed_item = related_df[
-            (related_df["Related Item Id"] == paused_item_id)
-            & (related_df["Awaiting Processing"] == "No")
-        ]
-        if processed_item.empty:
-            print("No processed item found")
-            continue
-        # get the index of the processed item
-        print("processed item:", processed_item)
-        processed_item_index = processed_item.index[0]
-        print("processed item index:", processed_item_index)
-        processed_item_int_index = related_df.index.get_loc(processed_item_index)
-        print("processed item int index:", processed_item_int_index)
-        related_row_count = 0
-        counting_related_rows = True
-        # count number of items following the processed item that include the paused item id
-        while counting_related_rows:
-            if (
-                paused_item_id
-                in related_df.iloc[processed_item_int_index + related_row_count + 1][
-                    "Relationship Path"
-                ]
-            ):
-                related_row_count += 1
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._records
+
+    def get_item(self, item_id: str) -> Item:
+        """
+        Returns the item for the given ID, fetching it from the portal only on a cache
+        miss.
+
+        Args:
+            item_id (str): The ID of the item to get.
+
+        Returns:
+            Item: The item, built from cached metadata on a hit.
+
+        Raises:
+            Exception: Any error raised by the portal when fetching an uncached item, or
+                the error the item failed with earlier if it is known to be missing.
+        """
+        with self._lock:
+            error = self.missing.get(item_id)
+            if error is not None:
+                self.missing_hits += 1
+                raise Exception(error)
+            record = self._records.get(item_id)
+            if record is not None:
+                self.hits += 1
+                self._records.move_to_end(item_id)
             else:
-                counting_related_rows = False
-        # If Related row count is 0 that means the investigated item has no dependencies, and we can move on to the next item
-        if related_row_count < 1:
-            continue
-        # Add empty dataframe of size related_row_count to the related items dataframe at the location of the paused item
-        empty_df = pd.DataFrame(columns=related_df.columns)
-        for i in range(related_row_count):
-            empty_df.loc[uuid.uuid4()] = [None for i in range(len(related_df.columns))]
-        # Create slice df of the related items dataframe from the processed item index + 1 to related_row_count
-        slice_df = related_df.iloc[
-            processed_item_int_index
-            + 1 : processed_item_int_index
-            + related_row_count
-            + 1
+                self.misses += 1
+        if record is not None:
+            return Item(self.gis_con, item_id, dict(record))
+        try:
+            item = request_scheduler.call("item", Item, self.gis_con, item_id)
+        except Exception as e:
+            if is_missing_item_error(e):
+                self.add_missing(item_id, str(e))
+            raise
+        self.add(item)
+        return item
+
+    def get_record(self, item_id: str) -> Union[dict, None]:
+        """
+        Returns the cached metadata of an item without fetching it, counting a hit.
+
+        Args:
+            item_id (str): The ID of the item.
+
+        Returns:
+            Union[dict, None]: A copy of the cached properties, or None if the item is
+                not cached.
+        """
+        with self._lock:
+            record = self._records.get(item_id)
+            if record is None:
+                return None
+            self.hits += 1
+            self._records.move_to_end(item_id)
+            return dict(record)
+
+    def prefetch(self, item_ids: List[str]):
+        """
+        Caches the given items that are neither cached nor known to be missing with a
+        single "id:(a OR b OR ...)" search.
+
+        Args:
+            item_ids (List[str]): The IDs of at most ITEM_SEARCH_BATCH_SIZE items.
+        """
+        item_ids = self.unresolved(item_ids)
+        if not item_ids:
+            return
+        try:
+            result = request_scheduler.call(
+                "search",
+                self.gis_con.content.advanced_search,
+                query=f"id:({' OR '.join(item_ids)})",
+                max_items=len(item_ids),
+                as_dict=True,
+            )
+        except AuthenticationError:
+            raise
+        except Exception:
+            # get_item fetches the items one at a time instead
+            return
+        self.add_search_results(result["results"])
+
+    def refresh(self, item_ids: List[str], max_workers: int = MAX_WORKERS) -> Set[str]:
+        """
+        Looks up the given items again with batched "id:(a OR b OR ...)" searches,
+        updating the cache, and returns the items modified, deleted or not cached since.
+
+        Args:
+            item_ids (List[str]): The IDs of the items.
+            max_workers (int, optional): Number of searches run concurrently. Defaults
+                to MAX_WORKERS.
+
+        Returns:
+            Set[str]: The IDs of the changed items.
+        """
+
+        def search_batch(batch: List[str]) -> Union[List[dict], None]:
+            try:
+                result = request_scheduler.call(
+                    "search",
+                    self.gis_con.content.advanced_search,
+                    query=f"id:({' OR '.join(batch)})",
+                    max_items=len(batch),
+                    as_dict=True,
+                )
+            except AuthenticationError:
+                raise
+            except Exception:
+                # The items of a failed search are taken as changed and fetched again
+                return None
+            return result["results"]
+
+        batches = [
+            item_ids[start : start + ITEM_SEARCH_BATCH_SIZE]
+            for start in range(0, len(item_ids), ITEM_SEARCH_BATCH_SIZE)
         ]
-        slice_df.index = [uuid.uuid4() for i in range(len(slice_df))]
-        slice_df["Awaiting Processing"] = slice_df["Awaiting Processing"].apply(
-            lambda x: "NA"
-        )
-        slice_df["Organization Item"] = slice_df["Organization Item"].apply(
-            lambda x: paused_item["Organization Item"]
-        )
-        slice_df["Org item type"] = slice_df["Org item type"].apply(
-            lambda x: paused_item["Org item type"]
-        )
-        slice_df["Org item Title"] = slice_df["Org item Title"].apply(
-            lambda x: paused_item["Org item Title"]
-        )
-        slice_df["Org Item Sharing"] = slice_df["Org Item Sharing"].apply(
-            lambda x: paused_item["Org Item Sharing"]
+        changed_ids = set()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for batch, results in zip(batches, executor.map(search_batch, batches)):
+                if results is None:
+                    changed_ids.update(batch)
+                    continue
+                found = {item["id"]: item for item in results}
+                with self._lock:
+                    saved = {
+                        item_id: self._records[item_id].get("modified")
+                        for item_id in batch
+                        if item_id in self._records
+                    }
+                    for item_id in batch:
+                        if item_id not in found:
+                            self._records.pop(item_id, None)
+                for item_id in batch:
+                    if item_id not in found or found[item_id].get(
+                        "modified"
+                    ) != saved.get(item_id):
+                        changed_ids.add(item_id)
+                self.add_search_results(results)
+        return changed_ids
+
+    def unresolved(self, item_ids: List[str]) -> List[str]:
+        """
+        Returns the given items that are neither cached nor known to be missing.
+
+        Args:
+            item_ids (List[str]): The IDs of the items.
+
+        Returns:
+            List[str]: The IDs of the items to look up.
+        """
+        with self._lock:
+            return [
+                item_id
+                for item_id in item_ids
+                if item_id not in self._records and item_id not in self.missing
+            ]
+
+    def add_search_results(self, results: List[dict]):
+        """
+        Caches the items of a search response.
+
+        Args:
+            results (List[dict]): The items JSON returned by a search.
+        """
+        for item in results:
+            self.add(item)
+        with self._lock:
+            self.searches += 1
+            self.prefetched += len(results)
+
+    def get_missing(self, item_id: str) -> Union[str, None]:
+        """
+        Returns the error message of an item known to be missing or inaccessible,
+        counting a hit.
+
+        Args:
+            item_id (str): The ID of the item.
+
+        Returns:
+            Union[str, None]: The error the item failed with, or None if the item is not
+                known to be missing.
+        """
+        with self._lock:
+            error = self.missing.get(item_id)
+            if error is not None:
+                self.missing_hits += 1
+            return error
+
+    def add_missing(self, item_id: str, error: str):
+        """
+        Records an item that failed with a permanent error, so the next lookups fail
+        without calling the portal.
+
+        Args:
+            item_id (str): The ID of the item.
+            error (str): The error message the item failed with.
+        """
+        with self._lock:
+            self.missing[item_id] = error
+
+    def add(self, item: Union[Item, dict]):
+        """
+        Stores the metadata of an already fetched item, evicting the least recently used
+        records if full.
+
+        Args:
+            item (Union[Item, dict]): The item, or its JSON as returned by the sharing
+                REST API.
+        """
+        record = {field: item.get(field, None) for field in ITEM_CACHE_FIELDS}
+        with self._lock:
+            self._records[record["id"]] = record
+            self._records.move_to_end(record["id"])
+            while len(self._records) > self.max_size:
+                self._records.popitem(last=False)
+
+    def records(self, item_ids: Iterable[str]) -> List[dict]:
+        """
+        Returns the cached metadata of the given items, skipping items that are not
+        cached.
+
+        Args:
+            item_ids (Iterable[str]): The IDs of the items.
+
+        Returns:
+            List[dict]: The cached properties of each item, which can be passed back to
+                add.
+        """
+        with self._lock:
+            return [
+                dict(self._records[item_id])
+                for item_id in item_ids
+                if item_id in self._records
+            ]
+
+    def report(self) -> str:
+        """
+        Summarizes the cache usage of the run.
+
+        Returns:
+            str: Hit and miss counts, hit rate and current size.
+        """
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0
+        return (
+            f"Item cache: {self.hits} hits, {self.misses} misses "
+            f"({hit_rate:.1%} hit rate), {len(self)} items held, "
+            f"{self.missing_hits} lookups of {len(self.missing)} missing items, "
+            f"{self.prefetched} items found by {self.searches} searches"
         )
-        slice_df["Org item owner"] = slice_df["Org item owner"].apply(
-            lambda x: paused_item["Org item owner"]
+
+
+class ItemDataStore:
+    """
+    Persistent cache of item data in a SQLite file, served while the item's `modified`
+    timestamp is unchanged. Also keeps the items found missing, with the date they were
+    checked. Safe to share between threads.
+
+    Attributes:
+        path (str): Location of the SQLite file.
+        hits (int): Number of lookups served from the store.
+        misses (int): Number of lookups for missing or outdated records.
+    """
+
+    # Number of writes between commits to the SQLite file
+    COMMIT_INTERVAL = 100
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._pending_writes = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS item_data ("
+            "item_id TEXT PRIMARY KEY, modified INTEGER NOT NULL, data BLOB NOT NULL)"
         )
-        # replace the path in the slice using the processed item path
-        slice_df["Relationship Path"] = slice_df["Relationship Path"].apply(
-            lambda x: replace_path(x, paused_item_path, paused_item_id)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS missing_items ("
+            "item_id TEXT PRIMARY KEY, error TEXT NOT NULL, checked INTEGER NOT NULL)"
         )
-        related_df = insert_slice_below(related_df, paused_item_index, slice_df)
-        # drop duplicates from the related items dataframe, do not include index
-        related_df = related_df.loc[related_df.astype(str).drop_duplicates().index]
+        self._connection.commit()
 
+    def get(self, item_id: str, modified: int):
+        """
+        Returns the stored data of an item if it has not been modified since it was
+        stored.
 
-if __name__ == "__main__":
-    gis_con = GIS(PORTAL, USERNAME, PASSWORD)
-    all_storymap_items = get_all_content_items_in_org(gis_con, ACCOUNT)
-    print(len(all_storymap_items))
-    missed_items = pd.DataFrame(
-        columns=["itemId", "item_title", "item_owner", "error_message"]
-    )
-    related_items = pd.DataFrame(
-        columns=[
-            "Organization Item",
-            "Org item type",
-            "Org item Title",
-            "Org Item Sharing",
-            "Org item owner",
-            "Related Item Id",
-            "Related Item Type",
-            "Related Item Title",
-            "Related Item Sharing",
-            "Related Item Owner",
-            "Related Item Org",
-            "Relationship Path",
-            "Awaiting Processing",
-        ]
-    )
-    for index, item_id in enumerate(all_storymap_items):
-        print(f"Processing item {index} with id {item_id}")
+        Args:
+            item_id (str): The ID of the item.
+            modified (int): The current `modified` timestamp of the item.
+
+        Returns:
+            tuple: The item data as returned by fetch_item_data, or None if there is no
+                valid record.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT data FROM item_data WHERE item_id = ? AND modified = ?",
+                (item_id, modified),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return tuple(json.loads(zlib.decompress(row[0])))
+
+    def put(self, item_id: str, modified: int, item_data: tuple):
+        """
+        Stores the data of an item, replacing any record for an older version of it.
+        Data that cannot be serialized as JSON is not stored.
+
+        Args:
+            item_id (str): The ID of the item.
+            modified (int): The `modified` timestamp of the item the data was fetched
+                for.
+            item_data (tuple): The item data as returned by fetch_item_data.
+        """
         try:
-            get_related_items_for_id(
-                gis_con, item_id, related_items, missed_items, all_storymap_items
+            blob = zlib.compress(json.dumps(list(item_data)).encode("utf-8"))
+        except (TypeError, ValueError):
+            return
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO item_data (item_id, modified, data) "
+                "VALUES (?, ?, ?)",
+                (item_id, modified, blob),
             )
-        except Exception as e:
-            missed_items.loc[uuid.uuid4()] = [item_id, None, None, str(e)]
-        if TEST_MAX_PROCESSED_ITEMS is not None and index > TEST_MAX_PROCESSED_ITEMS:
-            break
-    print(len(related_items))
-    related_items.to_csv(OUTPUT_FILE)
-    # only have unique rows in the missed items
-    missed_items = missed_items.drop_duplicates()
-    missed_items.to_csv(OUTPUT_MISS_FILE)
+            self._pending_writes += 1
+            if self._pending_writes >= self.COMMIT_INTERVAL:
+                self._connection.commit()
+                self._pending_writes = 0
 
-    # find paused related items and their indexes
-    process_paused_related_items(related_items)
-    related_items.to_csv(OUTPUT_FILE)
+    def get_missing(self, max_age: int = MISSING_ITEM_TTL) -> Dict[str, str]:
+        """
+        Returns the items found missing or inaccessible within the given age, and
+        forgets older ones so they are checked again.
 
-    # Optional graphing
-    if CREATE_GRAPH_HTML and GRAPH_FILE is not None:
-        import networkx as nx
-        from pyvis.network import Network
-
-        data_for_graph = related_items["Relationship Path"].tolist()
-        list_of_unique_items_and_types = (
-            related_items["Related Item Type"].tolist()
-            + related_items["Org item type"].tolist()
-        )
-        number_of_unique_item_types = len(set(list_of_unique_items_and_types))
-        sorted_unique_item_types = sorted(set(list_of_unique_items_and_types))
-        G = nx.Graph()
-        for path in data_for_graph:
-            for index, item in enumerate(path):
-                item_ago = Item(gis_con, item)
-                item_type = classify_by_type_typekeywords(item_ago)
-                G.add_node(
-                    item,
-                    title=f"<p>Open <a href='{PORTAL}/home/item.html?id={item}'>{item_type}</a></p>",
-                    label=f"{item_type}: {item_ago.title}",
-                    color=COLOR_MAP[item_type],
-                )
-            nx.add_path(G, path)
-        # if not running this script in a Notebook, make `notebook=False`
-        net = Network(notebook=True, select_menu=True, filter_menu=True)
-        net.from_nx(G)
-        for node in net.nodes:
-            node["color"] = COLOR_MAP[
-                classify_by_type_typekeywords(Item(gis_con, node["id"]))
-            ]
-        for edge in net.edges:
-            edge["color"] = "#0A0A0A"
-        net.show(GRAPH_FILE)
+        Args:
+            max_age (int, optional): Max age in seconds of the records. Defaults to
+                MISSING_ITEM_TTL.
+
+        Returns:
+            Dict[str, str]: Error message keyed by item ID.
+        """
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM missing_items WHERE checked < ?", (time.time() - max_age,)
+            )
+            self._connection.commit()
+            return dict(
+                self._connection.execute("SELECT item_id, error FROM missing_items")
+            )
+
+    def put_missing(self, missing: Dict[str, str]):
+        """
+        Stores the items found missing or inaccessible. Items already stored keep the
+        date they were first checked.
+
+        Args:
+            missing (Dict[str, str]): Error message keyed by item ID.
+        """
+        checked = time.time()
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO missing_items (item_id, error, checked) "
+                "VALUES (?, ?, ?)",
+                [(item_id, error, checked) for item_id, error in missing.items()],
+            )
+            self._connection.commit()
+
+    def close(self):
+        """
+        Commits pending writes and closes the SQLite file.
+        """
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
+
+    def report(self) -> str:
+        """
+        Summarizes the store usage of the run.
+
+        Returns:
+            str: Hit and miss counts of the run.
+        """
+        return f"Item data store: {self.hits} hits, {self.misses} misses"
+
+
+class ItemGraph:
+    """
+    Adjacency list of the crawled items, filled by crawl_item_graph. Each item is
+    fetched and expanded once, and the rows of every base ancestor are then derived from
+    this graph.
+
+    Attributes:
+        related_ids (Dict[str, List[str]]): Sorted related item IDs keyed by the ID of
+            the item whose data they were found in. Sorting makes the rows derived from
+            the graph independent of the order items were crawled or restored in.
+        errors (Dict[str, str]): Error message keyed by the ID of each item that could
+            not be fetched.
+        data_errors (Dict[str, str]): Error message keyed by the ID of each item whose
+            data could not be fetched.
+    """
+
+    def __init__(self):
+        self.related_ids: Dict[str, List[str]] = {}
+        self.errors: Dict[str, str] = {}
+        self.data_errors: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self.related_ids)
+
+    def is_crawled(self, item_id: str) -> bool:
+        """
+        Returns whether the item was already fetched, successfully or not.
+        """
+        return item_id in self.related_ids or item_id in self.errors
+
+    def add(
+        self,
+        item_id: str,
+        related_ids: Union[Set[str], None],
+        error: Union[str, None] = None,
+        data_error: Union[str, None] = None,
+    ) -> Set[str]:
+        """
+        Records the outcome of fetching an item.
+
+        Args:
+            item_id (str): The ID of the item.
+            related_ids (Union[Set[str], None]): The IDs found in the item's data.
+            error (Union[str, None], optional): Why the item could not be fetched.
+                Defaults to None.
+            data_error (Union[str, None], optional): Why the item's data could not be
+                fetched. Defaults to None.
+
+        Returns:
+            Set[str]: The related IDs recorded for the item.
+        """
+        if error is not None:
+            self.errors[item_id] = error
+            return set()
+        if data_error is not None:
+            self.data_errors[item_id] = data_error
+        self.related_ids[item_id] = sorted(related_ids)
+        return related_ids
+
+    def discard(self, item_ids: Iterable[str]):
+        """
+        Forgets what was crawled for the given items, so the next crawl fetches them
+        again.
+
+        Args:
+            item_ids (Iterable[str]): The IDs of the items.
+        """
+        for item_id in item_ids:
+            self.related_ids.pop(item_id, None)
+            self.errors.pop(item_id, None)
+            self.data_errors.pop(item_id, None)
+
+    def frontier(self, item_ids: Iterable[str]) -> List[str]:
+        """
+        Returns the items left to crawl: the given items and the items reachable from
+        them that were not fetched yet. Crawled items no longer reachable, such as the
+        items a modified item stopped referencing, are not followed.
+
+        Args:
+            item_ids (Iterable[str]): The IDs of the items the crawl starts from.
+
+        Returns:
+            List[str]: The IDs of the items left to crawl, without duplicates.
+        """
+        reachable = dict.fromkeys(item_ids)
+        # The list grows while it is iterated over, visiting the items level by level
+        visit = list(reachable)
+        for item_id in visit:
+            for related_id in self.related_ids.get(item_id, []):
+                if related_id not in reachable:
+                    reachable[related_id] = None
+                    visit.append(related_id)
+        return [item_id for item_id in reachable if not self.is_crawled(item_id)]
+
+
+class TraversalScope:
+    """
+    Limits the items a run records and follows, by category, depth from the closest
+    organization item, organization and ID.
+
+    Attributes:
+        org_id (Union[str, None]): The ID of the organization, None to treat every item
+            as internal.
+        max_depth (Union[int, None]): The max number of relationships followed from the
+            organization items.
+        categories (Union[Set[str], None]): The categories of the related items
+            recorded, None for all.
+        excluded_categories (Set[str]): The categories of the related items left out.
+        expand_external (bool): Whether items of other organizations are expanded.
+        unexpanded_ids (Set[str]): The IDs of items recorded but not expanded.
+        depths (Dict[str, int]): The depth of each item found by the crawl, only of the
+            organization items when max_depth is not set.
+        unexpanded (Set[str]): The IDs of the items the crawl did not expand.
+    """
+
+    def __init__(
+        self,
+        org_id: Union[str, None] = None,
+        max_depth: Union[int, None] = SCOPE_MAX_DEPTH,
+        categories: Union[List[str], None] = SCOPE_CATEGORIES,
+        excluded_categories: Iterable[str] = SCOPE_EXCLUDED_CATEGORIES,
+        expand_external: bool = SCOPE_EXPAND_EXTERNAL_ITEMS,
+        unexpanded_ids: Iterable[str] = SCOPE_UNEXPANDED_ITEM_IDS,
+    ):
+        """
+        Args:
+            org_id (Union[str, None], optional): The ID of the organization. Defaults to
+                None.
+            max_depth (Union[int, None], optional): Max relationships followed. Defaults
+                to SCOPE_MAX_DEPTH.
+            categories (Union[List[str], None], optional): Categories recorded. Defaults
+                to SCOPE_CATEGORIES.
+            excluded_categories (Iterable[str], optional): Categories left out. Defaults
+                to SCOPE_EXCLUDED_CATEGORIES.
+            expand_external (bool, optional): Whether to expand external items. Defaults
+                to SCOPE_EXPAND_EXTERNAL_ITEMS.
+            unexpanded_ids (Iterable[str], optional): Items not expanded. Defaults to
+                SCOPE_UNEXPANDED_ITEM_IDS.
+        """
+        self.org_id = org_id
+        self.max_depth = max_depth
+        self.categories = None if categories is None else set(categories)
+        self.excluded_categories = set(excluded_categories)
+        self.expand_external = expand_external
+        self.unexpanded_ids = set(unexpanded_ids)
+        self.depths: Dict[str, int] = {}
+        self.unexpanded: Set[str] = set()
+
+    def includes(self, item: Union[Item, dict]) -> bool:
+        """
+        Returns whether a related item is recorded, from its category.
+
+        Args:
+            item (Union[Item, dict]): The item, or its cached properties.
+        """
+        if self.categories is None and not self.excluded_categories:
+            return True
+        category = classify_by_type_typekeywords(
+            SimpleNamespace(
+                type=item.get("type"), typeKeywords=item.get("typeKeywords") or []
+            )
+        )
+        return (
+            self.categories is None or category in self.categories
+        ) and category not in self.excluded_categories
+
+    def expands(self, item: Union[Item, dict], depth: int = 0) -> bool:
+        """
+        Returns whether the related items of an item are followed. Organization items,
+        at depth 0, are always expanded.
+
+        Args:
+            item (Union[Item, dict]): The item, or its cached properties.
+            depth (int, optional): The depth of the item. Defaults to 0.
+        """
+        if depth == 0:
+            return True
+        if self.max_depth is not None and depth >= self.max_depth:
+            return False
+        if item.get("id") in self.unexpanded_ids:
+            return False
+        org_id = item.get("orgId")
+        if (
+            not self.expand_external
+            and None not in (self.org_id, org_id)
+            and org_id != self.org_id
+        ):
+            return False
+        return self.includes(item)
+
+    def depth(self, item_id: str) -> int:
+        """
+        Returns the depth of an item found by the crawl, 1 for related items when
+        max_depth is not set.
+        """
+        return self.depths.get(item_id, 1)
+
+    def start(self, item_graph: ItemGraph, item_ids: Iterable[str]):
+        """
+        Sets the depth of the organization items, and of the items already crawled from
+        them when an interrupted or previous crawl is continued.
+
+        Args:
+            item_graph (ItemGraph): The item graph the crawl continues.
+            item_ids (Iterable[str]): The IDs of the organization items.
+        """
+        self.unexpanded = set()
+        self.depths = dict.fromkeys(item_ids, 0)
+        if self.max_depth is None:
+            return
+        level = list(self.depths)
+        self.depths = {}
+        depth = 0
+        while level:
+            next_level = []
+            for item_id in level:
+                if item_id in self.depths:
+                    continue
+                self.depths[item_id] = depth
+                next_level.extend(item_graph.related_ids.get(item_id, []))
+            level = next_level
+            depth += 1
+
+    def found(
+        self,
+        item_graph: ItemGraph,
+        item_id: str,
+        related_ids: Set[str],
+        seen_ids: Set[str],
+    ) -> Set[str]:
+        """
+        Records the related IDs found in the data of an expanded item, and returns the
+        IDs left to crawl: the IDs not seen yet, and the items left unexpanded that are
+        now found within the max depth.
+
+        Args:
+            item_graph (ItemGraph): The item graph of the crawl.
+            item_id (str): The ID of the expanded item.
+            related_ids (Set[str]): The IDs found in its data.
+            seen_ids (Set[str]): The IDs already queued by the crawl.
+
+        Returns:
+            Set[str]: The IDs to crawl.
+        """
+        if self.max_depth is None:
+            return related_ids - seen_ids
+        lowered_ids = set()
+        # Lowers the depth of the related items and of the crawled items they lead to
+        stack = [(related_id, self.depths[item_id] + 1) for related_id in related_ids]
+        while stack:
+            related_id, depth = stack.pop()
+            if self.depths.get(related_id, depth + 1) <= depth:
+                continue
+            self.depths[related_id] = depth
+            lowered_ids.add(related_id)
+            stack.extend(
+                (child_id, depth + 1)
+                for child_id in item_graph.related_ids.get(related_id, [])
+            )
+        recrawled_ids = lowered_ids & self.unexpanded
+        self.unexpanded -= recrawled_ids
+        return (lowered_ids - seen_ids) | recrawled_ids
+
+
+class CrawlCheckpoint:
+    """
+    Saves the progress of a crawl to a gzip compressed JSON file, and restores it to
+    resume the crawl. Also saves the completed crawl of a run to STATE_FILE for
+    --incremental.
+
+    Attributes:
+        path (str): Location of the checkpoint file.
+        interval (int): Seconds between two saves by save_if_due.
+        run_date (int): Unix timestamp (in milliseconds) of the start of the run the
+            crawl belongs to.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        interval: int = CHECKPOINT_INTERVAL,
+        run_date: Union[int, None] = None,
+    ):
+        self.path = path
+        self.interval = interval
+        self.run_date = run_date if run_date is not None else int(time.time() * 1000)
+        self._last_save = time.time()
+
+    def save(self, item_ids: List[str], item_graph: ItemGraph, item_cache: ItemCache):
+        """
+        Saves the progress of the crawl, replacing the previous checkpoint.
+
+        Args:
+            item_ids (List[str]): The IDs of the items the crawl starts from.
+            item_graph (ItemGraph): The item graph crawled so far.
+            item_cache (ItemCache): The cache holding the metadata of the crawled items.
+        """
+        pending_ids = item_graph.frontier(item_ids)
+        state = {
+            "run_date": self.run_date,
+            "item_ids": list(item_ids),
+            "related_ids": item_graph.related_ids,
+            "errors": item_graph.errors,
+            "data_errors": item_graph.data_errors,
+            "pending_ids": pending_ids,
+            "items": item_cache.records(item_graph.related_ids),
+        }
+        # Write to a temporary file first so an interruption never leaves a partial
+        # checkpoint
+        temporary_path = f"{self.path}.tmp"
+        with gzip.open(temporary_path, "wt", encoding="utf-8") as checkpoint_file:
+            json.dump(state, checkpoint_file)
+        os.replace(temporary_path, self.path)
+        self._last_save = time.time()
+        print(
+            f"Crawl saved to {self.path}: {len(item_graph)} items crawled, "
+            f"{len(pending_ids)} pending"
+        )
+
+    def save_if_due(
+        self, item_ids: List[str], item_graph: ItemGraph, item_cache: ItemCache
+    ):
+        """
+        Saves the progress of the crawl if the last save is older than the checkpoint
+        interval. Takes the same arguments as save.
+        """
+        if time.time() - self._last_save >= self.interval:
+            self.save(item_ids, item_graph, item_cache)
+
+    def load(self, item_cache: ItemCache):
+        """
+        Restores the progress of a crawl and the date of its run, adding the saved item
+        metadata to the item cache.
+
+        Args:
+            item_cache (ItemCache): The cache to restore the metadata of the crawled
+                items in.
+
+        Returns:
+            tuple: The IDs of the items the crawl starts from, and the item graph
+                crawled so far.
+        """
+        with gzip.open(self.path, "rt", encoding="utf-8") as checkpoint_file:
+            state = json.load(checkpoint_file)
+        self.run_date = state["run_date"]
+        item_graph = ItemGraph()
+        item_graph.related_ids = state["related_ids"]
+        item_graph.errors = state["errors"]
+        item_graph.data_errors = state["data_errors"]
+        for record in state["items"]:
+            item_cache.add(record)
+        print(
+            f"Crawl loaded from {self.path}: {len(item_graph)} items crawled, "
+            f"{len(state['pending_ids'])} pending"
+        )
+        return state["item_ids"], item_graph
+
+    def remove(self):
+        """
+        Deletes the checkpoint file, once the run it belongs to has completed.
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class PathTable:
+    """
+    Relationship paths stored as a trie of interned item IDs. Each path is an integer
+    node holding its last item and its parent node, so paths sharing a prefix share its
+    nodes. Node 0 is the empty path.
+
+    Attributes:
+        ids (List[str]): The interned item IDs, by handle.
+    """
+
+    ROOT = 0
+
+    def __init__(self):
+        self.ids = []
+        self._handles = {}
+        # Parent node, item handle and length of the path of each node
+        self._parents = array("q", [-1])
+        self._items = array("q", [-1])
+        self._depths = array("q", [0])
+        # Node of each (parent node, item handle), keyed by parent node << 32 | item
+        # handle
+        self._children = {}
+
+    def __len__(self) -> int:
+        return len(self._parents)
+
+    def handle(self, item_id: str) -> int:
+        """
+        Returns the handle of an item ID, interning the ID the first time it is seen.
+        """
+        handle = self._handles.get(item_id)
+        if handle is None:
+            handle = self._handles[item_id] = len(self.ids)
+            self.ids.append(item_id)
+        return handle
+
+    def intern(self, item_id: str) -> str:
+        """
+        Returns the interned copy of an item ID, so equal IDs read from a file share one
+        string.
+        """
+        return self.ids[self.handle(item_id)]
+
+    def child(self, node: int, item_id: str) -> int:
+        """
+        Returns the node of a path extended with an item.
+
+        Args:
+            node (int): The node of the path.
+            item_id (str): The ID of the item appended to the path.
+
+        Returns:
+            int: The node of the extended path.
+        """
+        return self._child(node, self.handle(item_id))
+
+    def _child(self, node: int, handle: int) -> int:
+        key = node << 32 | handle
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = len(self._parents)
+            self._parents.append(node)
+            self._items.append(handle)
+            self._depths.append(self._depths[node] + 1)
+        return child
+
+    def extend(self, node: int, handles: Iterable[int]) -> int:
+        """
+        Returns the node of a path extended with items, given by their handles.
+        """
+        for handle in handles:
+            node = self._child(node, handle)
+        return node
+
+    def add(self, path: List[str]) -> int:
+        """
+        Returns the node of a list of item IDs.
+        """
+        return self.extend(self.ROOT, map(self.handle, path))
+
+    def depth(self, node: int) -> int:
+        """
+        Returns the number of items of a path.
+        """
+        return self._depths[node]
+
+    def handles(self, node: int) -> List[int]:
+        """
+        Returns the handles of the items of a path, from its first item.
+        """
+        handles = []
+        while node > 0:
+            handles.append(self._items[node])
+            node = self._parents[node]
+        handles.reverse()
+        return handles
+
+    def materialize(self, node: int) -> List[str]:
+        """
+        Returns a path as a list of item IDs.
+        """
+        return [self.ids[handle] for handle in self.handles(node)]
+
+    def contains(self, node: int, item_id: str) -> bool:
+        """
+        Tells whether an item is in a path.
+        """
+        handle = self._handles.get(item_id)
+        while handle is not None and node > 0:
+            if self._items[node] == handle:
+                return True
+            node = self._parents[node]
+        return False
+
+    def starts_with(self, node: int, prefix: int) -> bool:
+        """
+        Tells whether the path prefix is the start of the path of node.
+        """
+        for _ in range(self._depths[node] - self._depths[prefix]):
+            node = self._parents[node]
+        return node == prefix
+
+
+class RowAccumulator:
+    """
+    Collects output rows as one list per column, and builds a DataFrame from them once.
+    Relationship Path nodes of the path table are materialized as lists of item IDs.
+
+    Attributes:
+        columns (List[str]): The column names, in the order of the values of each row.
+        path_table (PathTable): The table of the Relationship Path nodes of the rows.
+    """
+
+    def __init__(self, columns: List[str], path_table: Union[PathTable, None] = None):
+        self.columns = list(columns)
+        self.path_table = path_table if path_table is not None else PathTable()
+        self._values = [[] for _ in self.columns]
+
+    def __len__(self) -> int:
+        return len(self._values[0])
+
+    def append(self, row: list):
+        """
+        Adds a row.
+
+        Args:
+            row (list): One value per column.
+        """
+        for values, value in zip(self._values, row):
+            values.append(value)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Builds a DataFrame of the rows collected so far.
+
+        Returns:
+            pd.DataFrame: The rows, indexed from 0 in the order they were added.
+        """
+        values = list(self._values)
+        if "Relationship Path" in self.columns:
+            path_column = self.columns.index("Relationship Path")
+            values[path_column] = [
+                self.path_table.materialize(path) if isinstance(path, int) else path
+                for path in values[path_column]
+            ]
+        return pd.DataFrame(dict(zip(self.columns, values)), columns=self.columns)
+
+    def clear(self):
+        """
+        Removes all collected rows.
+        """
+        self._values = [[] for _ in self.columns]
+
+
+class RowWriter(RowAccumulator):
+    """
+    Writes rows to a CSV or Parquet file in batches as they are added, replacing any
+    existing file. CSV files are written like DataFrame.to_csv, with the row number as
+    index.
+
+    Attributes:
+        path (str): Location of the output file.
+        output_format (str): "csv" or "parquet".
+        batch_size (int): Number of rows buffered before a batch is written, or None to
+            write once on close.
+        rows_written (int): Number of rows written to the file so far.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        columns: List[str],
+        output_format: str = OUTPUT_FORMAT,
+        batch_size: Union[int, None] = OUTPUT_BATCH_SIZE,
+        unique_column: Union[str, None] = None,
+        path_table: Union[PathTable, None] = None,
+    ):
+        """
+        Args:
+            path (str): Location of the output file.
+            columns (List[str]): The column names.
+            output_format (str, optional): "csv" or "parquet". Defaults to
+                OUTPUT_FORMAT.
+            batch_size (Union[int, None], optional): Rows per batch. Defaults to
+                OUTPUT_BATCH_SIZE.
+            unique_column (Union[str, None], optional): Column whose values are only
+                written once, skipping the rows with a value already added. Only these
+                values are remembered. Defaults to None, to write every row.
+            path_table (Union[PathTable, None], optional): The table of the Relationship
+                Path nodes of the rows. Defaults to None, for a new table.
+        """
+        super().__init__(columns, path_table)
+        if output_format not in ["csv", "parquet"]:
+            raise ValueError(f"Unsupported output format: {output_format}")
+        self.path = path
+        self.output_format = output_format
+        self.batch_size = batch_size
+        self.rows_written = 0
+        self._unique_column = (
+            None if unique_column is None else columns.index(unique_column)
+        )
+        self._unique_values = set()
+        self._started = False
+        self._parquet_writer = None
+
+    def append(self, row: list):
+        """
+        Adds a row, writing out the current batch once it is full.
+
+        Args:
+            row (list): One value per column.
+        """
+        if self._unique_column is not None:
+            if row[self._unique_column] in self._unique_values:
+                return
+            self._unique_values.add(row[self._unique_column])
+        super().append(row)
+        if self.batch_size is not None and len(self) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered rows to the file.
+        """
+        if self._started and len(self) == 0:
+            return
+        batch = self.to_dataframe()
+        batch.index += self.rows_written
+        self.clear()
+        self.write_formatted(self.format_rows(batch, self.output_format), len(batch))
+
+    @staticmethod
+    def format_rows(
+        batch: pd.DataFrame, output_format: str = OUTPUT_FORMAT, numbered: bool = True
+    ):
+        """
+        Formats rows as they are written to a file, without the CSV header. Rows can be
+        formatted in other processes and written in order with write_formatted.
+
+        Args:
+            batch (pd.DataFrame): The rows, indexed by their row number in the file.
+            output_format (str, optional): "csv" or "parquet". Defaults to
+                OUTPUT_FORMAT.
+            numbered (bool, optional): False to leave the CSV rows to be numbered by
+                write_formatted, for rows formatted before the number of the rows
+                written ahead of them is known. Defaults to True.
+
+        Returns:
+            Union[str, List[str], pyarrow.Table]: The CSV lines, or the Parquet table of
+                the rows. Unnumbered CSV rows are a list of one CSV line per row,
+                without the row number.
+        """
+        if output_format == "csv" and "Relationship Path" in batch.columns:
+            # Written as JSON lists, which read_rows parses back whatever the item IDs
+            batch = batch.assign(
+                **{
+                    "Relationship Path": [
+                        json.dumps(path) for path in batch["Relationship Path"]
+                    ]
+                }
+            )
+        if output_format == "csv" and not numbered:
+            # Formatted one row at a time, as to_csv does, so write_formatted can put
+            # the row number in front of each line whatever the values hold
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, lineterminator=os.linesep)
+            lines = []
+            for row in batch.itertuples(index=False, name=None):
+                writer.writerow(row)
+                lines.append(buffer.getvalue())
+                buffer.seek(0)
+                buffer.truncate()
+            return lines
+        if output_format == "csv":
+            return batch.to_csv(header=False)
+        import pyarrow as pa
+
+        schema = pa.schema(
+            [
+                (
+                    (column, pa.list_(pa.string()))
+                    if column == "Relationship Path"
+                    else (column, pa.string())
+                )
+                for column in batch.columns
+            ]
+        )
+        return pa.Table.from_pandas(batch, schema=schema, preserve_index=False)
+
+    def write_formatted(self, formatted, row_count: int):
+        """
+        Writes rows formatted by format_rows after the rows already written. Buffered
+        rows are written first.
+
+        Args:
+            formatted (Union[str, List[str], pyarrow.Table]): The formatted rows,
+                numbered from rows_written or left unnumbered.
+            row_count (int): The number of rows.
+        """
+        if len(self) > 0:
+            self.flush()
+        if isinstance(formatted, list):
+            formatted = "".join(
+                f"{number},{line}"
+                for number, line in enumerate(formatted, self.rows_written)
+            )
+        if self.output_format == "csv":
+            # Lines already end with the line terminator of to_csv
+            with open(
+                self.path, "a" if self._started else "w", encoding="utf-8", newline=""
+            ) as file:
+                if not self._started:
+                    file.write(pd.DataFrame(columns=self.columns).to_csv())
+                file.write(formatted)
+        else:
+            import pyarrow.parquet as pq
+
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, formatted.schema)
+            self._parquet_writer.write_table(formatted)
+        self._started = True
+        self.rows_written += row_count
+
+    def close(self):
+        """
+        Writes the remaining rows and closes the file.
+        """
+        self.flush()
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+
+
+def read_rows(
+    path: str,
+    output_format: str = OUTPUT_FORMAT,
+    path_table: Union[PathTable, None] = None,
+) -> pd.DataFrame:
+    """
+    Reads back an output file written by RowWriter.
+
+    Args:
+        path (str): Location of the output file.
+        output_format (str, optional): "csv" or "parquet". Defaults to OUTPUT_FORMAT.
+        path_table (Union[PathTable, None], optional): Table to add the relationship
+            paths to. Defaults to None.
+
+    Returns:
+        pd.DataFrame: The rows, with the Relationship Path column as nodes of
+            path_table, or as lists of item IDs sharing one string per ID without a path
+            table.
+    """
+    if output_format == "parquet":
+        rows = pd.read_parquet(path)
+        paths = (list(path) for path in rows["Relationship Path"].tolist())
+    else:
+        # Keep "NA" and empty values as written, instead of reading them as missing
+        # values
+        rows = pd.read_csv(path, index_col=0, keep_default_na=False, dtype=str)
+        paths = (json.loads(path) for path in rows["Relationship Path"].tolist())
+    if path_table is not None:
+        rows["Relationship Path"] = pd.Series(
+            [path_table.add(path) for path in paths], index=rows.index, dtype=object
+        )
+    else:
+        item_ids = PathTable()
+        rows["Relationship Path"] = pd.Series(
+            [[item_ids.intern(item_id) for item_id in path] for path in paths],
+            index=rows.index,
+            dtype=object,
+        )
+    return rows
+
+
+class DependencyIndex:
+    """
+    Index of the relationships found by a run, in a SQLite file, answering what depends
+    on an item and what it depends on without crawling again. Rebuilt from the related
+    items rows at the end of each run.
+
+    Attributes:
+        path (str): Location of the SQLite file.
+    """
+
+    # Tables, and indexes created once the tables are filled
+    TABLES = (
+        "CREATE TABLE IF NOT EXISTS items ("
+        "item_id TEXT PRIMARY KEY, type TEXT, title TEXT, sharing TEXT, owner TEXT, "
+        "org TEXT, org_item INTEGER NOT NULL);"
+        "CREATE TABLE IF NOT EXISTS edges (parent TEXT NOT NULL, child TEXT NOT NULL);"
+        "CREATE TABLE IF NOT EXISTS paths ("
+        "org_item TEXT NOT NULL, item_id TEXT NOT NULL, depth INTEGER NOT NULL, "
+        "path TEXT NOT NULL);"
+    )
+    INDEXES = (
+        "CREATE INDEX IF NOT EXISTS edges_parent ON edges (parent);"
+        "CREATE INDEX IF NOT EXISTS edges_child ON edges (child);"
+        "CREATE INDEX IF NOT EXISTS paths_item_id ON paths (item_id);"
+    )
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript(self.TABLES + self.INDEXES)
+
+    @classmethod
+    def build(cls, path: str, related_df: pd.DataFrame) -> "DependencyIndex":
+        """
+        Builds the index of the given related items rows, replacing any index at the
+        path.
+
+        Args:
+            path (str): Location of the SQLite file.
+            related_df (pd.DataFrame): The related items rows, with the paused items
+                expanded.
+
+        Returns:
+            DependencyIndex: The new index.
+        """
+        # Plain lists are much faster to iterate than the columns of the DataFrame
+        columns = {column: related_df[column].tolist() for column in related_df.columns}
+        items = {}
+        for item_id, item_type, title, sharing, owner, org in zip(
+            columns["Related Item Id"],
+            columns["Related Item Type"],
+            columns["Related Item Title"],
+            columns["Related Item Sharing"],
+            columns["Related Item Owner"],
+            columns["Related Item Org"],
+        ):
+            items[item_id] = [item_id, item_type, title, sharing, owner, org, 0]
+        for item_id, item_type, title, sharing, owner in zip(
+            columns["Organization Item"],
+            columns["Org item type"],
+            columns["Org item Title"],
+            columns["Org Item Sharing"],
+            columns["Org item owner"],
+        ):
+            if item_id in items:
+                items[item_id][6] = 1
+            else:
+                items[item_id] = [item_id, item_type, title, sharing, owner, None, 1]
+        edges = set()
+        paths = []
+        for org_item, item_id, relationship_path in zip(
+            columns["Organization Item"],
+            columns["Related Item Id"],
+            columns["Relationship Path"],
+        ):
+            edges.update(zip(relationship_path, relationship_path[1:]))
+            paths.append(
+                (
+                    org_item,
+                    item_id,
+                    len(relationship_path) - 1,
+                    "/".join(relationship_path),
+                )
+            )
+        # Written next to the index and moved over it once complete, so queries never
+        # see a partial index
+        temporary_path = f"{path}.tmp"
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        connection = sqlite3.connect(temporary_path)
+        # The file is discarded if the build fails, so it does not need a journal
+        connection.executescript(
+            "PRAGMA journal_mode = OFF; PRAGMA synchronous = OFF;" + cls.TABLES
+        )
+        with connection:
+            connection.executemany(
+                "INSERT INTO items VALUES (?, ?, ?, ?, ?, ?, ?)", items.values()
+            )
+            connection.executemany("INSERT INTO edges VALUES (?, ?)", sorted(edges))
+            connection.executemany("INSERT INTO paths VALUES (?, ?, ?, ?)", paths)
+        connection.executescript(cls.INDEXES)
+        connection.close()
+        os.replace(temporary_path, path)
+        return cls(path)
+
+    def _items(self, query: str, item_id: str) -> List[dict]:
+        columns = ["item_id", "type", "title", "sharing", "owner", "org"]
+        return [
+            dict(zip(columns, row[:-1]), org_item=bool(row[-1]))
+            for row in self._connection.execute(query, (item_id,))
+        ]
+
+    def upstream(self, item_id: str) -> List[dict]:
+        """
+        Returns the items that depend on an item, directly or through other items: the
+        items that would break if it were deleted.
+
+        Args:
+            item_id (str): The ID of the item.
+
+        Returns:
+            List[dict]: The details of the items, organization items first.
+        """
+        return self._items(
+            "WITH RECURSIVE dependents (item_id) AS ("
+            "SELECT parent FROM edges WHERE child = ? "
+            "UNION SELECT parent FROM edges JOIN dependents "
+            "ON child = dependents.item_id) "
+            "SELECT items.item_id, type, title, sharing, owner, org, org_item "
+            "FROM dependents JOIN items USING (item_id) "
+            "ORDER BY org_item DESC, type, title",
+            item_id,
+        )
+
+    def downstream(self, item_id: str) -> List[dict]:
+        """
+        Returns the items an item depends on, directly or through other items.
+
+        Args:
+            item_id (str): The ID of the item.
+
+        Returns:
+            List[dict]: The details of the items.
+        """
+        return self._items(
+            "WITH RECURSIVE dependencies (item_id) AS ("
+            "SELECT child FROM edges WHERE parent = ? "
+            "UNION SELECT child FROM edges JOIN dependencies "
+            "ON parent = dependencies.item_id) "
+            "SELECT items.item_id, type, title, sharing, owner, org, org_item "
+            "FROM dependencies JOIN items USING (item_id) ORDER BY type, title",
+            item_id,
+        )
+
+    def paths_to(self, item_id: str) -> List[List[str]]:
+        """
+        Returns the relationship paths from organization items to an item, shortest
+        first.
+
+        Args:
+            item_id (str): The ID of the item.
+
+        Returns:
+            List[List[str]]: The item IDs of each path, from the organization item to
+                the item.
+        """
+        return [
+            path.split("/")
+            for (path,) in self._connection.execute(
+                "SELECT path FROM paths WHERE item_id = ? ORDER BY depth, path",
+                (item_id,),
+            )
+        ]
+
+    def get(self, item_id: str) -> Union[dict, None]:
+        """
+        Returns the details of an item, or None if no relationship of the item was
+        found.
+        """
+        items = self._items(
+            "SELECT item_id, type, title, sharing, owner, org, org_item "
+            "FROM items WHERE item_id = ?",
+            item_id,
+        )
+        return items[0] if items else None
+
+    def close(self):
+        """
+        Closes the SQLite file.
+        """
+        self._connection.close()
+
+
+def print_dependencies(index: DependencyIndex, item_id: str, downstream: bool = False):
+    """
+    Prints the items that depend on an item, with the paths from organization items to
+    it, or the items it depends on.
+
+    Args:
+        index (DependencyIndex): The index of the last run.
+        item_id (str): The ID of the item.
+        downstream (bool, optional): Whether to print the items it depends on instead.
+            Defaults to False.
+    """
+    item = index.get(item_id)
+    if item is None:
+        print(f"{item_id}: no relationship found in {index.path}")
+        return
+    related_items = index.downstream(item_id) if downstream else index.upstream(item_id)
+    print(
+        f"{item['type']}: {item['title']} ({item_id}, owner {item['owner']}, "
+        f"{item['sharing']}) {'depends on' if downstream else 'is used by'} "
+        f"{len(related_items)} items"
+    )
+    for related_item in related_items:
+        print(
+            f"  {'*' if related_item['org_item'] else ' '} {related_item['item_id']}  "
+            f"{related_item['type']}: {related_item['title']} "
+            f"(owner {related_item['owner']}, {related_item['sharing']})"
+        )
+    if not downstream:
+        paths = index.paths_to(item_id)
+        print(f"  * organization items. Relationship paths to {item_id}: {len(paths)}")
+        for path in paths:
+            print(f"    {' > '.join(path)}")
+
+
+class AsyncItemFetcher:
+    """
+    Fetches item details, item data and StoryMap resources from the sharing REST API
+    with aiohttp, sharing one connection pool. Use as an async context manager.
+
+    Attributes:
+        rest_url (str): Sharing REST API root, e.g.
+            "https://www.arcgis.com/sharing/rest".
+        token (str): Token appended to every request, or None for anonymous access.
+        max_concurrency (int): Max number of requests in flight.
+    """
+
+    def __init__(
+        self, rest_url: str, token: str = None, max_concurrency: int = MAX_WORKERS
+    ):
+        # aiohttp is only required when this backend is used
+        import aiohttp
+
+        self._aiohttp = aiohttp
+        self.rest_url = rest_url.rstrip("/")
+        self.token = token
+        self.max_concurrency = max_concurrency
+        self._session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._session = self._aiohttp.ClientSession(
+            connector=self._aiohttp.TCPConnector(limit=self.max_concurrency)
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._session.close()
+
+    async def _get_json(self, path: str, params: dict = None, api_call: bool = True):
+        """
+        Sends a GET request to the REST API through request_scheduler, retrying
+        retryable errors, and parses the response as JSON.
+
+        Args:
+            path (str): Path of the endpoint below the REST API root.
+            params (dict, optional): Query parameters. Defaults to None.
+            api_call (bool, optional): Whether the endpoint is an API call answering
+                with `f=json`, rather than stored content such as item data or a
+                resource. Defaults to True.
+
+        Returns:
+            The parsed JSON, or None if stored content is not JSON.
+
+        Raises:
+            Exception: On HTTP errors, and on error responses.
+        """
+        params = dict(params or {})
+        if api_call:
+            params["f"] = "json"
+        if self.token:
+            params["token"] = self.token
+        if path == "search":
+            endpoint = "search"
+        elif "/resources" in path:
+            endpoint = "resources"
+        elif path.endswith("/data"):
+            endpoint = "data"
+        else:
+            endpoint = "item"
+        return await request_scheduler.call_async(
+            endpoint, self._send, f"{self.rest_url}/{path}", params, api_call
+        )
+
+    async def _send(self, url: str, params: dict, api_call: bool):
+        async with self._semaphore:
+            async with self._session.get(url, params=params) as response:
+                response.raise_for_status()
+                body = await response.read()
+        try:
+            result = json.loads(body)
+        except ValueError:
+            if api_call:
+                raise
+            return None
+        # The REST API reports errors such as missing items, expired tokens or
+        # throttling in the body of a successful response, for stored content too
+        if isinstance(result, dict) and isinstance(result.get("error"), dict):
+            error = result["error"]
+            raise Exception(f"{error.get('message')} (Error Code: {error.get('code')})")
+        return result
+
+    async def fetch_item(self, item_id: str) -> dict:
+        """
+        Fetches the details of an item. Like every request of this class, retryable
+        errors are retried by request_scheduler.
+
+        Args:
+            item_id (str): The ID of the item to fetch.
+
+        Returns:
+            dict: The item JSON.
+        """
+        return await self._get_json(f"content/items/{item_id}")
+
+    async def search_items(self, item_ids: List[str]) -> List[dict]:
+        """
+        Looks up the details of several items with a single "id:(a OR b OR ...)" search.
+
+        Args:
+            item_ids (List[str]): The IDs of the items.
+
+        Returns:
+            List[dict]: The items JSON of the items found.
+        """
+        result = await self._get_json(
+            "search", {"q": f"id:({' OR '.join(item_ids)})", "num": len(item_ids)}
+        )
+        return result["results"]
+
+    async def fetch_item_data(self, item: dict) -> tuple:
+        """
+        Fetches data for an item, handling StoryMap resources the same way as
+        fetch_item_data.
+
+        Args:
+            item (dict): The item JSON as returned by fetch_item.
+
+        Returns:
+            tuple: A tuple containing the item data and any related data.
+        """
+        item_path = f"content/items/{item['id']}"
+        if item["type"] not in ["StoryMap", "StoryMap Theme"]:
+            return (await self._get_json(f"{item_path}/data", api_call=False), None)
+        # Should only be relevant to StoryMaps
+        try:
+            draft_id = None
+            for keyword in item.get("typeKeywords") or []:
+                if keyword.startswith("smdraftresourceid"):
+                    draft_id = keyword.split(":")[1]
+
+            def get_resource(name: str):
+                return self._get_json(f"{item_path}/resources/{name}", api_call=False)
+
+            listing = await self._get_json(f"{item_path}/resources", {"num": 1000})
+            resources = [resource["resource"] for resource in listing["resources"]]
+            has_published_data = "published_data.json" in resources
+            if has_published_data and not draft_id:
+                return (await get_resource("published_data.json"), None)
+            elif draft_id and not has_published_data:
+                return (await get_resource(f"{draft_id}"), None)
+            elif draft_id and has_published_data:
+                return tuple(
+                    await asyncio.gather(
+                        get_resource(f"{draft_id}"),
+                        get_resource("published_data.json"),
+                    )
+                )
+            else:
+                return (await get_resource("draft.json"), None)
+        except AuthenticationError:
+            raise
+        except Exception as e:
+            return (None, None)
+
+
+def classify_by_type_typekeywords(item: Item) -> str:
+    """
+    Classifies an ArcGIS item based on its type keywords.
+
+    Args:
+        item (Item): The ArcGIS item to classify.
+
+    Returns:
+        str: The classification of the item.
+    """
+    typekeywords = item.typeKeywords
+    isTemplate = "storymaptemplate" in typekeywords
+    if "storymapbriefing" in typekeywords and "StoryMap" in typekeywords:
+        return "Briefing"
+    if "storymapcollection" in typekeywords and "StoryMap" in typekeywords:
+        return "Collection"
+    if "storymapframe" in typekeywords and "StoryMap" in typekeywords:
+        return "Frame"
+    if "StoryMap Theme" in typekeywords:
+        return "Theme"
+    if "StoryMap" in typekeywords:
+        return "StoryMap Template" if isTemplate else "StoryMap"
+    # Not a storymap return the type if it is in color map else return other
+    if item.type in COLOR_MAP:
+        return item.type
+    else:
+        return "other"
+
+
+def get_all_content_items_in_org(
+    gis_con: GIS,
+    owner: Union[str, List[str], None] = None,
+    max_workers: int = MAX_WORKERS,
+    item_cache: Union[ItemCache, None] = None,
+) -> Set[str]:
+    """
+    Retrieves all items of the given accounts, or of the whole organization, created
+    since QUERY_START_DATE. The created date range is split into buckets of at most
+    SEARCH_RESULT_LIMIT items, searched concurrently.
+
+    Args:
+        gis_con (GIS): The GIS connection object.
+        owner (Union[str, List[str], None], optional): The owner, or list of owners, to
+            filter items. Pass "*" for every item of the organization. If not passed
+            will default to logged in user.
+        max_workers (int, optional): Number of searches run concurrently. Defaults to
+            MAX_WORKERS.
+        item_cache (Union[ItemCache, None], optional): Cache to store the metadata of
+            the items found in, so they are not looked up again while crawling. Defaults
+            to None.
+
+    Returns:
+        Set[str]: A set of item IDs found.
+    """
+    run_date = int(time.time() * 1000)
+    if owner is None:
+        owner = gis_con.users.me.username
+    if owner == "*":
+        base_query = f"orgid:{gis_con.properties.id}"
+    else:
+        owners = [owner] if isinstance(owner, str) else owner
+        base_query = "(" + " OR ".join(f"owner:{name}" for name in owners) + ")"
+    found_ids = set()
+
+    def count_items(start_date: int, end_date: int) -> int:
+        query = f"{base_query} AND created:[{start_date} TO {end_date}]"
+        return request_scheduler.call(
+            "search", gis_con.content.advanced_search, query=query, return_count=True
+        )
+
+    def search_page(start_date: int, end_date: int, start: int) -> List[str]:
+        if TEST_MAX_FOUND_ITEMS is not None and len(found_ids) > TEST_MAX_FOUND_ITEMS:
+            return []
+        query = f"{base_query} AND created:[{start_date} TO {end_date}]"
+        print(f"Query: {query} (start {start})")
+        result = request_scheduler.call(
+            "search",
+            gis_con.content.advanced_search,
+            query=query,
+            max_items=SEARCH_PAGE_SIZE,
+            start=start,
+            sort_field="created",
+            sort_order="asc",
+            as_dict=True,
+        )
+        if item_cache is not None:
+            item_cache.add_search_results(result["results"])
+        return [item["id"] for item in result["results"]]
+
+    # Start with one bucket per worker so the first counts already run concurrently
+    bucket_size = (run_date - QUERY_START_DATE) // max_workers + 1
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    # Maps each search to its bucket, and to the start of the page for page searches
+    # (None for counts)
+    pending = {
+        executor.submit(
+            count_items, start_date, min(start_date + bucket_size - 1, run_date)
+        ): (start_date, min(start_date + bucket_size - 1, run_date), None)
+        for start_date in range(QUERY_START_DATE, run_date + 1, bucket_size)
+    }
+    try:
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                start_date, end_date, start = pending.pop(future)
+                if start is not None:
+                    found_ids.update(future.result())
+                    print(f"Total items found: {len(found_ids)}")
+                    continue
+                total = future.result()
+                if total > SEARCH_RESULT_LIMIT and start_date < end_date:
+                    middle_date = (start_date + end_date) // 2
+                    for bucket in [
+                        (start_date, middle_date),
+                        (middle_date + 1, end_date),
+                    ]:
+                        pending[executor.submit(count_items, *bucket)] = (*bucket, None)
+                    continue
+                if total > SEARCH_RESULT_LIMIT:
+                    print(
+                        f"Warning: {total} items were created at {start_date}, "
+                        f"only the first {SEARCH_RESULT_LIMIT} can be retrieved"
+                    )
+                for start in range(
+                    0, min(total, SEARCH_RESULT_LIMIT), SEARCH_PAGE_SIZE
+                ):
+                    future = executor.submit(search_page, start_date, end_date, start)
+                    pending[future] = (start_date, end_date, start)
+    finally:
+        executor.shutdown(cancel_futures=True)
+    return found_ids
+
+
+def get_item_data(item: Item, data_store: Union[ItemDataStore, None] = None):
+    """
+    Returns the data for a given ArcGIS item. When a data store is given, the data is
+    read from it if the item has not been modified since it was stored, and fetched and
+    stored otherwise.
+
+    Args:
+        item (Item): The ArcGIS item to get data for.
+        data_store (Union[ItemDataStore, None], optional): Store to read and write item
+            data. Defaults to None.
+
+    Returns:
+        tuple: A tuple containing the item data and any related data.
+    """
+    modified = item.get("modified", None)
+    if data_store is None or modified is None:
+        return fetch_item_data(item)
+    item_data = data_store.get(item.itemid, modified)
+    if item_data is None:
+        item_data = fetch_item_data(item)
+        # A StoryMap whose resources could not be read may only be temporarily
+        # unavailable
+        if item_data != (None, None):
+            data_store.put(item.itemid, modified, item_data)
+    return item_data
+
+
+def fetch_item_data(item: Item):
+    """
+    Fetches data for a given ArcGIS item from the portal, handling different resource
+    types.
+
+    Args:
+        item (Item): The ArcGIS item to fetch data for.
+
+    Returns:
+        tuple: A tuple containing the item data and any related data.
+    """
+    item_data = request_scheduler.call("data", item.get_data, try_json=True)
+    if item.type in ["StoryMap", "StoryMap Theme"]:
+        # Should only be relevant to StoryMaps
+        def get_resource(name: str):
+            return request_scheduler.call(
+                "resources", item.resources.get, name, try_json=True
+            )
+
+        try:
+            resources = [
+                resource["resource"]
+                for resource in request_scheduler.call("resources", item.resources.list)
+            ]
+            has_published_data = "published_data.json" in resources
+            draft_id = None
+            for keyword in item.typeKeywords:
+                if keyword.startswith("smdraftresourceid"):
+                    draft_id = keyword.split(":")[1]
+            if has_published_data and not draft_id:
+                return (get_resource("published_data.json"), None)
+            elif draft_id and not has_published_data:
+                return (get_resource(f"{draft_id}"), None)
+            elif draft_id and has_published_data:
+                return (
+                    get_resource(f"{draft_id}"),
+                    get_resource("published_data.json"),
+                )
+            else:
+                return (get_resource("draft.json"), None)
+        except AuthenticationError:
+            raise
+        except Exception as e:
+            return (None, None)
+    return (item_data, None)
+
+
+# Item IDs are 32 lowercase hex characters delimited by quotes, slashes, or the start or
+# end of a string (\x00). Starting the pattern with the delimiter lets the regex engine
+# skip ahead to the next delimiter
+ITEM_ID_PATTERN = re.compile(r"[\x00\"\'\/]([0-9a-f]{32})(?=[\x00\"\'\/])")
+# Number of characters of item data searched for item IDs at once
+ID_SEARCH_CHUNK_SIZE = 1 << 20
+
+
+def find_all_possible_ids(json_string: str):
+    """
+    Extracts all possible item IDs from a string using regex.
+
+    Args:
+        json_string (str): The string to search for IDs.
+
+    Returns:
+        list: A list of found item IDs.
+    """
+    return ITEM_ID_PATTERN.findall(f"\x00{json_string}\x00")
+
+
+def find_possible_ids_in_data(data) -> Set[str]:
+    """
+    Extracts all possible item IDs from parsed JSON data, walking it once and searching
+    its strings in chunks of about ID_SEARCH_CHUNK_SIZE characters.
+
+    Args:
+        data: The parsed JSON data (dicts, lists and scalars), or a string.
+
+    Returns:
+        Set[str]: The item IDs found.
+    """
+    found_ids = set()
+    strings = []
+    strings_size = 0
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if type(value) is dict:
+            children = chain(value, value.values())
+        elif type(value) is list:
+            children = value
+        else:
+            children = (value,)
+        for child in children:
+            if type(child) is str:
+                if len(child) >= 32:
+                    strings.append(child)
+                    strings_size += len(child)
+                    if strings_size >= ID_SEARCH_CHUNK_SIZE:
+                        found_ids.update(find_all_possible_ids("\x00".join(strings)))
+                        strings = []
+                        strings_size = 0
+            elif type(child) is dict or type(child) is list:
+                stack.append(child)
+    found_ids.update(find_all_possible_ids("\x00".join(strings)))
+    return found_ids
+
+
+def find_related_ids(item_data: tuple) -> Set[str]:
+    """
+    Collects the potential item IDs found in the data of an item.
+
+    Args:
+        item_data (tuple): The item data as returned by get_item_data.
+
+    Returns:
+        Set[str]: The IDs found in the item data and, for StoryMaps, in the draft data.
+    """
+    with run_stats.timed("extract ids"):
+        related_ids = find_possible_ids_in_data(item_data[0])
+        # The second part of the fetched data is only relevant to StoryMaps, and
+        # considers draft related items
+        related_ids.update(find_possible_ids_in_data(item_data[1]))
+    return related_ids
+
+
+def error_status(error: Exception) -> Union[int, None]:
+    """
+    Returns the HTTP status code of an error of a request to the portal, read from the
+    exception or from the "(Error Code: ...)" of ArcGIS API for Python errors, or None
+    if it has none.
+
+    Args:
+        error (Exception): The error raised by the request.
+
+    Returns:
+        Union[int, None]: The status code.
+    """
+    status = getattr(error, "status", None)
+    if status is None:
+        match = re.search(r"Error Code: (\d+)", str(error))
+        if match is not None:
+            status = int(match.group(1))
+        elif "too many requests" in str(error).lower():
+            status = 429
+    return status
+
+
+def retry_after(error: Exception) -> Union[float, None]:
+    """
+    Returns the seconds a throttled request asked to wait, from the Retry-After header
+    of the response.
+
+    Args:
+        error (Exception): The error raised by the request.
+
+    Returns:
+        Union[float, None]: The seconds to wait, or None if the response did not say.
+    """
+    headers = getattr(error, "headers", None)
+    value = headers.get("Retry-After") if headers else None
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        # Retry-After can also be an HTTP date
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    Returns whether an error fetching an item may go away when retried. Errors with an
+    HTTP status code (see error_status) are retryable if the code is in
+    RETRYABLE_STATUS_CODES. Others, such as timeouts and connection errors, are
+    retryable.
+
+    Args:
+        error (Exception): The error raised when fetching the item.
+
+    Returns:
+        bool: False for permanent errors, such as items that do not exist or are
+            inaccessible.
+    """
+    status = error_status(error)
+    return status is None or status in RETRYABLE_STATUS_CODES
+
+
+def is_missing_item_error(error: Exception) -> bool:
+    """
+    Returns whether an error fetching an item means the item does not exist or is
+    inaccessible, so it is not requested again for MISSING_ITEM_TTL seconds.
+
+    Args:
+        error (Exception): The error raised when fetching the item.
+
+    Returns:
+        bool: True if the status code of the error is in MISSING_STATUS_CODES.
+    """
+    return error_status(error) in MISSING_STATUS_CODES
+
+
+def retry_delay(tries: int) -> float:
+    """
+    Returns the seconds to wait before the next attempt once tries + 1 attempts failed:
+    a random delay up to RETRY_BASE_DELAY doubled on each retry, so concurrent workers
+    do not retry in step.
+
+    Args:
+        tries (int): The index of the failed attempt, starting at 0.
+
+    Returns:
+        float: The delay in seconds.
+    """
+    return random.uniform(0, RETRY_BASE_DELAY * 2**tries)
+
+
+def fetch_item(
+    gis_con: GIS, item_id: str, item_cache: Union[ItemCache, None] = None
+) -> Item:
+    """
+    Fetches an item through request_scheduler, making up to RETRY_ATTEMPTS attempts.
+    Permanent errors, such as items that do not exist or are inaccessible, are raised on
+    the first attempt.
+
+    Args:
+        gis_con (GIS): The GIS connection object.
+        item_id (str): The ID of the item to fetch.
+        item_cache (Union[ItemCache, None], optional): Cache to read item metadata from,
+            and to remember missing items in. Defaults to None.
+
+    Returns:
+        Item: The fetched item.
+
+    Raises:
+        Exception: The permanent error, or the error of the last attempt if all attempts
+            failed.
+    """
+    if item_cache is not None:
+        return item_cache.get_item(item_id)
+    return request_scheduler.call("item", Item, gis_con, item_id)
+
+
+def _record_crawled_item(
+    item_graph: ItemGraph,
+    result: tuple,
+    seen_ids: Set[str],
+    scope: Union[TraversalScope, None] = None,
+) -> Set[str]:
+    # Records the outcome of fetching an item, as given to ItemGraph.add, and returns
+    # the IDs left to crawl it leads to. Items outside of the traversal scope have
+    # neither related IDs nor an error
+    item_id, related_ids, error, _ = result
+    if related_ids is None and error is None:
+        scope.unexpanded.add(item_id)
+        return set()
+    related_ids = item_graph.add(*result)
+    if scope is None:
+        return related_ids - seen_ids
+    return scope.found(item_graph, item_id, related_ids, seen_ids)
+
+
+def crawl_item_graph(
+    gis_con: GIS,
+    item_ids: Iterable[str],
+    item_cache: ItemCache,
+    data_store: Union[ItemDataStore, None] = None,
+    max_workers: int = MAX_WORKERS,
+    item_graph: Union[ItemGraph, None] = None,
+    checkpoint: Union[CrawlCheckpoint, None] = None,
+    scope: Union[TraversalScope, None] = None,
+) -> ItemGraph:
+    """
+    Fetches every item reachable from the given items once, using a pool of worker
+    threads, and records the related IDs found in their data in the item graph. Item
+    details are looked up in batches with ItemCache.prefetch.
+
+    Args:
+        gis_con (GIS): The GIS connection object.
+        item_ids (Iterable[str]): The IDs of the items to start from.
+        item_cache (ItemCache): Cache to store fetched item metadata in.
+        data_store (Union[ItemDataStore, None], optional): Store to read unchanged item
+            data from. Defaults to None.
+        max_workers (int, optional): Number of worker threads. Defaults to MAX_WORKERS.
+        item_graph (Union[ItemGraph, None], optional): Item graph of an interrupted
+            crawl to continue. Defaults to None.
+        checkpoint (Union[CrawlCheckpoint, None], optional): Where to save progress
+            periodically and on Ctrl-C. Defaults to None.
+        scope (Union[TraversalScope, None], optional): The items whose data is fetched
+            and searched for related IDs. Items outside of it are fetched but left out
+            of the item graph. Defaults to None, expanding every item.
+
+    Returns:
+        ItemGraph: The related IDs of every fetched item, and the errors of items that
+            could not be fetched.
+    """
+    item_ids = list(item_ids)
+    if item_graph is None:
+        item_graph = ItemGraph()
+
+    def fetch_related_ids(item_id: str):
+        # Runs in a worker thread; the item graph is only updated from the calling
+        # thread
+        try:
+            item = fetch_item(gis_con, item_id, item_cache)
+        except AuthenticationError:
+            raise
+        except Exception as e:
+            return item_id, None, str(e), None
+        if scope is not None and not scope.expands(item, scope.depth(item_id)):
+            return item_id, None, None, None
+        try:
+            return (
+                item_id,
+                find_related_ids(get_item_data(item, data_store)),
+                None,
+                None,
+            )
+        except AuthenticationError:
+            raise
+        except Exception as e:
+            return item_id, set(), None, str(e)
+
+    if scope is not None:
+        scope.start(item_graph, item_ids)
+    frontier = item_graph.frontier(item_ids)
+    seen_ids = set(item_graph.related_ids) | set(item_graph.errors) | set(frontier)
+    # IDs waiting for their details to be looked up in a batch
+    to_resolve = frontier
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    # Maps each task to the ID of the item it fetches, or to the batch of IDs it looks
+    # up
+    pending = {}
+    try:
+        while True:
+            while to_resolve and (
+                len(to_resolve) >= ITEM_SEARCH_BATCH_SIZE or len(pending) < max_workers
+            ):
+                batch = to_resolve[:ITEM_SEARCH_BATCH_SIZE]
+                to_resolve = to_resolve[ITEM_SEARCH_BATCH_SIZE:]
+                pending[executor.submit(item_cache.prefetch, batch)] = batch
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = pending.pop(future)
+                future.result()
+                if isinstance(task, list):
+                    for item_id in task:
+                        pending[executor.submit(fetch_related_ids, item_id)] = item_id
+                    continue
+                for related_id in _record_crawled_item(
+                    item_graph, future.result(), seen_ids, scope
+                ):
+                    seen_ids.add(related_id)
+                    to_resolve.append(related_id)
+            fetched = len(item_graph) + len(item_graph.errors)
+            run_stats.progress(f"Crawling: {fetched} of {len(seen_ids)} items fetched")
+            if checkpoint is not None:
+                checkpoint.save_if_due(item_ids, item_graph, item_cache)
+    except (KeyboardInterrupt, AuthenticationError):
+        if checkpoint is not None:
+            checkpoint.save(item_ids, item_graph, item_cache)
+        raise
+    finally:
+        executor.shutdown(cancel_futures=True)
+    print(f"Crawled {len(seen_ids)} items")
+    if scope is not None:
+        run_stats.count("unexpanded items", len(scope.unexpanded))
+    return item_graph
+
+
+def crawl_item_graph_async(
+    rest_url: str,
+    token: Union[str, None],
+    item_ids: Iterable[str],
+    item_cache: ItemCache,
+    data_store: Union[ItemDataStore, None] = None,
+    max_workers: int = MAX_WORKERS,
+    item_graph: Union[ItemGraph, None] = None,
+    checkpoint: Union[CrawlCheckpoint, None] = None,
+    scope: Union[TraversalScope, None] = None,
+) -> ItemGraph:
+    """
+    Fetches every item reachable from the given items like crawl_item_graph, but with an
+    AsyncItemFetcher on a single event loop instead of a thread pool. Item details are
+    looked up in batches with AsyncItemFetcher.search_items.
+
+    Args:
+        rest_url (str): Sharing REST API root of the portal.
+        token (Union[str, None]): Token of the logged in user, or None for anonymous
+            access.
+        item_ids (Iterable[str]): The IDs of the items to start from.
+        item_cache (ItemCache): Cache to store fetched item metadata in.
+        data_store (Union[ItemDataStore, None], optional): Store to read unchanged item
+            data from. Defaults to None.
+        max_workers (int, optional): Max number of requests in flight. Defaults to
+            MAX_WORKERS.
+        item_graph (Union[ItemGraph, None], optional): Item graph of an interrupted
+            crawl to continue. Defaults to None.
+        checkpoint (Union[CrawlCheckpoint, None], optional): Where to save progress
+            periodically and on Ctrl-C. Defaults to None.
+        scope (Union[TraversalScope, None], optional): The items whose data is fetched
+            and searched for related IDs. Items outside of it are fetched but left out
+            of the item graph. Defaults to None, expanding every item.
+
+    Returns:
+        ItemGraph: The related IDs of every fetched item, and the errors of items that
+            could not be fetched.
+    """
+    item_ids = list(item_ids)
+    if item_graph is None:
+        item_graph = ItemGraph()
+
+    async def fetch_related_ids(fetcher: AsyncItemFetcher, item_id: str):
+        error = item_cache.get_missing(item_id)
+        if error is not None:
+            return item_id, None, error, None
+        item = item_cache.get_record(item_id)
+        if item is None:
+            # Not found by the batch search, the item is fetched on its own
+            try:
+                item = await fetcher.fetch_item(item_id)
+            except AuthenticationError:
+                raise
+            except Exception as e:
+                if is_missing_item_error(e):
+                    item_cache.add_missing(item_id, str(e))
+                return item_id, None, str(e), None
+            item_cache.add(item)
+        if scope is not None and not scope.expands(item, scope.depth(item_id)):
+            return item_id, None, None, None
+        item_data = None
+        if data_store is not None and item.get("modified") is not None:
+            item_data = data_store.get(item_id, item["modified"])
+        try:
+            if item_data is None:
+                item_data = await fetcher.fetch_item_data(item)
+                if data_store is not None and item_data != (None, None):
+                    data_store.put(item_id, item["modified"], item_data)
+            return item_id, find_related_ids(item_data), None, None
+        except AuthenticationError:
+            raise
+        except Exception as e:
+            return item_id, set(), None, str(e)
+
+    async def resolve_items(fetcher: AsyncItemFetcher, item_ids: List[str]):
+        item_ids = item_cache.unresolved(item_ids)
+        if not item_ids:
+            return
+        try:
+            item_cache.add_search_results(await fetcher.search_items(item_ids))
+        except AuthenticationError:
+            raise
+        except Exception:
+            # fetch_related_ids fetches the items one at a time instead
+            pass
+
+    async def crawl():
+        if scope is not None:
+            scope.start(item_graph, item_ids)
+        frontier = item_graph.frontier(item_ids)
+        seen_ids = set(item_graph.related_ids) | set(item_graph.errors) | set(frontier)
+        # IDs waiting for their details to be looked up in a batch
+        to_resolve = frontier
+        async with AsyncItemFetcher(rest_url, token, max_workers) as fetcher:
+            # Maps each task to the ID of the item it fetches, or to the batch of IDs it
+            # looks up
+            pending = {}
+            while True:
+                while to_resolve and (
+                    len(to_resolve) >= ITEM_SEARCH_BATCH_SIZE
+                    or len(pending) < max_workers
+                ):
+                    batch = to_resolve[:ITEM_SEARCH_BATCH_SIZE]
+                    to_resolve = to_resolve[ITEM_SEARCH_BATCH_SIZE:]
+                    pending[asyncio.ensure_future(resolve_items(fetcher, batch))] = (
+                        batch
+                    )
+                if not pending:
+                    break
+                done, _ = await asyncio.wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = pending.pop(future)
+                    if isinstance(task, list):
+                        for item_id in task:
+                            future = asyncio.ensure_future(
+                                fetch_related_ids(fetcher, item_id)
+                            )
+                            pending[future] = item_id
+                        continue
+                    for related_id in _record_crawled_item(
+                        item_graph, future.result(), seen_ids, scope
+                    ):
+                        seen_ids.add(related_id)
+                        to_resolve.append(related_id)
+                fetched = len(item_graph) + len(item_graph.errors)
+                run_stats.progress(
+                    f"Crawling: {fetched} of {len(seen_ids)} items fetched"
+                )
+                if checkpoint is not None:
+                    checkpoint.save_if_due(item_ids, item_graph, item_cache)
+        print(f"Crawled {len(seen_ids)} items")
+        if scope is not None:
+            run_stats.count("unexpanded items", len(scope.unexpanded))
+
+    try:
+        asyncio.run(crawl())
+    except (KeyboardInterrupt, AuthenticationError):
+        if checkpoint is not None:
+            checkpoint.save(item_ids, item_graph, item_cache)
+        raise
+    return item_graph
+
+
+def crawl_related_item_ids(
+    gis_con: GIS,
+    item_ids: Iterable[str],
+    max_workers: int = MAX_WORKERS,
+    scope: Union[TraversalScope, None] = None,
+    item_cache: Union[ItemCache, None] = None,
+) -> List[str]:
+    """
+    Returns the IDs of the given items and of every item reachable from them, crawled
+    with crawl_item_graph. For scripts and notebooks importing this module.
+
+    Args:
+        gis_con (GIS): The GIS connection object.
+        item_ids (Iterable[str]): The IDs of the items to start from.
+        max_workers (int, optional): Number of worker threads. Defaults to MAX_WORKERS.
+        scope (Union[TraversalScope, None], optional): The items whose related items are
+            followed. Defaults to None.
+        item_cache (Union[ItemCache, None], optional): Cache to store fetched item
+            metadata in. Defaults to None.
+
+    Returns:
+        List[str]: The IDs of the items, closest to the given items first, without the
+            IDs that are not items.
+    """
+    item_ids = list(dict.fromkeys(item_ids))
+    if item_cache is None:
+        item_cache = ItemCache(gis_con)
+    item_graph = crawl_item_graph(
+        gis_con, item_ids, item_cache, max_workers=max_workers, scope=scope
+    )
+    found_ids = list(item_ids)
+    seen_ids = set(found_ids)
+    # The list grows while it is iterated over, visiting the items level by level
+    for item_id in found_ids:
+        for related_id in item_graph.related_ids.get(item_id, []):
+            if related_id not in seen_ids:
+                seen_ids.add(related_id)
+                found_ids.append(related_id)
+    return [item_id for item_id in found_ids if item_id not in item_graph.errors]
+
+
+def crawl_related_items(
+    gis_con: GIS,
+    item_ids: Iterable[str],
+    max_workers: int = MAX_WORKERS,
+    scope: Union[TraversalScope, None] = None,
+    item_cache: Union[ItemCache, None] = None,
+) -> List[dict]:
+    """
+    Returns the properties (ITEM_CACHE_FIELDS) of the items found by
+    crawl_related_item_ids, as kept by the item cache while crawling. Only the items
+    evicted from the cache since are searched again.
+
+    Args:
+        gis_con (GIS): The GIS connection object.
+        item_ids (Iterable[str]): The IDs of the items to start from.
+        max_workers (int, optional): Number of worker threads. Defaults to MAX_WORKERS.
+        scope (Union[TraversalScope, None], optional): The items whose related items are
+            followed. Defaults to None.
+        item_cache (Union[ItemCache, None], optional): Cache to store fetched item
+            metadata in. Defaults to None.
+
+    Returns:
+        List[dict]: The properties of the items, in the order of
+            crawl_related_item_ids, without the items that no longer exist.
+    """
+    if item_cache is None:
+        item_cache = ItemCache(gis_con)
+    found_ids = crawl_related_item_ids(
+        gis_con, item_ids, max_workers=max_workers, scope=scope, item_cache=item_cache
+    )
+    items = []
+    for start in range(0, len(found_ids), ITEM_SEARCH_BATCH_SIZE):
+        batch = found_ids[start : start + ITEM_SEARCH_BATCH_SIZE]
+        records = {item_id: item_cache.get_record(item_id) for item_id in batch}
+        evicted_ids = [item_id for item_id in batch if records[item_id] is None]
+        if evicted_ids:
+            result = request_scheduler.call(
+                "search",
+                gis_con.content.advanced_search,
+                query=f"id:({' OR '.join(evicted_ids)})",
+                max_items=len(evicted_ids),
+                as_dict=True,
+            )
+            for item in result["results"]:
+                records[item["id"]] = {
+                    field: item.get(field, None) for field in ITEM_CACHE_FIELDS
+                }
+        items += [records[item_id] for item_id in batch if records[item_id] is not None]
+    return items
+
+
+def load_incremental_run(
+    gis_con: GIS,
+    owner: Union[str, List[str], None],
+    previous_run: CrawlCheckpoint,
+    item_cache: ItemCache,
+) -> tuple:
+    """
+    Restores the crawl of a previous run, forgetting the items to fetch again: org items
+    added, modified, re-shared or transferred since, related items modified or deleted
+    since, and items that could not be fetched.
+
+    Args:
+        gis_con (GIS): The GIS connection object.
+        owner (Union[str, List[str], None]): The accounts analyzed, as ACCOUNT.
+        previous_run (CrawlCheckpoint): The crawl of the previous run, in STATE_FILE.
+        item_cache (ItemCache): The cache to restore the metadata of the items in.
+
+    Returns:
+        tuple: The IDs of the current org items, and the item graph left to complete.
+    """
+    saved_ids, item_graph = previous_run.load(item_cache)
+    saved_items = {record["id"]: record for record in item_cache.records(saved_ids)}
+    org_ids = get_all_content_items_in_org(gis_con, owner, item_cache=item_cache)
+    current_items = {record["id"]: record for record in item_cache.records(org_ids)}
+    # Sharing and ownership changes do not always update the modified date
+    changed_org_ids = {
+        item_id
+        for item_id in org_ids
+        if item_id not in saved_items
+        or item_id not in current_items
+        or any(
+            current_items[item_id][field] != saved_items[item_id][field]
+            for field in ["modified", "owner", "access"]
+        )
+    }
+    removed_ids = set(saved_ids) - org_ids
+    print(
+        f"{len(changed_org_ids)} items added or changed and {len(removed_ids)} items "
+        "removed since the previous run"
+    )
+    # Related items of other accounts, and the org items removed since that other items
+    # may still relate to, are looked up again by ID to find those modified or deleted
+    changed_ids = item_cache.refresh(sorted(set(item_graph.related_ids) - org_ids))
+    print(f"{len(changed_ids)} related items changed since the previous run")
+    # Items that could not be fetched are fetched again, so a failure of one run is not
+    # kept by the next ones
+    item_graph.discard(
+        changed_org_ids
+        | removed_ids
+        | changed_ids
+        | set(item_graph.errors)
+        | set(item_graph.data_errors)
+    )
+    return sorted(org_ids), item_graph
+
+
+def get_related_items_for_id(
+    gis_con: GIS,
+    item_id: str,
+    item_graph: ItemGraph,
+    related_items_rows: RowAccumulator,
+    missed_items_rows: RowAccumulator,
+    main_ancestors: Set[str],
+    base_ancestor: Union[Item | None] = None,
+    relation_path: int = PathTable.ROOT,
+    relations_in_process: Union[Set[str], None] = None,
+    item_cache: Union[ItemCache, None] = None,
+    row_index: Union[Set[int], None] = None,
+    scope: Union[TraversalScope, None] = None,
+):
+    """
+    Records the related items of a given item ID, read from the item graph, in the
+    related items rows. The related items of each item are only recorded below the first
+    row of that item; later rows for the same item are marked as awaiting processing and
+    expanded by process_paused_related_items. It also handles cyclic dependencies.
+    Args:
+        gis_con (GIS): The GIS connection object.
+        item_id (str): The ID of the item to process.
+        item_graph (ItemGraph): The crawled related IDs of every item reachable from the
+            item.
+        related_items_rows (RowAccumulator): Rows of information about related items,
+            with RELATED_ITEMS_COLUMNS.
+        missed_items_rows (RowAccumulator): Rows of information about items that could
+            not be fetched, with MISSED_ITEMS_COLUMNS.
+        main_ancestors (Set[str]): Set to store the IDs of main ancestor items.
+        base_ancestor (Union[Item, None], optional): The base ancestor item. Defaults to None.
+        relation_path (int, optional): Node of the relation path of the item in
+            related_items_rows.path_table. Defaults to the empty path.
+        relations_in_process (Union[Set[str], None], optional): Set to track items whose
+            related items were already recorded. Defaults to None, tracking only the
+            items processed by this call.
+        item_cache (Union[ItemCache, None], optional): Cache to read item metadata from.
+            Defaults to None, fetching every item from the portal.
+        row_index (Union[Set[int], None], optional): Relationship path nodes of the rows
+            already in related_items_rows, updated as rows are added. A path starts with
+            the base ancestor and ends with the related item, so it is the key of its
+            row. Defaults to None, indexing only the rows added by this call.
+        scope (Union[TraversalScope, None], optional): The traversal scope of the crawl,
+            leaving out the related items of excluded categories. Items the crawl did
+            not expand have no related IDs in the item graph. Defaults to None.
+    Returns:
+        None
+    """
+
+    if row_index is None:
+        row_index = set()
+    if relations_in_process is None:
+        relations_in_process = set()
+    valid_item = None
+    if item_id in item_graph.errors:
+        # The item already failed to fetch while crawling
+        missed_items_rows.append([item_id, None, None, item_graph.errors[item_id]])
+    else:
+        # Attempt to fetch the item, retrying retryable errors
+        try:
+            valid_item = fetch_item(gis_con, item_id, item_cache)
+        except AuthenticationError:
+            raise
+        except Exception as e:
+            missed_items_rows.append([item_id, None, None, str(e)])
+    if valid_item is None:
+        # Nothing else to record for an item that could not be fetched
+        return
+    path_table = related_items_rows.path_table
+    # Check if currently handling the main ancestor
+    currently_handling_main_ancestor = base_ancestor is None
+    # Detect cyclic dependency: if the item is already in the relation path
+    if not currently_handling_main_ancestor and path_table.contains(
+        relation_path, valid_item.itemid
+    ):
+        print(
+            f"Detected a cyclic dependency! {valid_item.itemid} appears in the "
+            f"relation path {path_table.materialize(relation_path)}."
+        )
+        return
+    # Related items of the categories left out of the traversal scope are not recorded
+    if (
+        not currently_handling_main_ancestor
+        and scope is not None
+        and not scope.includes(valid_item)
+    ):
+        return
+    # If currently handling the main ancestor and valid_item is found, set it as the base ancestor
+    if currently_handling_main_ancestor and valid_item:
+        base_ancestor = valid_item
+        main_ancestors.add(valid_item.itemid)
+    # Only add the valid item's ID to the relation path if not handling the main ancestor
+    if valid_item:
+        new_relation_path = path_table.child(relation_path, valid_item.itemid)
+    # If not handling the main ancestor, proceed to process the valid item and add it to
+    # the related items rows
+    if not currently_handling_main_ancestor:
+        # print("processing related item", valid_item.itemid)
+        new_row = [
+            base_ancestor.itemid,
+            classify_by_type_typekeywords(base_ancestor),
+            base_ancestor.title,
+            base_ancestor.access,
+            base_ancestor.owner,
+            valid_item.itemid,
+            classify_by_type_typekeywords(valid_item),
+            valid_item.title,
+            valid_item.access,
+            valid_item.owner,
+            valid_item.get("orgId", None),
+            new_relation_path,
+        ]
+        # if a row for this ancestor, item and path already exists, skip
+        if new_relation_path in row_index:
+            return
+        row_index.add(new_relation_path)
+        ## Check if the related item is already being processed:
+        if valid_item.itemid in relations_in_process:
+            new_row.append("Yes")
+            related_items_rows.append(new_row)
+            print(f"Item {valid_item.itemid} is already in process")
+            return
+        new_row.append("No")
+        ## Add valid item to the ancestors
+        related_items_rows.append(new_row)
+    # If valid_item was successfully fetched, and all previous conditions are met,
+    # proceed to record related items for this item
+    if valid_item:
+        relations_in_process.add(valid_item.itemid)
+        if valid_item.itemid in item_graph.data_errors:
+            missed_items_rows.append(
+                [
+                    valid_item.itemid,
+                    valid_item.title,
+                    valid_item.owner,
+                    item_graph.data_errors[valid_item.itemid],
+                ]
+            )
+        # Iterate over each related ID found
+        for related_id in item_graph.related_ids.get(valid_item.itemid, []):
+            # Recursively call the function to find related items for each related ID
+            get_related_items_for_id(
+                gis_con,
+                related_id,
+                item_graph,
+                related_items_rows,
+                missed_items_rows,
+                main_ancestors,
+                base_ancestor,
+                new_relation_path,
+                relations_in_process,
+                item_cache=item_cache,
+                row_index=row_index,
+                scope=scope,
+            )
+
+
+def process_paused_related_items(related_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Processes paused related items in the given DataFrame, as described in
+    expand_paused_related_items.
+    Args:
+        related_df (pd.DataFrame): The DataFrame containing related items.
+    Returns:
+        pd.DataFrame: The related items with the paused items expanded.
+    """
+    return pd.DataFrame(
+        list(expand_paused_related_items(related_df)), columns=related_df.columns
+    )
+
+
+def expand_paused_related_items(related_df: pd.DataFrame) -> Iterator[list]:
+    """
+    Processes paused related items in the given DataFrame, yielding the output rows one
+    at a time. Rows where the 'Awaiting Processing' column is marked as "Yes" record an
+    item whose related items were already recorded where that item was processed. Below
+    each paused row, this function inserts a copy of those rows with the paused row's
+    organization item columns, the path rebuilt from the paused row's path and 'Awaiting
+    Processing' marked as "NA".
+
+    Args:
+        related_df (pd.DataFrame): The DataFrame containing related items with columns including 'Awaiting Processing',
+                                    'Relationship Path', 'Related Item Id', 'Organization Item', 'Org item type',
+                                    'Org item Title', 'Org Item Sharing', and 'Org item owner'.
+    Returns:
+        Iterator[list]: The related items rows with the paused items expanded.
+    """
+    expander = PausedRowsExpander(related_df)
+    path_column = expander.path_column
+    for row in expander.expand():
+        row = list(row)
+        row[path_column] = expander.path_table.materialize(row[path_column])
+        yield row
+
+
+class PausedRowsExpander:
+    """
+    Expands the paused rows of related items, as expand_paused_related_items. Ranges
+    holding every row of their organization items, as returned by partition, can be
+    expanded separately and give the same rows.
+    """
+
+    def __init__(
+        self, related_df: pd.DataFrame, path_table: Union[PathTable, None] = None
+    ):
+        """
+        Args:
+            related_df (pd.DataFrame): The related items rows, as written to
+                OUTPUT_FILE. Relationship paths are lists of item IDs or nodes of
+                path_table.
+            path_table (Union[PathTable, None], optional): The table of the relationship
+                paths. Defaults to None, for a new table.
+        """
+        self.columns = list(related_df.columns)
+        self.path_table = path_table if path_table is not None else PathTable()
+        self.path_column = self.columns.index("Relationship Path")
+        self.paths = [
+            path if isinstance(path, int) else self.path_table.add(path)
+            for path in related_df["Relationship Path"].tolist()
+        ]
+        values = {}
+        columns = [
+            (
+                self.paths
+                if index == self.path_column
+                else [
+                    values.setdefault(value, value)
+                    for value in related_df[column].tolist()
+                ]
+            )
+            for index, column in enumerate(self.columns)
+        ]
+        self.rows = [list(row) for row in zip(*columns)]
+        self.related_ids = columns[self.columns.index("Related Item Id")]
+        self.awaiting = columns[self.columns.index("Awaiting Processing")]
+        self.org_columns = [
+            self.columns.index(column)
+            for column in [
+                "Organization Item",
+                "Org item type",
+                "Org item Title",
+                "Org Item Sharing",
+                "Org item owner",
+            ]
+        ]
+        self.related_id_column = self.columns.index("Related Item Id")
+        self.awaiting_column = self.columns.index("Awaiting Processing")
+        # Row recording each item where it was processed, and first and last rows of
+        # each organization item
+        self.processed_rows = {}
+        self.org_item_rows = {}
+        self.org_item_last_rows = {}
+        for index, row in enumerate(self.rows):
+            if self.awaiting[index] == "No":
+                self.processed_rows.setdefault(self.related_ids[index], index)
+            self.org_item_rows.setdefault(row[self.org_columns[0]], index)
+            self.org_item_last_rows[row[self.org_columns[0]]] = index
+        # Processed item ID -> list of (handles of the path after the processed item,
+        # index of the row to copy)
+        self.expanded_rows = {}
+
+    def partition(self, count: int) -> List[tuple]:
+        """
+        Splits the rows into about count ranges of similar size, each holding every row
+        of its organization items.
+
+        Args:
+            count (int): The number of ranges wanted.
+
+        Returns:
+            List[tuple]: The (start, end) indices of the ranges, in order.
+        """
+        ranges = []
+        size = max(len(self.rows) // max(count, 1), 1)
+        start = 0
+        # Last row of the organization items of the rows since start
+        last_row = -1
+        for index, row in enumerate(self.rows):
+            if index > last_row and index - start >= size:
+                ranges.append((start, index))
+                start = index
+            last_row = max(last_row, self.org_item_last_rows[row[self.org_columns[0]]])
+        if start < len(self.rows):
+            ranges.append((start, len(self.rows)))
+        return ranges
+
+    def find_processed_rows(self, item_id: str):
+        # Rows following the processed row whose path goes through it or, for an item
+        # processed as a base ancestor (which has no row of its own), its own rows
+        if item_id in self.processed_rows:
+            prefix = self.paths[self.processed_rows[item_id]]
+            start = self.processed_rows[item_id] + 1
+        elif item_id in self.org_item_rows:
+            prefix = self.path_table.child(PathTable.ROOT, item_id)
+            start = self.org_item_rows[item_id]
+        else:
+            return None
+        end = start
+        while end < len(self.paths) and self.path_table.starts_with(
+            self.paths[end], prefix
+        ):
+            end += 1
+        return start, end, self.path_table.depth(prefix)
+
+    def expand_item(self, item_id: str) -> list:
+        if item_id in self.expanded_rows:
+            return self.expanded_rows[item_id]
+        # Guards against an item whose processed rows lead back to itself
+        self.expanded_rows[item_id] = []
+        location = self.find_processed_rows(item_id)
+        if location is None:
+            return []
+        start, end, prefix_length = location
+        expansion = []
+        for index in range(start, end):
+            path_suffix = tuple(
+                self.path_table.handles(self.paths[index])[prefix_length:]
+            )
+            expansion.append((path_suffix, index))
+            if self.awaiting[index] == "Yes":
+                expansion.extend(
+                    (path_suffix + nested_suffix, nested_index)
+                    for nested_suffix, nested_index in self.expand_item(
+                        self.related_ids[index]
+                    )
+                )
+        self.expanded_rows[item_id] = expansion
+        return expansion
+
+    def expand(self, start: int = 0, end: Union[int, None] = None) -> Iterator[list]:
+        """
+        Yields the rows of a range with the paused items expanded.
+
+        Args:
+            start (int, optional): Index of the first row of the range. Defaults to 0.
+            end (Union[int, None], optional): Index after the last row of the range,
+                None for all rows. Defaults to None.
+
+        Returns:
+            Iterator[list]: The rows of the range with the paused items expanded.
+        """
+        org_columns = self.org_columns
+        path_column = self.path_column
+        awaiting_column = self.awaiting_column
+        row_keys = set()
+
+        def is_new_row(row: list) -> bool:
+            # Same fields as a duplicate check on every column, as the path starts with
+            # the organization item and ends with the related item, and the other
+            # columns follow from the two item IDs
+            row_key = (row[path_column], row[awaiting_column])
+            if row_key in row_keys:
+                return False
+            row_keys.add(row_key)
+            return True
+
+        for index in range(start, len(self.rows) if end is None else end):
+            row = self.rows[index]
+            if is_new_row(row):
+                yield row
+            if self.awaiting[index] != "Yes":
+                continue
+            paused_path = self.paths[index]
+            paused_items = set(self.path_table.handles(paused_path))
+            for path_suffix, copied_index in self.expand_item(self.related_ids[index]):
+                # Detect cyclic dependency: the copied path visits an item twice
+                if not paused_items.isdisjoint(path_suffix) or len(
+                    set(path_suffix)
+                ) < len(path_suffix):
+                    continue
+                new_path = self.path_table.extend(paused_path, path_suffix)
+                new_row = list(self.rows[copied_index])
+                for column in org_columns:
+                    new_row[column] = row[column]
+                new_row[path_column] = new_path
+                new_row[awaiting_column] = "NA"
+                if is_new_row(new_row):
+                    yield new_row
+
+
+# Expander of the rows in the worker processes of write_expanded_related_items
+_worker_expander = None
+
+
+def _init_expansion_worker(related_df: pd.DataFrame, path_table: PathTable):
+    global _worker_expander
+    _worker_expander = PausedRowsExpander(related_df, path_table)
+
+
+def _expand_rows_range(start: int, end: int, output_format: str):
+    # Formats the expanded rows of the range for the output file, numbered as they are
+    # written
+    batch = RowAccumulator(_worker_expander.columns, _worker_expander.path_table)
+    for row in _worker_expander.expand(start, end):
+        batch.append(row)
+    row_count = len(batch)
+    return (
+        RowWriter.format_rows(batch.to_dataframe(), output_format, numbered=False),
+        row_count,
+    )
+
+
+def write_expanded_related_items(
+    related_df: pd.DataFrame,
+    related_items_rows: RowWriter,
+    max_workers: Union[int, None] = POSTPROCESS_WORKERS,
+):
+    """
+    Writes the related items rows with the paused items expanded. With several workers,
+    ranges of organization items are expanded and formatted by a pool of processes, and
+    written in order.
+
+    Args:
+        related_df (pd.DataFrame): The related items rows, as written to OUTPUT_FILE.
+            Relationship paths are lists of item IDs or nodes of the path table of
+            related_items_rows, as read by read_rows with that table.
+        related_items_rows (RowWriter): The writer of the expanded rows.
+        max_workers (Union[int, None], optional): Number of processes, None for one per
+            CPU and 1 to expand the rows in this process. Defaults to
+            POSTPROCESS_WORKERS.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    expander = PausedRowsExpander(related_df, related_items_rows.path_table)
+    ranges = (
+        expander.partition(max_workers * 4)
+        if max_workers > 1 and len(related_df) >= POSTPROCESS_MIN_ROWS
+        else []
+    )
+    if len(ranges) < 2:
+        # The rows hold path nodes of the writer's table, materialized as they are
+        # written
+        for row in expander.expand():
+            related_items_rows.append(row)
+        return
+    del expander
+    output_format = related_items_rows.output_format
+    with ProcessPoolExecutor(
+        max_workers,
+        initializer=_init_expansion_worker,
+        initargs=(related_df, related_items_rows.path_table),
+    ) as executor:
+        # CSV rows are numbered by the writer, as the rows of the ranges before are only
+        # counted once expanded
+        for formatted, row_count in executor.map(
+            _expand_rows_range, *zip(*ranges), [output_format] * len(ranges)
+        ):
+            related_items_rows.write_formatted(formatted, row_count)
+            rows_written = related_items_rows.rows_written
+            run_stats.progress(f"Expanding paused items: {rows_written} rows written")
+
+
+def build_relationship_graph(
+    related_df: pd.DataFrame, categories: Union[List[str], None] = None
+):
+    """
+    Builds the directed graph of the relationship paths, from each item to the items
+    found in its data. The category (see classify_by_type_typekeywords) and title of
+    each node are taken from the rows, so no item is requested from the portal.
+
+    Args:
+        related_df (pd.DataFrame): The related items rows, as written to OUTPUT_FILE.
+        categories (Union[List[str], None], optional): COLOR_MAP categories of the nodes
+            to keep, None for all. Paths through a dropped node link the kept nodes
+            before and after it. Defaults to None.
+
+    Returns:
+        networkx.DiGraph: The graph, with the category, title, color and url of each
+            node, whether it is an organization item, and the number of paths through
+            each edge.
+    """
+    import networkx as nx
+
+    graph = nx.DiGraph()
+    # The organization items start the paths, every other item of a path is the related
+    # item of a row
+    nodes = {}
+    for item_id, category, title in zip(
+        related_df["Organization Item"],
+        related_df["Org item type"],
+        related_df["Org item Title"],
+    ):
+        nodes[item_id] = (category, title, True)
+    for item_id, category, title in zip(
+        related_df["Related Item Id"],
+        related_df["Related Item Type"],
+        related_df["Related Item Title"],
+    ):
+        if item_id not in nodes:
+            nodes[item_id] = (category, title, False)
+    for item_id, (category, title, org_item) in nodes.items():
+        if categories is not None and category not in categories:
+            continue
+        graph.add_node(
+            item_id,
+            category=category,
+            title=str(title),
+            color=COLOR_MAP.get(category, COLOR_MAP["other"]),
+            url=f"{PORTAL}/home/item.html?id={item_id}",
+            org_item=org_item,
+        )
+    for path in related_df["Relationship Path"]:
+        path = [item_id for item_id in path if item_id in graph]
+        for source, target in zip(path, path[1:]):
+            if graph.has_edge(source, target):
+                graph[source][target]["paths"] += 1
+            else:
+                graph.add_edge(source, target, paths=1)
+    return graph
+
+
+def layout_relationship_graph(graph, iterations: int = 30, spacing: float = 100.0):
+    """
+    Sets the x and y position of each node of a relationship graph, in time linear in
+    its size: organization items on a spiral, and other items at the barycenter of their
+    neighbors.
+
+    Args:
+        graph (networkx.DiGraph): The graph from build_relationship_graph.
+        iterations (int, optional): Number of barycenter iterations. Defaults to 30.
+        spacing (float, optional): Distance between two neighbor organization items.
+            Defaults to 100.
+    """
+    import numpy as np
+
+    nodes = list(graph)
+    if not nodes:
+        return
+    index = {node: position for position, node in enumerate(nodes)}
+    positions = np.zeros((len(nodes), 2))
+    placed = np.zeros(len(nodes), dtype=bool)
+    # Organization items without one, such as items of a cycle, are laid out with them
+    roots = [node for node in nodes if graph.nodes[node]["org_item"]] or nodes[:1]
+    roots += [
+        node for node in nodes if graph.in_degree(node) == 0 and node not in roots
+    ]
+    queue = []
+    for order, root in enumerate(roots):
+        # Golden angle spiral, evenly spacing the organization items
+        radius, angle = spacing * np.sqrt(order), order * 2.399963
+        positions[index[root]] = radius * np.cos(angle), radius * np.sin(angle)
+        placed[index[root]] = True
+        queue.append(root)
+    fixed = placed.copy()
+    for node in queue:
+        children = [
+            child for child in graph.successors(node) if not placed[index[child]]
+        ]
+        for order, child in enumerate(children):
+            angle = 2 * np.pi * order / len(children)
+            positions[index[child]] = positions[index[node]] + spacing / 3 * np.array(
+                [np.cos(angle), np.sin(angle)]
+            )
+            placed[index[child]] = True
+            queue.append(child)
+    edges = np.array(
+        [(index[source], index[target]) for source, target in graph.edges()]
+    )
+    if len(edges):
+        sources = np.concatenate([edges[:, 0], edges[:, 1]])
+        targets = np.concatenate([edges[:, 1], edges[:, 0]])
+        degrees = np.bincount(sources, minlength=len(nodes))[:, None]
+        moving = ~fixed & (degrees[:, 0] > 0)
+        for _ in range(iterations):
+            sums = np.zeros_like(positions)
+            np.add.at(sums, sources, positions[targets])
+            barycenters = sums / np.maximum(degrees, 1)
+            positions[moving] = (positions[moving] + barycenters[moving]) / 2
+    for node, (x, y) in zip(nodes, positions):
+        graph.nodes[node]["x"] = float(x)
+        graph.nodes[node]["y"] = float(y)
+
+
+def aggregate_graph_by_category(graph):
+    """
+    Aggregates the nodes of a relationship graph into one node per category.
+
+    Args:
+        graph (networkx.DiGraph): The graph from build_relationship_graph.
+
+    Returns:
+        networkx.DiGraph: One node per category, with the number of items of the
+            category, and the number of relationships from the items of a category to
+            the items of another on each edge.
+    """
+    import networkx as nx
+
+    aggregated = nx.DiGraph()
+    for node, category in graph.nodes(data="category"):
+        if category in aggregated:
+            aggregated.nodes[category]["items"] += 1
+        else:
+            aggregated.add_node(
+                category,
+                category=category,
+                title=category,
+                color=COLOR_MAP.get(category, COLOR_MAP["other"]),
+                items=1,
+            )
+    for source, target in graph.edges():
+        source, target = (
+            graph.nodes[source]["category"],
+            graph.nodes[target]["category"],
+        )
+        if aggregated.has_edge(source, target):
+            aggregated[source][target]["relationships"] += 1
+        else:
+            aggregated.add_edge(source, target, relationships=1)
+    return aggregated
+
+
+def write_graph_html(
+    graph, graph_file: str, max_nodes: Union[int, None] = GRAPH_HTML_MAX_NODES
+):
+    """
+    Writes a relationship graph as an interactive HTML page, laid out beforehand. Graphs
+    of more than max_nodes nodes are aggregated by category.
+
+    Args:
+        graph (networkx.DiGraph): The graph from build_relationship_graph.
+        graph_file (str): Path of the HTML file to write.
+        max_nodes (Union[int, None], optional): Most nodes drawn item by item, None for
+            no limit. Defaults to GRAPH_HTML_MAX_NODES.
+    """
+    import networkx as nx
+    from pyvis.network import Network
+
+    # if not running this script in a Notebook, make `notebook=False`
+    net = Network(notebook=True, directed=True, select_menu=True, filter_menu=True)
+    if max_nodes is not None and graph.number_of_nodes() > max_nodes:
+        print(
+            f"The graph has {graph.number_of_nodes()} items, more than "
+            f"GRAPH_HTML_MAX_NODES ({max_nodes}): drawing one node per category. "
+            "Set GRAPH_CATEGORIES to draw the items of some categories."
+        )
+        aggregated = aggregate_graph_by_category(graph)
+        positions = nx.spring_layout(
+            aggregated, seed=0, scale=50 * aggregated.number_of_nodes()
+        )
+        for category, attributes in aggregated.nodes(data=True):
+            net.add_node(
+                category,
+                label=f"{category} ({attributes['items']})",
+                title=f"{attributes['items']} {category} items",
+                color=attributes["color"],
+                value=attributes["items"],
+                x=float(positions[category][0]),
+                y=float(positions[category][1]),
+            )
+        for source, target, relationships in aggregated.edges(data="relationships"):
+            net.add_edge(
+                source,
+                target,
+                value=relationships,
+                title=f"{relationships} relationships",
+                color="#0A0A0A",
+            )
+    else:
+        for node, attributes in graph.nodes(data=True):
+            net.add_node(
+                node,
+                label=f"{attributes['category']}: {attributes['title']}",
+                title=(
+                    f"<p>Open <a href='{attributes['url']}'>"
+                    f"{attributes['category']}</a></p>"
+                ),
+                color=attributes["color"],
+                x=attributes["x"],
+                y=attributes["y"],
+            )
+        for source, target in graph.edges():
+            net.add_edge(source, target, color="#0A0A0A")
+    net.toggle_physics(False)
+    net.show(graph_file)
+
+
+def export_graph(
+    related_df: pd.DataFrame,
+    graph_file: str,
+    graph_format: str = GRAPH_FORMAT,
+    categories: Union[List[str], None] = GRAPH_CATEGORIES,
+):
+    """
+    Exports the relationship paths as a graph, built from the rows without requesting
+    any item.
+
+    Args:
+        related_df (pd.DataFrame): The related items rows, as written to OUTPUT_FILE.
+        graph_file (str): Path of the file to write.
+        graph_format (str, optional): "html", "graphml", "gexf" or "json". Defaults to
+            GRAPH_FORMAT.
+        categories (Union[List[str], None], optional): COLOR_MAP categories of the items
+            to draw, None for all. Defaults to GRAPH_CATEGORIES.
+    """
+    import networkx as nx
+
+    if graph_format not in ["html", "graphml", "gexf", "json"]:
+        raise ValueError(f"Unsupported graph format: {graph_format}")
+    graph = build_relationship_graph(related_df, categories)
+    layout_relationship_graph(graph)
+    if graph_format == "html":
+        write_graph_html(graph, graph_file)
+    elif graph_format == "graphml":
+        nx.write_graphml(graph, graph_file)
+    elif graph_format == "gexf":
+        # Colors and positions are written as GEXF visualization attributes, read by
+        # Gephi
+        for node, attributes in graph.nodes(data=True):
+            attributes["viz"] = {
+                "color": dict(
+                    zip(
+                        "rgb",
+                        (int(attributes["color"][i : i + 2], 16) for i in (1, 3, 5)),
+                    )
+                ),
+                "position": {"x": attributes["x"], "y": attributes["y"], "z": 0.0},
+            }
+        nx.write_gexf(graph, graph_file)
+    else:
+        with open(graph_file, "w", encoding="utf-8") as json_file:
+            json.dump(
+                {
+                    "nodes": [
+                        {"id": node, **attributes}
+                        for node, attributes in graph.nodes(data=True)
+                    ],
+                    "edges": [
+                        [source, target, paths]
+                        for source, target, paths in graph.edges(data="paths")
+                    ],
+                },
+                json_file,
+                separators=(",", ":"),
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Find the relationships between the items of an ArcGIS "
+        "organization."
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue the interrupted run saved in CHECKPOINT_FILE",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only fetch the items modified since the run saved in STATE_FILE",
+    )
+    parser.add_argument(
+        "--upstream",
+        nargs="+",
+        metavar="ITEM_ID",
+        help="list the items that depend on the given items, from "
+        "DEPENDENCY_INDEX_FILE, without running",
+    )
+    parser.add_argument(
+        "--downstream",
+        nargs="+",
+        metavar="ITEM_ID",
+        help="list the items the given items depend on, from DEPENDENCY_INDEX_FILE, "
+        "without running",
+    )
+    args = parser.parse_args()
+    if args.upstream or args.downstream:
+        if DEPENDENCY_INDEX_FILE is None or not os.path.exists(DEPENDENCY_INDEX_FILE):
+            parser.error(
+                f"no dependency index at DEPENDENCY_INDEX_FILE "
+                f"({DEPENDENCY_INDEX_FILE})"
+            )
+        dependency_index = DependencyIndex(DEPENDENCY_INDEX_FILE)
+        for item_id in args.upstream or []:
+            print_dependencies(dependency_index, item_id)
+        for item_id in args.downstream or []:
+            print_dependencies(dependency_index, item_id, downstream=True)
+        dependency_index.close()
+        parser.exit()
+    profile = start_profiler(PROFILER)
+    run_date = int(time.time() * 1000)
+    checkpoint = (
+        CrawlCheckpoint(CHECKPOINT_FILE, run_date=run_date) if CHECKPOINT_FILE else None
+    )
+    if args.resume and (checkpoint is None or not os.path.exists(CHECKPOINT_FILE)):
+        parser.error(
+            f"no checkpoint to resume from at CHECKPOINT_FILE ({CHECKPOINT_FILE})"
+        )
+    if args.incremental and (STATE_FILE is None or not os.path.exists(STATE_FILE)):
+        parser.error(f"no previous run to start from at STATE_FILE ({STATE_FILE})")
+
+    run_stats.start_phase("connect")
+    gis_con = GIS(PORTAL, USERNAME, PASSWORD)
+    item_cache = ItemCache(gis_con, ITEM_CACHE_SIZE)
+    data_store = ItemDataStore(ITEM_DATA_STORE_FILE) if ITEM_DATA_STORE_FILE else None
+    # Items of other organizations are told apart by the ID of the organization of the
+    # logged in user
+    scope = TraversalScope(org_id=gis_con.properties.id)
+    if data_store is not None:
+        # Items found missing in recent runs are not requested again. Earlier versions
+        # also remembered the items that failed with an expired token
+        for item_id, error in data_store.get_missing(MISSING_ITEM_TTL).items():
+            if is_missing_item_error(Exception(error)):
+                item_cache.add_missing(item_id, error)
+    run_stats.start_phase("enumerate")
+    if args.resume:
+        items_to_process, item_graph = checkpoint.load(item_cache)
+        all_storymap_items = set(items_to_process)
+        run_date = checkpoint.run_date
+    elif args.incremental:
+        items_to_process, item_graph = load_incremental_run(
+            gis_con, ACCOUNT, CrawlCheckpoint(STATE_FILE), item_cache
+        )
+        all_storymap_items = set(items_to_process)
+        if checkpoint is not None:
+            checkpoint.save(items_to_process, item_graph, item_cache)
+    else:
+        all_storymap_items = get_all_content_items_in_org(
+            gis_con, ACCOUNT, item_cache=item_cache
+        )
+        print(len(all_storymap_items))
+        items_to_process = sorted(all_storymap_items)
+        if TEST_MAX_PROCESSED_ITEMS is not None:
+            # The main loop stops after the item at index TEST_MAX_PROCESSED_ITEMS + 1
+            items_to_process = items_to_process[: TEST_MAX_PROCESSED_ITEMS + 2]
+        item_graph = ItemGraph()
+        if checkpoint is not None:
+            # Saves the org items right away, so a resumed run does not have to search
+            # for them again
+            checkpoint.save(items_to_process, item_graph, item_cache)
+    # Keys of the rows in related_items, to skip duplicate rows without scanning the
+    # DataFrame
+    row_index = set()
+    run_stats.start_phase("crawl")
+    if FETCH_BACKEND == "asyncio":
+        item_graph = crawl_item_graph_async(
+            f"{PORTAL.rstrip('/')}/sharing/rest",
+            gis_con._con.token,
+            items_to_process,
+            item_cache,
+            data_store,
+            MAX_WORKERS,
+            item_graph,
+            checkpoint,
+            scope,
+        )
+    else:
+        item_graph = crawl_item_graph(
+            gis_con,
+            items_to_process,
+            item_cache,
+            data_store,
+            MAX_WORKERS,
+            item_graph,
+            checkpoint,
+            scope,
+        )
+    if data_store is not None:
+        data_store.put_missing(item_cache.missing)
+    run_stats.start_phase("relationships")
+    # Items whose related items were already recorded
+    relations_in_process = set()
+    # Rows are written out in batches as they are found, and each missed item is only
+    # written once
+    missed_items_rows = RowWriter(
+        OUTPUT_MISS_FILE, MISSED_ITEMS_COLUMNS, unique_column="itemId"
+    )
+    related_items_rows = RowWriter(OUTPUT_FILE, RELATED_ITEMS_COLUMNS)
+    for index, item_id in enumerate(items_to_process):
+        print(f"Processing item {index} with id {item_id}")
+        try:
+            get_related_items_for_id(
+                gis_con,
+                item_id,
+                item_graph,
+                related_items_rows,
+                missed_items_rows,
+                all_storymap_items,
+                relations_in_process=relations_in_process,
+                item_cache=item_cache,
+                row_index=row_index,
+                scope=scope,
+            )
+        except AuthenticationError:
+            raise
+        except Exception as e:
+            missed_items_rows.append([item_id, None, None, str(e)])
+        if TEST_MAX_PROCESSED_ITEMS is not None and index > TEST_MAX_PROCESSED_ITEMS:
+            break
+        run_stats.progress(
+            f"Recording relationships: {index + 1} of {len(items_to_process)} items "
+            "processed"
+        )
+    related_items_rows.close()
+    missed_items_rows.close()
+    print(related_items_rows.rows_written)
+
+    run_stats.count("related rows", related_items_rows.rows_written)
+    run_stats.count("missed rows", missed_items_rows.rows_written)
+
+    # find paused related items and expand them, rewriting the output file
+    run_stats.start_phase("expand")
+    # Expanded rows are written to a temporary file, so an interruption leaves the
+    # unexpanded rows in OUTPUT_FILE
+    expanded_items_rows = RowWriter(f"{OUTPUT_FILE}.tmp", RELATED_ITEMS_COLUMNS)
+    related_items = read_rows(OUTPUT_FILE, path_table=expanded_items_rows.path_table)
+    write_expanded_related_items(related_items, expanded_items_rows)
+    del related_items
+    expanded_items_rows.close()
+    os.replace(expanded_items_rows.path, OUTPUT_FILE)
+    run_stats.count("expanded rows", expanded_items_rows.rows_written)
+    # The expanded rows are read once for the index and the graph
+    create_graph = CREATE_GRAPH_HTML and GRAPH_FILE is not None
+    if DEPENDENCY_INDEX_FILE is not None or create_graph:
+        related_items = read_rows(OUTPUT_FILE)
+    if DEPENDENCY_INDEX_FILE is not None:
+        run_stats.start_phase("index")
+        DependencyIndex.build(DEPENDENCY_INDEX_FILE, related_items).close()
+        print(f"Dependency index written to {DEPENDENCY_INDEX_FILE}")
+    # The run completed, the next one starts over or from this run with --incremental
+    if STATE_FILE is not None:
+        CrawlCheckpoint(STATE_FILE, run_date=run_date).save(
+            items_to_process, item_graph, item_cache
+        )
+    if checkpoint is not None:
+        checkpoint.remove()
+
+    # Optional graphing
+    if create_graph:
+        run_stats.start_phase("graph")
+        export_graph(related_items, GRAPH_FILE)
+
+    run_stats.start_phase(None)
+    print(item_cache.report())
+    if data_store is not None:
+        data_store.close()
+        print(data_store.report())
+    stop_profiler(profile, PROFILE_FILE)
+    if STATS_FILE is not None:
+        summary = run_stats.summary(
+            rows_per_second={
+                phase: run_stats.counters[counter] / run_stats.phases[phase]
+                for phase, counter in [
+                    ("relationships", "related rows"),
+                    ("expand", "expanded rows"),
+                ]
+                if run_stats.phases.get(phase)
+            },
+            item_cache={
+                "hits": item_cache.hits,
+                "misses": item_cache.misses,
+                "missing_hits": item_cache.missing_hits,
+                "missing_items": len(item_cache.missing),
+                "searches": item_cache.searches,
+                "items_found_by_searches": item_cache.prefetched,
+            },
+            request_scheduler=request_scheduler.report(),
+            item_data_store=(
+                {"hits": data_store.hits, "misses": data_store.misses}
+                if data_store is not None
+                else None
+            ),
+        )
+        with open(STATS_FILE, "w", encoding="utf-8") as stats_file:
+            json.dump(summary, stats_file, indent=2)
+        print(f"Run statistics written to {STATS_FILE}")
@@ -0,0 +1,14 @@
+"""
+Makes the script and the synthetic portal of the benchmarks importable by the tests.
+
+Run from the find-related-items-script folder, with the ArcGIS API for Python and pytest
+installed:
+    $ python -m pytest tests
+"""
+
+import os
+import sys
+
+SCRIPT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, SCRIPT_FOLDER)
+sys.path.insert(0, os.path.join(SCRIPT_FOLDER, "benchmarks"))
@@ -0,0 +1,216 @@
+"""
+Tests of the asyncio backend, fetching from local stubs of the sharing REST API: a few
+items, and the synthetic portal of the benchmarks.
+"""
+
+import asyncio
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+import find_related_AGO_items as far
+from synthetic_portal import SyntheticOrg, serve as serve_org, use_synthetic_portal
+
+pytest.importorskip("aiohttp")
+
+WEB_MAP = "a" * 32
+LAYER = "b" * 32
+STORY = "c" * 32
+DRAFT_STORY = "d" * 32
+LOCKED_WEB_MAP = "e" * 32
+MISSING = "f" * 32
+
+# Items, data and StoryMap resources served by the stub
+ITEMS = {
+    WEB_MAP: {"id": WEB_MAP, "type": "Web Map", "typeKeywords": ["Map"]},
+    STORY: {
+        "id": STORY,
+        "type": "StoryMap",
+        "typeKeywords": ["StoryMap", "smdraftresourceid:draft_1.json"],
+    },
+    DRAFT_STORY: {"id": DRAFT_STORY, "type": "StoryMap", "typeKeywords": ["StoryMap"]},
+    LOCKED_WEB_MAP: {"id": LOCKED_WEB_MAP, "type": "Web Map", "typeKeywords": ["Map"]},
+}
+DATA = {
+    WEB_MAP: {"operationalLayers": [{"itemId": LAYER}]},
+    # The REST API reports errors in the body of stored content requests too
+    LOCKED_WEB_MAP: {"error": {"code": 403, "message": "Access not allowed"}},
+}
+RESOURCES = {
+    STORY: {
+        "published_data.json": {"nodes": {"n-1": {"data": {"itemId": WEB_MAP}}}},
+        "draft_1.json": {"nodes": {"n-2": {"data": {"itemId": LAYER}}}},
+    },
+    DRAFT_STORY: {"draft.json": {"nodes": {"n-1": {"data": {"itemId": WEB_MAP}}}}},
+}
+
+
+@contextmanager
+def serve(requests: list = None):
+    """
+    Serves ITEMS, DATA and RESOURCES from a background thread, yielding the REST root.
+    The paths requested are appended to requests.
+    """
+    from aiohttp import web
+
+    @web.middleware
+    async def record(request, handler):
+        if requests is not None:
+            requests.append(request.path)
+        return await handler(request)
+
+    async def item(request):
+        item_id = request.match_info["item_id"]
+        if item_id not in ITEMS:
+            # The REST API reports missing items in the body of a successful response
+            return web.json_response(
+                {"error": {"code": 400, "message": "Item does not exist"}}
+            )
+        return web.json_response(ITEMS[item_id])
+
+    async def data(request):
+        return web.json_response(DATA.get(request.match_info["item_id"], {}))
+
+    async def resources(request):
+        names = RESOURCES.get(request.match_info["item_id"], {})
+        return web.json_response({"resources": [{"resource": name} for name in names]})
+
+    async def resource(request):
+        names = RESOURCES.get(request.match_info["item_id"], {})
+        if request.match_info["name"] not in names:
+            return web.Response(status=404)
+        return web.json_response(names[request.match_info["name"]])
+
+    app = web.Application(middlewares=[record])
+    app.add_routes(
+        [
+            web.get("/sharing/rest/content/items/{item_id}", item),
+            web.get("/sharing/rest/content/items/{item_id}/data", data),
+            web.get("/sharing/rest/content/items/{item_id}/resources", resources),
+            web.get("/sharing/rest/content/items/{item_id}/resources/{name}", resource),
+        ]
+    )
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{port}/sharing/rest"
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+def fetch(coroutine_function, requests: list = None):
+    # Runs a coroutine function taking a fetcher against the stub
+    async def run(rest_url: str):
+        async with far.AsyncItemFetcher(rest_url, None, 4) as fetcher:
+            return await coroutine_function(fetcher)
+
+    with serve(requests) as rest_url:
+        return asyncio.run(run(rest_url))
+
+
+def test_fetcher_reads_items_and_data():
+    async def read(fetcher):
+        item = await fetcher.fetch_item(WEB_MAP)
+        return item, await fetcher.fetch_item_data(item)
+
+    item, item_data = fetch(read)
+
+    assert item == ITEMS[WEB_MAP]
+    assert item_data == (DATA[WEB_MAP], None)
+
+
+def test_fetcher_reads_storymap_draft_and_published_data():
+    async def read(fetcher):
+        return await asyncio.gather(
+            fetcher.fetch_item_data(ITEMS[STORY]),
+            fetcher.fetch_item_data(ITEMS[DRAFT_STORY]),
+        )
+
+    story_data, draft_story_data = fetch(read)
+
+    assert story_data == (
+        RESOURCES[STORY]["draft_1.json"],
+        RESOURCES[STORY]["published_data.json"],
+    )
+    # Stories without a draft keyword nor published data fall back to draft.json
+    assert draft_story_data == (RESOURCES[DRAFT_STORY]["draft.json"], None)
+
+
+def test_fetcher_only_requests_listed_resources():
+    async def read(fetcher):
+        return await fetcher.fetch_item_data(ITEMS[DRAFT_STORY])
+
+    requests = []
+    fetch(read, requests)
+
+    item_path = f"/sharing/rest/content/items/{DRAFT_STORY}"
+    assert requests == [f"{item_path}/resources", f"{item_path}/resources/draft.json"]
+
+
+def test_fetcher_raises_error_bodies_of_stored_content():
+    async def read(fetcher):
+        return await fetcher.fetch_item_data(ITEMS[LOCKED_WEB_MAP])
+
+    with pytest.raises(Exception, match="Error Code: 403"):
+        fetch(read)
+
+
+def test_fetcher_raises_missing_items():
+    async def read(fetcher):
+        return await fetcher.fetch_item(MISSING)
+
+    with pytest.raises(Exception, match="Item does not exist"):
+        fetch(read)
+
+
+def test_fetcher_matches_threads_backend():
+    org = SyntheticOrg(item_count=100)
+    story = next(
+        item_id
+        for item_id, item in org.items.items()
+        if any(
+            keyword.startswith("smdraftresourceid:") for keyword in item["typeKeywords"]
+        )
+    )
+
+    async def read(rest_url: str):
+        async with far.AsyncItemFetcher(rest_url, None, 4) as fetcher:
+            item = await fetcher.fetch_item(story)
+            item_data = await fetcher.fetch_item_data(item)
+            return item, item_data, await fetcher.search_items(sorted(org.items)[:10])
+
+    with serve_org(org) as rest_url:
+        item, item_data, results = asyncio.run(read(rest_url))
+
+    gis_con = use_synthetic_portal(far, org)
+    assert item == org.items[story]
+    # The same draft and published data as the ArcGIS API for Python backend
+    assert item_data == far.fetch_item_data(far.Item(gis_con, story))
+    assert sorted(result["id"] for result in results) == sorted(org.items)[:10]
+
+
+def test_async_crawl_matches_threads_crawl():
+    org = SyntheticOrg(item_count=300)
+    gis_con = use_synthetic_portal(far, org)
+    item_ids = sorted(
+        item_id for item_id, item in org.items.items() if item["type"] == "StoryMap"
+    )
+    item_graph = far.crawl_item_graph(gis_con, item_ids, far.ItemCache(gis_con))
+
+    with serve_org(org) as rest_url:
+        async_graph = far.crawl_item_graph_async(
+            rest_url, None, item_ids, far.ItemCache(gis_con)
+        )
+
+    assert async_graph.related_ids == item_graph.related_ids
+    assert async_graph.errors.keys() == item_graph.errors.keys()
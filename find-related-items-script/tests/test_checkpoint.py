@@ -0,0 +1,77 @@
+"""
+Tests of the crawl saved by CrawlCheckpoint, resumed and restored by incremental runs,
+against a synthetic organization.
+"""
+
+import os
+
+import find_related_AGO_items as far
+from synthetic_portal import SyntheticOrg, use_synthetic_portal
+
+
+def test_incremental_run_drops_removed_org_items_and_refetches_changed_ones(tmp_path):
+    org = SyntheticOrg(item_count=200)
+    gis_con = use_synthetic_portal(far, org)
+    item_cache = far.ItemCache(gis_con)
+    org_ids = sorted(far.get_all_content_items_in_org(gis_con, item_cache=item_cache))
+    item_graph = far.crawl_item_graph(gis_con, org_ids, item_cache)
+    state = far.CrawlCheckpoint(os.path.join(tmp_path, "crawl_state.json.gz"))
+    state.save(org_ids, item_graph, item_cache)
+    deleted_id, transferred_id, shared_id, unchanged_id = org_ids[:4]
+    del org.items[deleted_id]
+    org.items[transferred_id] = dict(org.items[transferred_id], owner="another_user")
+    # Sharing an item does not change its modified date
+    org.items[shared_id] = dict(
+        org.items[shared_id],
+        access="private" if org.items[shared_id]["access"] != "private" else "public",
+    )
+    new_id = org._add_item("Web Map", type_keywords=["ArcGIS Online", "Map"])
+
+    item_ids, item_graph = far.load_incremental_run(
+        gis_con, None, far.CrawlCheckpoint(state.path), far.ItemCache(gis_con)
+    )
+
+    assert item_ids == sorted(set(org_ids) - {deleted_id, transferred_id} | {new_id})
+    for item_id in [deleted_id, transferred_id, shared_id, new_id]:
+        assert not item_graph.is_crawled(item_id)
+    assert item_graph.is_crawled(unchanged_id)
+
+
+def test_resumed_crawl_restores_the_saved_crawl_and_fetches_the_rest(tmp_path):
+    org = SyntheticOrg(item_count=200)
+    gis_con = use_synthetic_portal(far, org)
+    item_ids = sorted(org.items)
+    complete_graph = far.crawl_item_graph(gis_con, item_ids, far.ItemCache(gis_con))
+    # A crawl interrupted before fetching half of the items
+    item_graph = far.ItemGraph()
+    item_graph.related_ids = dict(complete_graph.related_ids)
+    item_graph.errors = dict(complete_graph.errors)
+    item_graph.data_errors = dict(complete_graph.data_errors)
+    pending_ids = item_ids[::2]
+    item_graph.discard(pending_ids)
+    item_cache = far.ItemCache(gis_con)
+    item_cache.add_search_results([org.items[item_id] for item_id in item_ids])
+    checkpoint = far.CrawlCheckpoint(
+        os.path.join(tmp_path, "crawl_checkpoint.json.gz"), run_date=1234
+    )
+    checkpoint.save(item_ids, item_graph, item_cache)
+
+    checkpoint = far.CrawlCheckpoint(checkpoint.path)
+    item_cache = far.ItemCache(gis_con)
+    saved_ids, saved_graph = checkpoint.load(item_cache)
+
+    assert checkpoint.run_date == 1234
+    assert saved_ids == item_ids
+    assert saved_graph.related_ids == item_graph.related_ids
+    assert saved_graph.errors == item_graph.errors
+    assert all(item_id in item_cache for item_id in item_graph.related_ids)
+
+    org.requests.clear()
+    resumed_graph = far.crawl_item_graph(
+        gis_con, saved_ids, item_cache, item_graph=saved_graph
+    )
+
+    assert resumed_graph.related_ids == complete_graph.related_ids
+    assert resumed_graph.errors == complete_graph.errors
+    # Only the pending items are fetched
+    assert org.requests["data"] == len(pending_ids)
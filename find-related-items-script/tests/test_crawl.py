@@ -0,0 +1,76 @@
+"""
+Tests of the crawl of the item graph, against a synthetic organization.
+"""
+
+import find_related_AGO_items as far
+from synthetic_portal import ORG_ID, SyntheticOrg, use_synthetic_portal
+
+
+def items_of_type(org: SyntheticOrg, item_type: str) -> list:
+    return [item_id for item_id, item in org.items.items() if item["type"] == item_type]
+
+
+def test_resumed_scoped_crawl_skips_items_no_longer_reachable():
+    org = SyntheticOrg(item_count=50)
+    gis_con = use_synthetic_portal(far, org)
+    story = items_of_type(org, "StoryMap")[0]
+    web_map = items_of_type(org, "Web Map")[0]
+    layer = org.data[web_map]["operationalLayers"][0]["itemId"]
+    # The story stopped embedding anything since the web map was crawled from it
+    org.resources[story] = {}
+    item_graph = far.ItemGraph()
+    item_graph.add(story, set())
+    item_graph.add(web_map, {layer})
+
+    scope = far.TraversalScope(org_id=ORG_ID, max_depth=3)
+    far.crawl_item_graph(
+        gis_con, [story], far.ItemCache(gis_con), item_graph=item_graph, scope=scope
+    )
+
+    assert not item_graph.is_crawled(layer)
+    assert scope.depths == {story: 0}
+
+
+def test_scoped_crawl_stops_at_max_depth():
+    org = SyntheticOrg(item_count=200)
+    gis_con = use_synthetic_portal(far, org)
+    stories = items_of_type(org, "StoryMap")
+
+    scope = far.TraversalScope(org_id=ORG_ID, max_depth=1)
+    item_graph = far.crawl_item_graph(
+        gis_con, stories, far.ItemCache(gis_con), scope=scope
+    )
+
+    assert set(item_graph.related_ids) == set(stories)
+    assert scope.unexpanded and all(
+        scope.depths[item_id] == 1 for item_id in scope.unexpanded
+    )
+
+
+def test_crawled_items_are_listed_without_searching_them_again():
+    orgs = [SyntheticOrg(item_count=200), SyntheticOrg(item_count=200)]
+    story = items_of_type(orgs[0], "StoryMap")[0]
+    scope = far.TraversalScope(org_id=ORG_ID, expand_external=False)
+
+    item_ids = far.crawl_related_item_ids(
+        use_synthetic_portal(far, orgs[0]), [story], scope=scope
+    )
+    items = far.crawl_related_items(
+        use_synthetic_portal(far, orgs[1]),
+        [story],
+        scope=far.TraversalScope(org_id=ORG_ID, expand_external=False),
+    )
+
+    assert [item["id"] for item in items] == item_ids
+    assert all({"isOrgItem", "protected", "created"} <= set(item) for item in items)
+    assert orgs[1].requests == orgs[0].requests
+
+    # Items evicted from a full cache are searched again
+    gis_con = use_synthetic_portal(far, orgs[1])
+    items = far.crawl_related_items(
+        gis_con,
+        [story],
+        scope=far.TraversalScope(org_id=ORG_ID, expand_external=False),
+        item_cache=far.ItemCache(gis_con, max_size=2),
+    )
+    assert [item["id"] for item in items] == item_ids
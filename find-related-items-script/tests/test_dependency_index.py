@@ -0,0 +1,74 @@
+"""
+Tests of the SQLite index of the relationships found by a run, and of its upstream and
+downstream queries.
+"""
+
+import pandas as pd
+
+import find_related_AGO_items as far
+
+STORY = "1" * 32
+WEB_MAP = "2" * 32
+LAYER = "3" * 32
+# Web maps of the organization referencing each other in a cycle
+CYCLE = ["a" * 32, "b" * 32, "c" * 32]
+ITEMS = {
+    STORY: ("StoryMap", "Story"),
+    WEB_MAP: ("Web Map", "Map"),
+    LAYER: ("Feature Service", "Layer"),
+    **{item_id: ("Web Map", f"Map {item_id[0]}") for item_id in CYCLE},
+}
+PATHS = [
+    [STORY, WEB_MAP],
+    [STORY, WEB_MAP, LAYER],
+    [CYCLE[0], CYCLE[1]],
+    [CYCLE[1], CYCLE[2]],
+    [CYCLE[2], CYCLE[0]],
+]
+
+
+def related_items_rows() -> pd.DataFrame:
+    # One row per relationship path, as written to OUTPUT_FILE
+    rows = []
+    for path in PATHS:
+        org_type, org_title = ITEMS[path[0]]
+        item_type, item_title = ITEMS[path[-1]]
+        rows.append(
+            [path[0], org_type, org_title, "public", "owner"]
+            + [path[-1], item_type, item_title, "public", "owner", "org", path, "No"]
+        )
+    return pd.DataFrame(rows, columns=far.RELATED_ITEMS_COLUMNS)
+
+
+def item_ids(items: list) -> list:
+    return [item["item_id"] for item in items]
+
+
+def test_upstream_and_downstream_follow_every_relationship(tmp_path):
+    index = far.DependencyIndex.build(
+        str(tmp_path / "dependency_index.sqlite"), related_items_rows()
+    )
+
+    assert item_ids(index.upstream(LAYER)) == [STORY, WEB_MAP]
+    assert index.upstream(LAYER)[0]["org_item"]
+    assert item_ids(index.downstream(STORY)) == [LAYER, WEB_MAP]
+    assert index.upstream(STORY) == []
+    assert index.downstream(LAYER) == []
+    assert index.paths_to(LAYER) == [[STORY, WEB_MAP, LAYER]]
+    assert index.get(WEB_MAP)["title"] == "Map"
+    assert index.get("f" * 32) is None
+    index.close()
+
+
+def test_cycles_are_followed_once(tmp_path):
+    path = str(tmp_path / "dependency_index.sqlite")
+    far.DependencyIndex.build(path, related_items_rows()).close()
+    # The index is read back by the --upstream and --downstream queries of a later run
+    index = far.DependencyIndex(path)
+
+    for item_id in CYCLE:
+        # Each item of the cycle depends on the others, and so on itself
+        assert item_ids(index.upstream(item_id)) == CYCLE
+        assert item_ids(index.downstream(item_id)) == CYCLE
+    assert index.paths_to(CYCLE[0]) == [[CYCLE[2], CYCLE[0]]]
+    index.close()
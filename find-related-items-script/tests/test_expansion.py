@@ -0,0 +1,66 @@
+"""
+Tests of the expansion of paused items, on the related items rows of a synthetic
+organization.
+"""
+
+import find_related_AGO_items as far
+from synthetic_portal import SyntheticOrg, use_synthetic_portal
+
+
+def write_related_items(org: SyntheticOrg, path: str):
+    # Records the related items rows of the organization to a file, as the script does
+    # before expanding them
+    gis_con = use_synthetic_portal(far, org)
+    item_cache = far.ItemCache(gis_con)
+    item_ids = sorted(far.get_all_content_items_in_org(gis_con, item_cache=item_cache))
+    item_graph = far.crawl_item_graph(gis_con, item_ids, item_cache)
+    related_items_rows = far.RowWriter(path, far.RELATED_ITEMS_COLUMNS)
+    missed_items_rows = far.RowAccumulator(far.MISSED_ITEMS_COLUMNS)
+    relations_in_process = set()
+    row_index = set()
+    for item_id in item_ids:
+        far.get_related_items_for_id(
+            gis_con,
+            item_id,
+            item_graph,
+            related_items_rows,
+            missed_items_rows,
+            set(item_ids),
+            relations_in_process=relations_in_process,
+            item_cache=item_cache,
+            row_index=row_index,
+        )
+    related_items_rows.close()
+
+
+def expand(related_items_file: str, expanded_file: str, max_workers: int) -> str:
+    expanded_items_rows = far.RowWriter(expanded_file, far.RELATED_ITEMS_COLUMNS)
+    far.write_expanded_related_items(
+        far.read_rows(related_items_file, path_table=expanded_items_rows.path_table),
+        expanded_items_rows,
+        max_workers,
+    )
+    expanded_items_rows.close()
+    with open(expanded_file, encoding="utf-8") as file:
+        return file.read()
+
+
+def test_workers_write_the_same_file_as_one_process(tmp_path, monkeypatch):
+    org = SyntheticOrg(item_count=400)
+    # Titles written on several lines and quoted, whose rows are numbered by the writer
+    web_maps = [item for item in org.items.values() if item["type"] == "Web Map"]
+    web_maps[0]["title"] = "Web map,\n0,"
+    web_maps[-1]["title"] = 'Web "map"\r\n1,'
+    related_items_file = str(tmp_path / "related_items.csv")
+    write_related_items(org, related_items_file)
+    monkeypatch.setattr(far, "POSTPROCESS_MIN_ROWS", 0)
+
+    expanded = expand(related_items_file, str(tmp_path / "expanded_1.csv"), 1)
+
+    assert "NA" in expanded
+    assert expand(related_items_file, str(tmp_path / "expanded_3.csv"), 3) == expanded
+    rows = far.read_rows(str(tmp_path / "expanded_3.csv"))
+    assert rows.index.tolist() == [str(number) for number in range(len(rows))]
+    assert {web_maps[0]["title"], web_maps[-1]["title"]} <= set(
+        rows["Related Item Title"]
+    )
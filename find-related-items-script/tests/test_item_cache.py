@@ -0,0 +1,31 @@
+"""
+Tests of the item metadata cache, against a synthetic organization.
+"""
+
+import find_related_AGO_items as far
+from synthetic_portal import SyntheticOrg, use_synthetic_portal
+
+
+def test_refresh_finds_modified_and_deleted_items():
+    org = SyntheticOrg(item_count=300)
+    gis_con = use_synthetic_portal(far, org)
+    item_cache = far.ItemCache(gis_con)
+    item_ids = sorted(org.items)
+    for item_id in item_ids:
+        item_cache.add(org.items[item_id])
+    modified_id, deleted_id = item_ids[:2]
+    org.items[modified_id] = dict(
+        org.items[modified_id], modified=org.items[modified_id]["modified"] + 1
+    )
+    del org.items[deleted_id]
+    org.requests.clear()
+
+    changed_ids = item_cache.refresh(item_ids)
+
+    assert changed_ids == {modified_id, deleted_id}
+    assert org.requests == {"search": -(-len(item_ids) // far.ITEM_SEARCH_BATCH_SIZE)}
+    assert (
+        item_cache.get_record(modified_id)["modified"]
+        == org.items[modified_id]["modified"]
+    )
+    assert deleted_id not in item_cache
@@ -0,0 +1,79 @@
+"""
+Tests of the SQLite store of item data and missing items kept between runs, against a
+synthetic organization.
+"""
+
+import find_related_AGO_items as far
+from synthetic_portal import SyntheticOrg, use_synthetic_portal
+
+
+def test_stored_data_is_only_served_for_the_same_modified_date(tmp_path):
+    path = str(tmp_path / "item_data_store.sqlite")
+    data_store = far.ItemDataStore(path)
+    item_data = ({"operationalLayers": [{"itemId": "b" * 32}]}, None)
+    data_store.put("a" * 32, 1000, item_data)
+    # Data that is not JSON is not stored
+    data_store.put("c" * 32, 1000, ({"value": object()}, None))
+    data_store.close()
+
+    data_store = far.ItemDataStore(path)
+    assert data_store.get("a" * 32, 1000) == item_data
+    assert data_store.get("a" * 32, 2000) is None
+    assert data_store.get("c" * 32, 1000) is None
+    data_store.put("a" * 32, 2000, ({}, None))
+    assert data_store.get("a" * 32, 2000) == ({}, None)
+    assert data_store.get("a" * 32, 1000) is None
+    assert (data_store.hits, data_store.misses) == (2, 3)
+    data_store.close()
+
+
+def test_missing_items_are_forgotten_past_their_age(tmp_path, monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(far.time, "time", lambda: now[0])
+    data_store = far.ItemDataStore(str(tmp_path / "item_data_store.sqlite"))
+    data_store.put_missing({"a" * 32: "Item does not exist. (Error Code: 404)"})
+    now[0] += 50
+    # Items already stored keep the date they were first checked
+    data_store.put_missing(
+        {
+            "a" * 32: "Item does not exist. (Error Code: 404)",
+            "b" * 32: "You do not have permissions. (Error Code: 403)",
+        }
+    )
+
+    now[0] += 30
+    assert data_store.get_missing(max_age=60) == {
+        "b" * 32: "You do not have permissions. (Error Code: 403)"
+    }
+    now[0] += 60
+    assert data_store.get_missing(max_age=60) == {}
+    data_store.close()
+
+
+def test_crawl_only_fetches_the_data_of_modified_items(tmp_path):
+    org = SyntheticOrg(item_count=200)
+    gis_con = use_synthetic_portal(far, org)
+    data_store = far.ItemDataStore(str(tmp_path / "item_data_store.sqlite"))
+    item_ids = sorted(org.items)
+    far.crawl_item_graph(gis_con, item_ids, far.ItemCache(gis_con), data_store)
+    web_map = next(
+        item_id for item_id in item_ids if org.items[item_id]["type"] == "Web Map"
+    )
+    layer = next(
+        item_id
+        for item_id in item_ids
+        if org.items[item_id]["type"] == "Feature Service"
+        and item_id not in str(org.data[web_map])
+    )
+    org.items[web_map]["modified"] += 1
+    org.data[web_map] = {"operationalLayers": [{"itemId": layer}]}
+    org.requests.clear()
+
+    item_graph = far.crawl_item_graph(
+        gis_con, item_ids, far.ItemCache(gis_con), data_store
+    )
+
+    assert org.requests.get("data", 0) == 1
+    assert org.requests.get("resources", 0) == 0
+    assert item_graph.related_ids[web_map] == [layer]
+    data_store.close()
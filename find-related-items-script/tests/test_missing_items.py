@@ -0,0 +1,88 @@
+"""
+Tests of the classification of request errors and of the negative cache of missing
+items, against a synthetic organization.
+"""
+
+import os
+
+import pytest
+
+import find_related_AGO_items as far
+from synthetic_portal import SyntheticOrg, use_synthetic_portal
+
+
+def portal_error(status: int) -> Exception:
+    # Errors of the ArcGIS API for Python only carry their status in the message
+    return Exception(f"Request failed. (Error Code: {status})")
+
+
+@pytest.mark.parametrize(
+    "status, retryable, missing",
+    [
+        (400, False, True),
+        (403, False, True),
+        (404, False, True),
+        (401, False, False),
+        (498, False, False),
+        (499, False, False),
+        (429, True, False),
+        (503, True, False),
+    ],
+)
+def test_errors_are_classified_by_status(status, retryable, missing):
+    assert far.is_retryable_error(portal_error(status)) == retryable
+    assert far.is_missing_item_error(portal_error(status)) == missing
+
+
+def test_token_errors_are_not_retried(monkeypatch):
+    monkeypatch.setattr(far.time, "sleep", lambda seconds: None)
+    calls = []
+
+    def expired_token():
+        calls.append(1)
+        raise portal_error(498)
+
+    with pytest.raises(far.AuthenticationError):
+        far.RequestScheduler().call("item", expired_token)
+    assert len(calls) == 1
+
+
+def test_missing_items_are_requested_once_and_stored(tmp_path):
+    org = SyntheticOrg(item_count=10)
+    gis_con = use_synthetic_portal(far, org)
+    item_cache = far.ItemCache(gis_con)
+    missing_id = "f" * 32
+
+    for _ in range(2):
+        with pytest.raises(Exception, match="Error Code: 400"):
+            item_cache.get_item(missing_id)
+
+    assert org.requests == {"item": 1}
+    assert item_cache.missing_hits == 1
+    data_store = far.ItemDataStore(os.path.join(tmp_path, "item_data.sqlite"))
+    data_store.put_missing(item_cache.missing)
+    assert data_store.get_missing() == {missing_id: item_cache.missing[missing_id]}
+
+
+def test_expired_token_stops_the_crawl_without_marking_items_missing(
+    tmp_path, monkeypatch
+):
+    org = SyntheticOrg(item_count=50)
+    gis_con = use_synthetic_portal(far, org)
+    stories = [
+        item_id for item_id, item in org.items.items() if item["type"] == "StoryMap"
+    ]
+
+    def expired_token(endpoint: str):
+        raise Exception("Invalid token. (Error Code: 498)")
+
+    monkeypatch.setattr(org, "answer", expired_token)
+    item_cache = far.ItemCache(gis_con)
+    checkpoint = far.CrawlCheckpoint(os.path.join(tmp_path, "checkpoint.json.gz"))
+
+    with pytest.raises(far.AuthenticationError):
+        far.crawl_item_graph(gis_con, stories, item_cache, checkpoint=checkpoint)
+
+    assert item_cache.missing == {}
+    # The progress is saved to continue with --resume once signed in again
+    assert os.path.exists(checkpoint.path)
@@ -0,0 +1,65 @@
+"""
+Tests of the enumeration of the organization items in created date buckets, against a
+synthetic organization.
+"""
+
+import find_related_AGO_items as far
+from synthetic_portal import ORG_ID, SyntheticOrg, use_synthetic_portal
+
+
+def record_page_searches(org: SyntheticOrg, monkeypatch) -> list:
+    # Records the total number of matches of each page search, which the script sends
+    # sorted by created date
+    pages = []
+    search = org.search
+
+    def recording_search(query, start, num, sort_field=None, sort_order="asc"):
+        total, results = search(query, start, num, sort_field, sort_order)
+        if sort_field is not None:
+            pages.append((start, total))
+        return total, results
+
+    monkeypatch.setattr(org, "search", recording_search)
+    return pages
+
+
+def org_item_ids(org: SyntheticOrg) -> set:
+    return {item_id for item_id, item in org.items.items() if item["orgId"] == ORG_ID}
+
+
+def test_buckets_past_the_search_limit_are_split(monkeypatch):
+    monkeypatch.setattr(far, "SEARCH_RESULT_LIMIT", 50)
+    monkeypatch.setattr(far, "SEARCH_PAGE_SIZE", 25)
+    org = SyntheticOrg(item_count=400)
+    gis_con = use_synthetic_portal(far, org)
+    pages = record_page_searches(org, monkeypatch)
+    item_cache = far.ItemCache(gis_con)
+
+    found_ids = far.get_all_content_items_in_org(
+        gis_con, "*", max_workers=2, item_cache=item_cache
+    )
+
+    assert found_ids == org_item_ids(org)
+    assert len(org_item_ids(org)) > 50
+    assert pages and all(total <= 50 and start < total for start, total in pages)
+    assert all(item_id in item_cache for item_id in found_ids)
+
+
+def test_items_created_at_the_same_time_past_the_search_limit(monkeypatch, capsys):
+    monkeypatch.setattr(far, "SEARCH_RESULT_LIMIT", 50)
+    monkeypatch.setattr(far, "SEARCH_PAGE_SIZE", 25)
+    org = SyntheticOrg(item_count=200)
+    item_ids = sorted(org_item_ids(org))
+    created = org.items[item_ids[0]]["created"]
+    for item_id in item_ids[:60]:
+        org.items[item_id]["created"] = created
+    gis_con = use_synthetic_portal(far, org)
+    pages = record_page_searches(org, monkeypatch)
+
+    found_ids = far.get_all_content_items_in_org(gis_con, "*", max_workers=2)
+
+    # The bucket of a single date cannot be split, only its first items are found
+    assert len(found_ids & set(item_ids[:60])) == 50
+    assert found_ids - set(item_ids[:60]) == set(item_ids[60:])
+    assert all(start < 50 for start, total in pages)
+    assert f"Warning: 60 items were created at {created}" in capsys.readouterr().out
@@ -0,0 +1,35 @@
+"""
+Tests of the adaptive concurrency of the request scheduler, fed simulated response
+latencies.
+"""
+
+import random
+
+import find_related_AGO_items as far
+
+
+def answer(scheduler: far.RequestScheduler, latencies):
+    for seconds in latencies:
+        scheduler.in_flight += 1
+        scheduler._finish("data", seconds, None)
+
+
+def test_slow_responses_mixed_with_fast_ones_keep_the_limit():
+    rnd = random.Random(0)
+    for slow_share in [0.1, 0.2, 0.3]:
+        scheduler = far.RequestScheduler(max_concurrency=16, adaptive=True)
+        # Small JSON answered in 0.1 second, and multi-MB story drafts ten times slower
+        answer(
+            scheduler,
+            (0.1 * (10 if rnd.random() < slow_share else 1) for _ in range(5000)),
+        )
+        assert scheduler.decreases == 0
+        assert scheduler.limit == 16
+
+
+def test_slowdown_of_every_response_decreases_the_limit():
+    scheduler = far.RequestScheduler(max_concurrency=16, adaptive=True)
+    answer(scheduler, [0.1] * 100)
+    answer(scheduler, [1.0] * 40)
+    assert scheduler.decreases >= 1
+    assert scheduler.limit < 16
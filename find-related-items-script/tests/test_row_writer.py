@@ -0,0 +1,53 @@
+"""
+Tests of the output files written by RowWriter and read back by read_rows.
+"""
+
+import pytest
+
+import find_related_AGO_items as far
+
+COLUMNS = ["Organization Item", "Org item Title", "Relationship Path"]
+ROWS = [
+    ["a" * 32, "Parks' map", ["a" * 32]],
+    ["a" * 32, 'The "old" map, v2', ["a" * 32, "b" * 32]],
+    ["c" * 32, "Two\nlines, 'quoted'", ["c" * 32, "it's", 'say "hi"', "d" * 32]],
+    ["c" * 32, "NA", []],
+]
+
+
+@pytest.mark.parametrize("output_format", ["csv", "parquet"])
+def test_rows_read_back_as_written(tmp_path, output_format):
+    if output_format == "parquet":
+        pytest.importorskip("pyarrow")
+    path = str(tmp_path / f"rows.{output_format}")
+    rows = far.RowWriter(path, COLUMNS, output_format=output_format, batch_size=3)
+    for row in ROWS:
+        rows.append(row)
+    rows.close()
+    assert rows.rows_written == len(ROWS)
+
+    read = far.read_rows(path, output_format)
+    assert read.columns.tolist() == COLUMNS
+    assert read.values.tolist() == ROWS
+
+    path_table = far.PathTable()
+    read = far.read_rows(path, output_format, path_table=path_table)
+    assert [path_table.materialize(path) for path in read["Relationship Path"]] == [
+        row[2] for row in ROWS
+    ]
+
+
+def test_rows_with_a_unique_value_are_written_once(tmp_path):
+    path = str(tmp_path / "missed_items.csv")
+    rows = far.RowWriter(path, far.MISSED_ITEMS_COLUMNS, unique_column="itemId")
+    rows.append(["a" * 32, None, None, "Item does not exist"])
+    rows.append(["b" * 32, "Map", "owner", "Data could not be read"])
+    rows.append(["a" * 32, None, None, "Item does not exist"])
+    rows.close()
+
+    with open(path, encoding="utf-8") as file:
+        lines = file.read().splitlines()
+    assert lines[1:] == [
+        f"0,{'a' * 32},,,Item does not exist",
+        f"1,{'b' * 32},Map,owner,Data could not be read",
+    ]
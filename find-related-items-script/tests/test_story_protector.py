@@ -0,0 +1,178 @@
+"""
+Tests of the bulk update helpers of the story protector notebook, run against a stand-in
+GIS.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+
+import pytest
+
+import find_related_AGO_items as far
+
+NOTEBOOK_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "..",
+    "storymaps-helper-notebooks",
+    "story-protector",
+    "story-delete-protector.ipynb",
+)
+
+
+class FakeItem(dict):
+    """
+    Stand-in for arcgis.gis.Item, protected and shared through a FakeGIS.
+    """
+
+    def __init__(self, gis, itemdict: dict):
+        super().__init__(itemdict)
+        self._gis = gis
+
+    def protect(self, enable: bool = True):
+        gis = self._gis
+        gis.count("protect", self["id"])
+        with gis.lock:
+            if gis.flaky.get(self["id"], 0) > 0:
+                gis.flaky[self["id"]] -= 1
+                raise Exception("Service unavailable. (Error Code: 503)")
+        if self["id"] in gis.forbidden:
+            raise Exception(
+                "You do not have permissions to access this resource. (Error Code: 403)"
+            )
+        if self["id"] in gis.refused:
+            return {"success": False}
+        gis.items[self["id"]]["protected"] = enable
+        return {"success": True}
+
+    def update(self, item_properties: dict):
+        self._gis.count("update", self["id"])
+        self._gis.items[self["id"]].update(item_properties)
+        return True
+
+
+class FakeContent:
+    def __init__(self, gis):
+        self._gis = gis
+
+    def get(self, item_id: str):
+        self._gis.count("get", item_id)
+        item = self._gis.items.get(item_id)
+        return FakeItem(self._gis, item) if item is not None else None
+
+    def advanced_search(self, query: str, max_items: int = 100, as_dict: bool = False):
+        self._gis.count("search")
+        item_ids = re.findall(r"[0-9a-f]{32}", query)
+        return {
+            "results": [
+                dict(self._gis.items[i]) for i in item_ids if i in self._gis.items
+            ]
+        }
+
+
+class FakeGIS:
+    """
+    Stand-in for arcgis.gis.GIS holding org items, some of which fail to be protected:
+    "flaky" items fail with a server error a number of times, "forbidden" items with a
+    403 and "refused" items answer success False.
+
+    Attributes:
+        items (Dict[str, dict]): Item JSON keyed by item ID.
+        calls (Dict[str, int]): Number of calls by method, and by method and item ID.
+    """
+
+    def __init__(self, item_count: int, flaky: dict, forbidden: set, refused: set):
+        self.items = {
+            f"{index:032x}": {
+                "id": f"{index:032x}",
+                "owner": "owner",
+                "created": 0,
+                "isOrgItem": True,
+                "modified": 0,
+                "title": f"Item {index}",
+                "type": "Web Map",
+                "protected": False,
+                "access": "private",
+            }
+            for index in range(item_count)
+        }
+        self.flaky = dict(flaky)
+        self.forbidden = forbidden
+        self.refused = refused
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.content = FakeContent(self)
+
+    def count(self, method: str, item_id: str = None):
+        with self.lock:
+            for key in [method, (method, item_id)]:
+                self.calls[key] = self.calls.get(key, 0) + 1
+
+
+@pytest.fixture
+def notebook(monkeypatch):
+    # Runs the import and bulk update helpers cells, with the find-related-items script
+    # as the item crawler
+    with open(NOTEBOOK_FILE, encoding="utf-8") as notebook_file:
+        cells = ["".join(cell["source"]) for cell in json.load(notebook_file)["cells"]]
+    namespace = {}
+    exec(
+        next(cell for cell in cells if "from arcgis.gis import GIS" in cell), namespace
+    )
+    namespace["item_crawler"] = far
+    exec(next(cell for cell in cells if "def bulk_update_items" in cell), namespace)
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+    return namespace
+
+
+def test_bulk_update_retries_temporary_errors_only(notebook):
+    flaky_id, forbidden_id, refused_id = f"{1:032x}", f"{2:032x}", f"{3:032x}"
+    missing_id = "f" * 32
+    gis = FakeGIS(
+        250, flaky={flaky_id: 2}, forbidden={forbidden_id}, refused={refused_id}
+    )
+
+    results_df = notebook["bulk_update_items"](
+        gis,
+        list(gis.items) + [missing_id],
+        True,
+        True,
+        "public",
+        max_workers=8,
+        attempts=3,
+    )
+
+    failed_df = results_df.loc[results_df["error"].notna()]
+    assert failed_df["id"].tolist() == [forbidden_id, refused_id, missing_id]
+    assert gis.calls[("protect", flaky_id)] == 3
+    assert gis.calls[("protect", forbidden_id)] == 1
+    assert gis.calls[("protect", refused_id)] == 1
+    assert gis.calls[("get", missing_id)] == 1
+    assert gis.calls["update"] == 248
+
+
+def test_verify_looks_up_items_in_batches(notebook):
+    refused_id = f"{3:032x}"
+    gis = FakeGIS(250, flaky={}, forbidden=set(), refused={refused_id})
+    item_ids = list(gis.items) + ["f" * 32]
+    results_df = notebook["bulk_update_items"](gis, item_ids, True, True, "public")
+
+    verified_df = notebook["verify_item_updates"](gis, results_df, True, True, "public")
+
+    assert gis.calls["search"] == 3
+    assert verified_df["id"].tolist() == item_ids
+    assert verified_df.loc[~verified_df["success"], "id"].tolist() == [
+        refused_id,
+        "f" * 32,
+    ]
+
+
+def test_notebook_code_cells_compile():
+    with open(NOTEBOOK_FILE, encoding="utf-8") as notebook_file:
+        cells = json.load(notebook_file)["cells"]
+    for index, cell in enumerate(cells):
+        if cell["cell_type"] == "code":
+            compile("".join(cell["source"]), f"cell {index}", "exec")